@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from notes.sharding import ShardedModelAdminMixin
+from .models import Blob, NoteAttachment
+
+
+@admin.register(Blob)
+class BlobAdmin(ShardedModelAdminMixin, admin.ModelAdmin):
+    list_display = ("sha256", "size", "created")
+
+
+@admin.register(NoteAttachment)
+class NoteAttachmentAdmin(ShardedModelAdminMixin, admin.ModelAdmin):
+    list_display = ("filename", "content_type", "note", "blob", "created")
+    list_select_related = ("note",)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class AttachmentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'attachments'
+
+    # noinspection PyUnresolvedReferences
+    def ready(self):
+        from attachments import signals
@@ -0,0 +1,98 @@
+import os
+import re
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from attachments.models import Blob
+from attachments.storage import LOCK_ROOT, STORAGE_ROOT, blob_lock
+from notes.sharding import note_databases
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class Command(BaseCommand):
+    help = "Delete stored attachment files that no note references anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=60,
+            help="Leave blobs younger than this alone (uploads in flight).",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, grace_minutes, dry_run, **options):
+        cutoff = timezone.now() - timedelta(minutes=grace_minutes)
+        unreferenced_count = 0
+        known = set()
+        # With sharding, a file may be shared by blobs on several shards
+        for alias in note_databases():
+            blobs = Blob.objects.using(alias)
+            unreferenced = set(
+                blobs.filter(references__isnull=True, created__lt=cutoff).values_list(
+                    "sha256", flat=True
+                )
+            )
+            if dry_run:
+                unreferenced_count += len(unreferenced)
+            else:
+                for sha256 in unreferenced:
+                    # Re-checked under the lock: an upload may have just
+                    # attached this blob again
+                    with blob_lock(sha256):
+                        deleted, _ = blobs.filter(
+                            sha256=sha256, references__isnull=True
+                        ).delete()
+                    unreferenced_count += deleted
+            known |= set(blobs.values_list("sha256", flat=True)) - unreferenced
+
+        # Files no blob row refers to: removed rows and interrupted uploads
+        cutoff_timestamp = time.time() - grace_minutes * 60
+        reclaimed = 0
+        orphans = 0
+        for directory, dirnames, filenames in os.walk(STORAGE_ROOT):
+            if Path(directory) == STORAGE_ROOT and LOCK_ROOT.name in dirnames:
+                dirnames.remove(LOCK_ROOT.name)
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if filename in known or os.path.getmtime(path) > cutoff_timestamp:
+                    continue
+                if not SHA256_RE.match(filename):
+                    # An interrupted upload's temporary file
+                    size = self._remove(path, dry_run)
+                elif dry_run:
+                    size = os.path.getsize(path)
+                else:
+                    with blob_lock(filename):
+                        if self._has_blob(filename):
+                            continue
+                        size = self._remove(path, dry_run)
+                orphans += 1
+                reclaimed += size
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would remove' if dry_run else 'Removed'} {unreferenced_count} "
+                f"unreferenced blobs and {orphans} files, "
+                f"{reclaimed} bytes."
+            )
+        )
+
+    @staticmethod
+    def _has_blob(sha256):
+        return any(
+            Blob.objects.using(alias).filter(sha256=sha256).exists()
+            for alias in note_databases()
+        )
+
+    @staticmethod
+    def _remove(path, dry_run):
+        size = os.path.getsize(path)
+        if not dry_run:
+            os.unlink(path)
+        return size
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+def copy_blob_content_types(apps, schema_editor):
+    NoteAttachment = apps.get_model("attachments", "NoteAttachment")
+    db_alias = schema_editor.connection.alias
+    # Deduplicated uploads kept the first uploader's type; that is the best
+    # guess left for every reference
+    batch = []
+    for attachment in (
+        NoteAttachment.objects.using(db_alias)
+        .select_related("blob")
+        .only("id", "blob__content_type")
+        .order_by("id")
+        .iterator(chunk_size=500)
+    ):
+        attachment.content_type = attachment.blob.content_type
+        batch.append(attachment)
+        if len(batch) >= 500:
+            NoteAttachment.objects.using(db_alias).bulk_update(batch, ["content_type"])
+            batch = []
+    NoteAttachment.objects.using(db_alias).bulk_update(batch, ["content_type"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attachments", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="noteattachment",
+            name="content_type",
+            field=models.CharField(default="application/octet-stream", max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_blob_content_types, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="blob",
+            name="content_type",
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import models
+
+from notes.models import Note
+
+
+class Blob(models.Model):
+    """
+    A stored file, addressed by the sha256 of its content. Identical uploads
+    share a single Blob (and a single file on disk).
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class NoteAttachment(models.Model):
+    """
+    A reference from a Note to a Blob, under the file name and content type
+    it was uploaded as. Those belong to each upload, not to the shared Blob.
+    """
+
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name="attachments")
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name="references")
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
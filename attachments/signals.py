@@ -0,0 +1,13 @@
+from datetime import timedelta
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from attachments.models import NoteAttachment
+from backgroundjobs.registry import enqueue_on_commit
+
+
+@receiver(post_delete, sender=NoteAttachment)
+def attachment_deleted_recv(sender, instance, **kwargs):
+    # One pending collection covers any number of deletions
+    enqueue_on_commit("attachments.collect_garbage", delay=timedelta(minutes=60))
@@ -0,0 +1,160 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+ATTACHMENT_SETTINGS = getattr(settings, "ATTACHMENT_SETTINGS", {})
+
+STORAGE_ROOT = Path(
+    ATTACHMENT_SETTINGS.get("STORAGE_ROOT", settings.BASE_DIR / "attachments_store")
+)
+# Lock files serializing uploads and garbage collection per digest prefix
+LOCK_ROOT = STORAGE_ROOT / "locks"
+MAX_ATTACHMENT_SIZE = ATTACHMENT_SETTINGS.get("MAX_SIZE", 50 * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Types a browser renders without running scripts in the app's origin. Any
+# other upload (text/html, image/svg+xml, ...) is served as a download.
+INLINE_CONTENT_TYPES = {
+    "application/pdf",
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+}
+
+
+def blob_path(sha256):
+    """
+    Blobs are fanned out over two directory levels (ab/cd/abcd...) to keep
+    directories small.
+    """
+    return STORAGE_ROOT / sha256[:2] / sha256[2:4] / sha256
+
+
+@contextlib.contextmanager
+def blob_lock(sha256):
+    """
+    Hold the lock an upload takes while it stores a blob's file and rows, and
+    the garbage collector takes while it removes them. Digests sharing a
+    two-character prefix share one of 256 lock files, so none is ever
+    deleted.
+    """
+    LOCK_ROOT.mkdir(parents=True, exist_ok=True)
+    with open(LOCK_ROOT / sha256[:2], "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def store_upload(uploaded_file):
+    """
+    Copy an uploaded file into the store chunk by chunk while hashing it, and
+    yield (sha256, size) holding the blob's lock, so the garbage collector
+    cannot remove the file before the caller has recorded the upload.
+
+    When a file with the same content already exists the copy is discarded,
+    so every distinct content is stored once.
+    """
+    STORAGE_ROOT.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=STORAGE_ROOT, delete=False) as tmp:
+        try:
+            for chunk in uploaded_file.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+    sha256 = digest.hexdigest()
+    target = blob_path(sha256)
+    try:
+        with blob_lock(sha256):
+            if target.exists():
+                os.unlink(tmp.name)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                # Atomic, so readers never see partial files
+                os.replace(tmp.name, target)
+            yield sha256, size
+    finally:
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+
+
+def _iter_file_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def blob_response(request, blob, filename, content_type):
+    """
+    Serve a blob from disk without loading it into memory, with a strong
+    ETag (the content hash), immutable caching and single-range support.
+    Only types in INLINE_CONTENT_TYPES are shown inline.
+    """
+    inline = content_type in INLINE_CONTENT_TYPES
+    etag = f'"{blob.sha256}"'
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponse(status=304)
+    else:
+        path = blob_path(blob.sha256)
+        match = RANGE_RE.match(request.headers.get("Range", "").strip())
+        if match and (match[1] or match[2]):
+            total = blob.size
+            if match[1]:
+                start = int(match[1])
+                end = min(int(match[2]), total - 1) if match[2] else total - 1
+            else:
+                start, end = max(total - int(match[2]), 0), total - 1
+            if start >= total or start > end:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{total}"
+                return response
+            response = StreamingHttpResponse(
+                _iter_file_range(path, start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Length"] = str(end - start + 1)
+            response["Content-Range"] = f"bytes {start}-{end}/{total}"
+            response["Content-Disposition"] = content_disposition_header(
+                not inline, filename
+            )
+        else:
+            response = FileResponse(
+                open(path, "rb"),
+                as_attachment=not inline,
+                filename=filename,
+                content_type=content_type,
+            )
+        response["Accept-Ranges"] = "bytes"
+        # Browsers must not guess a renderable type for a download either
+        response["X-Content-Type-Options"] = "nosniff"
+
+    response["ETag"] = etag
+    # Private: attachments are only served to the owner of a referencing note
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
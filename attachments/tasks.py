@@ -0,0 +1,8 @@
+from django.core.management import call_command
+
+from backgroundjobs.registry import task
+
+
+@task("attachments.collect_garbage")
+def collect_garbage(grace_minutes=60):
+    call_command("collect_attachment_garbage", grace_minutes=grace_minutes)
@@ -0,0 +1,162 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from notes.models import Note
+from notes.sharding import shard_for_user, use_shard
+from . import storage
+from .management.commands import collect_attachment_garbage
+from .models import Blob, NoteAttachment
+
+User = get_user_model()
+
+
+class AttachmentTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("owner", password="x")
+        self.client.force_login(self.user)
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.note = Note.objects.create(user=self.user, title="Note", content="")
+
+        # Every test gets an empty store
+        root = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        for module in (storage, collect_attachment_garbage):
+            self.enterContext(mock.patch.object(module, "STORAGE_ROOT", root))
+            self.enterContext(mock.patch.object(module, "LOCK_ROOT", root / "locks"))
+
+    def upload(self, content, content_type, note=None, filename="file"):
+        response = self.client.post(
+            reverse("attachments_api:note_attachments", args=[(note or self.note).pk]),
+            {"file": SimpleUploadedFile(filename, content, content_type)},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["result"]
+
+    def download(self, sha256, **headers):
+        return self.client.get(reverse("attachments:file", args=[sha256]), **headers)
+
+    def test_identical_uploads_share_one_blob(self):
+        other_note = Note.objects.create(user=self.user, title="Other", content="")
+        text = self.upload(b"same bytes", "text/plain", filename="a.txt")
+        image = self.upload(b"same bytes", "image/png", note=other_note)
+
+        self.assertEqual(text["sha256"], image["sha256"])
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(NoteAttachment.objects.count(), 2)
+        self.assertTrue(storage.blob_path(text["sha256"]).exists())
+
+        # Each upload keeps its own type
+        response = self.client.get(
+            reverse("attachments_api:note_attachments", args=[self.note.pk])
+        )
+        (listed,) = response.json()["result"]["attachments"]
+        self.assertEqual(listed["content_type"], "text/plain")
+        self.assertEqual(listed["filename"], "a.txt")
+        self.assertEqual(image["content_type"], "image/png")
+
+    def test_only_allowed_types_render_inline(self):
+        html = self.upload(b"<script>alert(1)</script>", "text/html", filename="x.html")
+        response = self.download(html["sha256"])
+        self.assertEqual(response["Content-Type"], "text/html")
+        self.assertTrue(response["Content-Disposition"].startswith("attachment;"))
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+
+        png = self.upload(b"\x89PNG not really", "image/png", filename="x.png")
+        response = self.download(png["sha256"])
+        self.assertTrue(response["Content-Disposition"].startswith("inline;"))
+
+    def test_ranges(self):
+        uploaded = self.upload(b"0123456789", "text/html")
+
+        response = self.download(uploaded["sha256"], HTTP_RANGE="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(response["Content-Length"], "3")
+        self.assertTrue(response["Content-Disposition"].startswith("attachment;"))
+
+        response = self.download(uploaded["sha256"], HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+
+        response = self.download(uploaded["sha256"], HTTP_RANGE="bytes=10-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_etag(self):
+        uploaded = self.upload(b"content", "image/png")
+        response = self.download(uploaded["sha256"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"content")
+        etag = response["ETag"]
+        self.assertEqual(etag, f'"{uploaded["sha256"]}"')
+
+        response = self.download(uploaded["sha256"], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_other_users_cannot_download(self):
+        uploaded = self.upload(b"private", "image/png")
+        other = User.objects.create_user("other", password="x")
+        self.client.force_login(other)
+        self.assertEqual(self.download(uploaded["sha256"]).status_code, 404)
+
+    def orphan(self, content):
+        uploaded = self.upload(content, "image/png")
+        NoteAttachment.objects.get(pk=uploaded["attachment_id"]).delete()
+        created = timezone.now() - timedelta(hours=2)
+        Blob.objects.filter(pk=uploaded["sha256"]).update(created=created)
+        timestamp = created.timestamp()
+        os.utime(storage.blob_path(uploaded["sha256"]), (timestamp, timestamp))
+        return uploaded["sha256"]
+
+    def test_collect_garbage(self):
+        sha256 = self.orphan(b"unreferenced")
+        young = self.upload(b"young", "image/png")
+        NoteAttachment.objects.get(pk=young["attachment_id"]).delete()
+
+        call_command("collect_attachment_garbage", stdout=mock.Mock())
+
+        self.assertFalse(Blob.objects.filter(pk=sha256).exists())
+        self.assertFalse(storage.blob_path(sha256).exists())
+        # Inside the grace period: it may belong to an upload in flight
+        self.assertTrue(Blob.objects.filter(pk=young["sha256"]).exists())
+        self.assertTrue(storage.blob_path(young["sha256"]).exists())
+
+    def test_collect_garbage_rechecks_under_the_lock(self):
+        sha256 = self.orphan(b"reattached")
+        blob_lock = storage.blob_lock
+
+        @contextmanager
+        def reattaching_lock(digest):
+            # An upload of the same content finished while the collector
+            # waited for the lock
+            with blob_lock(digest):
+                if not NoteAttachment.objects.filter(blob_id=digest).exists():
+                    NoteAttachment.objects.create(
+                        note=self.note,
+                        blob_id=digest,
+                        filename="again",
+                        content_type="image/png",
+                    )
+                yield
+
+        with mock.patch.object(
+            collect_attachment_garbage, "blob_lock", reattaching_lock
+        ):
+            call_command("collect_attachment_garbage", stdout=mock.Mock())
+
+        self.assertTrue(Blob.objects.filter(pk=sha256).exists())
+        self.assertTrue(storage.blob_path(sha256).exists())
+        self.assertEqual(self.download(sha256).status_code, 200)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "attachments"
+
+urlpatterns = [
+    path("<str:sha256>/", views.attachment_file, name="file"),
+]
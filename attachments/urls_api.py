@@ -0,0 +1,18 @@
+from django.urls import path
+
+from . import views
+
+app_name = "attachments_api"
+
+urlpatterns = [
+    path(
+        "<str:id>/attachments/",
+        views.note_attachments,
+        name="note_attachments",
+    ),
+    path(
+        "<str:id>/attachments/<int:attachment_id>/",
+        views.note_attachment_detail,
+        name="note_attachment_detail",
+    ),
+]
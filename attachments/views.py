@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from notes.models import Note
+from .models import Blob, NoteAttachment
+from .storage import MAX_ATTACHMENT_SIZE, blob_response, store_upload
+
+
+def note_attachments(request, id):
+    """
+    AJAX endpoint to list a note's attachments (GET) or upload a new one
+    (POST, multipart field "file").
+    """
+    note = get_object_or_404(Note.objects.only("id"), pk=id, user=request.user)
+
+    if request.method == "POST":
+        # Reject oversize uploads before the body is parsed
+        if int(request.META.get("CONTENT_LENGTH") or 0) > MAX_ATTACHMENT_SIZE:
+            return _attachment_too_large_response()
+
+        uploaded_file = request.FILES.get("file")
+        if uploaded_file is None:
+            return JsonResponse(
+                {"status": "error", "message": "Missing file."}, status=400
+            )
+        if uploaded_file.size > MAX_ATTACHMENT_SIZE:
+            return _attachment_too_large_response()
+
+        with store_upload(uploaded_file) as (sha256, size), transaction.atomic(
+            using=note._state.db
+        ):
+            blob, _ = Blob.objects.get_or_create(sha256=sha256, defaults={"size": size})
+            attachment = NoteAttachment.objects.create(
+                note=note,
+                blob=blob,
+                filename=uploaded_file.name,
+                content_type=uploaded_file.content_type or "application/octet-stream",
+            )
+        return JsonResponse(
+            {"status": "ok", "result": _serialize_attachment(attachment)}
+        )
+
+    elif request.method == "GET":
+        attachments = note.attachments.select_related("blob").order_by("created")
+        return JsonResponse(
+            {
+                "status": "ok",
+                "result": {
+                    "attachments": [
+                        _serialize_attachment(attachment) for attachment in attachments
+                    ]
+                },
+            }
+        )
+
+    return JsonResponse(
+        {"status": "error", "message": "Only POST and GET allowed"}, status=400
+    )
+
+
+def note_attachment_detail(request, id, attachment_id):
+    """
+    AJAX endpoint to remove an attachment from a note. The stored file is left
+    for the garbage collector, since other notes may still reference it.
+    """
+    if request.method != "DELETE":
+        return JsonResponse(
+            {"status": "error", "message": "Only DELETE allowed"}, status=400
+        )
+
+    attachment = get_object_or_404(
+        NoteAttachment, pk=attachment_id, note_id=id, note__user=request.user
+    )  # Ensure user owns the note
+    attachment.delete()
+    return JsonResponse({"status": "ok", "result": {"attachment_id": attachment_id}})
+
+
+def attachment_file(request, sha256):
+    """
+    Serve a stored file to a user owning at least one note that references it.
+    """
+    attachment = (
+        NoteAttachment.objects.filter(blob_id=sha256, note__user=request.user)
+        .select_related("blob")
+        .first()
+    )
+    if attachment is None:
+        return JsonResponse(
+            {"status": "error", "message": "Attachment not found."}, status=404
+        )
+    return blob_response(
+        request, attachment.blob, attachment.filename, attachment.content_type
+    )
+
+
+def _serialize_attachment(attachment):
+    return {
+        "attachment_id": attachment.id,
+        "filename": attachment.filename,
+        "sha256": attachment.blob_id,
+        "size": attachment.blob.size,
+        "content_type": attachment.content_type,
+        "url": reverse("attachments:file", args=[attachment.blob_id]),
+    }
+
+
+def _attachment_too_large_response():
+    return JsonResponse(
+        {
+            "status": "error",
+            "message": f"Attachment exceeds the limit of {MAX_ATTACHMENT_SIZE} bytes.",
+        },
+        status=413,
+    )
@@ -0,0 +1,66 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import autodiscover_modules
+
+from backgroundjobs.worker import WorkerStats, release_stale_jobs, work
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=2,
+            help="Number of worker threads.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling forever.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again.",
+        )
+
+    def handle(self, *args, concurrency, burst, poll_interval, **options):
+        # Register the tasks declared in every app's tasks.py
+        autodiscover_modules("tasks")
+
+        released = release_stale_jobs()
+        if released:
+            self.stdout.write(f"Released {released} stale jobs.")
+
+        stats = WorkerStats()
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=work,
+                args=(number, stop_event, burst, poll_interval, stats),
+                daemon=True,
+            )
+            for number in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, waiting for running jobs to finish...")
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {stats.succeeded} jobs ({stats.failed} failed attempts), "
+                f"{stats.jobs_per_second:.1f} jobs/s."
+            )
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backgroundjobs", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="job",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("RUNNING", "Running"),
+                    ("DONE", "Done"),
+                    ("FAILED", "Failed"),
+                    ("SUPERSEDED", "Superseded"),
+                ],
+                default="PENDING",
+                max_length=16,
+            ),
+        ),
+    ]
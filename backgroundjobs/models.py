@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models import Q
+
+
+class Job(models.Model):
+    """
+    A unit of deferred work, stored in the database so that no external broker
+    is needed. Picked up by `manage.py run_jobs`.
+    """
+
+    STATUS_CHOICES = {
+        "PENDING": "Pending",
+        "RUNNING": "Running",
+        "DONE": "Done",
+        "FAILED": "Failed",
+        # Due again while an identical job was pending, which runs instead
+        "SUPERSEDED": "Superseded",
+    }
+
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    # Identical pending jobs share a key, so enqueuing them twice is a no-op
+    dedupe_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=255, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=Q(status="PENDING"),
+                name="unique_pending_job",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,61 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+tasks = {}
+
+
+def task(name):
+    """
+    Register a function as a background task under `name`. The function is
+    called with the job payload as keyword arguments.
+    """
+
+    def decorator(func):
+        tasks[name] = func
+        return func
+
+    return decorator
+
+
+def make_dedupe_key(name, payload):
+    encoded = json.dumps([name, payload], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def enqueue(name, payload=None, delay=None, max_attempts=5):
+    """
+    Queue `name` to run with `payload`. When an identical job is already
+    pending, that job is returned instead of creating another one.
+    """
+    payload = payload or {}
+    dedupe_key = make_dedupe_key(name, payload)
+    run_after = timezone.now() + (delay or timedelta())
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name,
+                payload=payload,
+                dedupe_key=dedupe_key,
+                run_after=run_after,
+                max_attempts=max_attempts,
+            )
+    except IntegrityError:
+        job = Job.objects.filter(dedupe_key=dedupe_key, status="PENDING").first()
+        if job is None:
+            # Picked up by a worker in the meantime; queue a fresh run
+            return enqueue(name, payload, delay, max_attempts)
+        return job
+
+
+def enqueue_on_commit(name, payload=None, delay=None, max_attempts=5):
+    """
+    Like `enqueue`, but only once the current transaction commits, so the job
+    never runs against (or survives) rolled back data.
+    """
+    transaction.on_commit(lambda: enqueue(name, payload, delay, max_attempts))
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Job
+from .registry import enqueue, tasks
+from .worker import (
+    BACKOFF_BASE_SECONDS,
+    BACKOFF_MAX_SECONDS,
+    STALE_LOCK_TIMEOUT,
+    claim_job,
+    release_stale_jobs,
+    run_job,
+)
+
+
+def failing_task(**payload):
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.enterContext(
+            mock.patch.dict(tasks, {"tests.fail": failing_task, "tests.ok": dict})
+        )
+
+    def test_identical_pending_jobs_are_deduplicated(self):
+        job = enqueue("tests.ok", {"a": 1})
+        self.assertEqual(enqueue("tests.ok", {"a": 1}).pk, job.pk)
+        self.assertNotEqual(enqueue("tests.ok", {"a": 2}).pk, job.pk)
+        self.assertNotEqual(enqueue("tests.fail", {"a": 1}).pk, job.pk)
+
+        # Once a worker holds it, the same work is queued afresh
+        self.assertEqual(claim_job("worker").pk, job.pk)
+        again = enqueue("tests.ok", {"a": 1})
+        self.assertNotEqual(again.pk, job.pk)
+        self.assertEqual(again.status, "PENDING")
+
+    def test_failures_back_off_exponentially(self):
+        job = enqueue("tests.fail", max_attempts=12)
+        now = timezone.now()
+        with mock.patch("backgroundjobs.worker.timezone.now", return_value=now):
+            for attempt in range(1, 12):
+                job = Job.objects.get(pk=job.pk)
+                self.assertFalse(run_job(job))
+                job.refresh_from_db()
+                self.assertEqual(job.status, "PENDING")
+                self.assertEqual(job.attempts, attempt)
+                self.assertIn("RuntimeError: boom", job.last_error)
+                delay = min(
+                    BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), BACKOFF_MAX_SECONDS
+                )
+                self.assertEqual(job.run_after, now + timedelta(seconds=delay))
+            self.assertEqual(delay, BACKOFF_MAX_SECONDS)
+
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "FAILED")
+
+    def test_success_clears_the_last_error(self):
+        job = enqueue("tests.ok")
+        job.last_error = "earlier failure"
+        self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ("DONE", ""))
+
+    def test_failed_job_with_a_pending_twin_is_superseded(self):
+        job = enqueue("tests.fail", {"a": 1})
+        job = claim_job("worker")
+        twin = enqueue("tests.fail", {"a": 1})
+
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "SUPERSEDED")
+        self.assertIn("RuntimeError: boom", job.last_error)
+        twin.refresh_from_db()
+        self.assertEqual(twin.status, "PENDING")
+
+    def test_stale_running_jobs_are_requeued(self):
+        stale = enqueue("tests.ok", {"a": 1})
+        fresh = enqueue("tests.ok", {"a": 2})
+        superseded = enqueue("tests.ok", {"a": 3})
+        for job in (stale, fresh, superseded):
+            claim_job("lost worker")
+        old = timezone.now() - STALE_LOCK_TIMEOUT - timedelta(seconds=1)
+        Job.objects.filter(pk__in=[stale.pk, superseded.pk]).update(locked_at=old)
+        twin = enqueue("tests.ok", {"a": 3})
+
+        self.assertEqual(release_stale_jobs(), 1)
+
+        statuses = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[stale.pk], "PENDING")
+        self.assertEqual(statuses[fresh.pk], "RUNNING")
+        self.assertEqual(statuses[superseded.pk], "SUPERSEDED")
+        self.assertEqual(statuses[twin.pk], "PENDING")
+        stale.refresh_from_db()
+        self.assertEqual((stale.locked_by, stale.locked_at), ("", None))
@@ -0,0 +1,174 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Job
+from .registry import tasks
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 60 * 60
+# A RUNNING job whose lock is older than this is assumed lost with its worker
+STALE_LOCK_TIMEOUT = timedelta(minutes=30)
+
+
+def worker_id(thread_number=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{thread_number}"
+
+
+def claim_job(locked_by):
+    """
+    Atomically take the next due job. The conditional UPDATE makes sure two
+    workers never claim the same row.
+    """
+    now = timezone.now()
+    for _ in range(5):
+        candidate = (
+            Job.objects.filter(status="PENDING", run_after__lte=now)
+            .order_by("run_after", "id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if candidate is None:
+            return None
+        claimed = Job.objects.filter(pk=candidate, status="PENDING").update(
+            status="RUNNING", locked_by=locked_by, locked_at=now, modified=now
+        )
+        if claimed:
+            return Job.objects.get(pk=candidate)
+    return None
+
+
+def run_job(job):
+    """
+    Run a claimed job; on failure reschedule it with exponential backoff until
+    it runs out of attempts.
+    """
+    job.attempts += 1
+    try:
+        func = tasks[job.name]
+        func(**job.payload)
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.pk, job.name)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = "FAILED"
+        else:
+            delay = min(
+                BACKOFF_BASE_SECONDS * 2 ** (job.attempts - 1), BACKOFF_MAX_SECONDS
+            )
+            job.status = "PENDING"
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        job.locked_by = ""
+        job.locked_at = None
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            # An identical job was queued meanwhile (unique_pending_job) and
+            # runs in its place; this one keeps its error for the record
+            job.status = "SUPERSEDED"
+            job.save()
+        return False
+
+    job.status = "DONE"
+    job.locked_by = ""
+    job.locked_at = None
+    job.last_error = ""
+    job.save()
+    return True
+
+
+def requeue_jobs(jobs):
+    """
+    Put the RUNNING `jobs` back in the queue one at a time. A job whose
+    identical twin was queued while it ran (unique_pending_job) is marked
+    SUPERSEDED instead. Returns how many were requeued.
+    """
+    requeued = 0
+    for pk in list(jobs.values_list("pk", flat=True)):
+        running = Job.objects.filter(pk=pk, status="RUNNING")
+        try:
+            with transaction.atomic():
+                requeued += running.update(
+                    status="PENDING", locked_by="", locked_at=None
+                )
+        except IntegrityError:
+            running.update(status="SUPERSEDED", locked_by="", locked_at=None)
+    return requeued
+
+
+def release_stale_jobs():
+    """
+    Put RUNNING jobs whose worker disappeared back in the queue.
+    """
+    return requeue_jobs(
+        Job.objects.filter(
+            status="RUNNING", locked_at__lt=timezone.now() - STALE_LOCK_TIMEOUT
+        )
+    )
+
+
+def work(thread_number, stop_event, burst, poll_interval, stats):
+    locked_by = worker_id(thread_number)
+    try:
+        while not stop_event.is_set():
+            job = None
+            try:
+                job = claim_job(locked_by)
+                if job is None:
+                    if burst:
+                        return
+                    stop_event.wait(poll_interval)
+                    continue
+                succeeded = run_job(job)
+            except DatabaseError:
+                # Transient errors ("database is locked") must not end the
+                # thread, nor leave the job RUNNING until its lock goes stale
+                logger.exception("Worker %s hit a database error", locked_by)
+                if job is not None:
+                    _release_claim(job, locked_by)
+                stop_event.wait(poll_interval)
+                continue
+            stats.record(succeeded)
+    finally:
+        connection.close()  # Each thread holds its own connection
+
+
+def _release_claim(job, locked_by):
+    try:
+        requeue_jobs(Job.objects.filter(pk=job.pk, locked_by=locked_by))
+    except DatabaseError:
+        logger.exception(
+            "Job %s stays RUNNING until its lock is older than %s",
+            job.pk,
+            STALE_LOCK_TIMEOUT,
+        )
+
+
+class WorkerStats:
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, succeeded):
+        with self._lock:
+            if succeeded:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    @property
+    def jobs_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return (self.succeeded + self.failed) / elapsed if elapsed else 0.0
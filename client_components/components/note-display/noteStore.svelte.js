@@ -6,4 +6,6 @@ export const selectedNote = $state({
   selectedNoteId: undefined,
   csrfToken: undefined,
   isSaving: false,
+  // Shown from the cache and not yet refetched: not editable, never saved
+  isRevalidating: false,
 });
@@ -0,0 +1,89 @@
+// Notes fetched ahead of time, so opening one from the sidebar needs no
+// request. Least recently used notes are evicted first, and entries expire
+// so edits made on other devices show up.
+const MAX_CACHED_NOTES = 50;
+const CACHE_TTL_MS = 2 * 60 * 1000;
+// Matches BULK_FETCH_MAX_IDS on the server
+const MAX_BULK_IDS = 20;
+const MAX_RECENT_NOTES = 5;
+const NEIGHBOUR_RADIUS = 2;
+
+const cachedNotes = new Map();
+
+export function getCachedNote(noteId) {
+  const key = String(noteId);
+  const entry = cachedNotes.get(key);
+  if (!entry) return null;
+  cachedNotes.delete(key);
+  if (Date.now() - entry.cachedAt > CACHE_TTL_MS) return null;
+  cachedNotes.set(key, entry);
+  return entry;
+}
+
+export function cacheNote(noteId, { title, content, type }) {
+  const key = String(noteId);
+  cachedNotes.delete(key);
+  cachedNotes.set(key, { title, content, type, cachedAt: Date.now() });
+  while (cachedNotes.size > MAX_CACHED_NOTES) {
+    cachedNotes.delete(cachedNotes.keys().next().value);
+  }
+}
+
+export function rememberRecentNote(noteId) {
+  const recent = recentNoteIds().filter((id) => id !== String(noteId));
+  recent.unshift(String(noteId));
+  localStorage.setItem(
+    "recentNoteIds",
+    JSON.stringify(recent.slice(0, MAX_RECENT_NOTES))
+  );
+}
+
+function recentNoteIds() {
+  try {
+    return JSON.parse(localStorage.getItem("recentNoteIds")) || [];
+  } catch {
+    return [];
+  }
+}
+
+// The notes around `noteId` in the sidebar, then the recently opened ones
+export function neighbourNoteIds(noteId) {
+  const sidebarIds = Array.from(
+    document.querySelectorAll("#notes-sidebar [data-note-id]"),
+    (link) => link.dataset.noteId
+  );
+  const position = sidebarIds.indexOf(String(noteId));
+  const neighbours =
+    position === -1
+      ? []
+      : sidebarIds.slice(
+          Math.max(position - NEIGHBOUR_RADIUS, 0),
+          position + NEIGHBOUR_RADIUS + 1
+        );
+  return [...new Set([...neighbours, ...recentNoteIds()])].filter(
+    (id) => id !== String(noteId)
+  );
+}
+
+export function prefetchNotes(bulkEndpoint, noteIds) {
+  const missing = noteIds
+    .filter((id) => !getCachedNote(id))
+    .slice(0, MAX_BULK_IDS);
+  if (!bulkEndpoint || missing.length === 0) return Promise.resolve();
+
+  return fetch(`${bulkEndpoint}?ids=${missing.join(",")}`)
+    .then((response) => (response.ok ? response.json() : null))
+    .then((data) => {
+      if (!data || data.status !== "ok") return;
+      for (const note of data.result.notes) {
+        // Large notes come without content; they are loaded when opened
+        if (note.note_content === null) continue;
+        cacheNote(note.note_id, {
+          title: note.note_title,
+          content: note.note_content,
+          type: note.note_type,
+        });
+      }
+    })
+    .catch((err) => console.error("Ajax error:", err));
+}
@@ -1,4 +1,9 @@
 import { selectedNote } from "../noteStore.svelte.js";
+import { cacheNote } from "./noteCacheService.js";
+
+// Latest unsent content per note endpoint, and endpoints with a save running
+const pendingSaves = new Map();
+const savesInFlight = new Set();
 
 export function noteStoreService() {
   function loadDefaultNote() {
@@ -7,6 +12,7 @@ export function noteStoreService() {
 
   function loadNoteContent() {
     if (!selectedNote.selectedNoteId) return;
+    const noteId = selectedNote.selectedNoteId;
 
     fetch(selectedNote.ajaxNoteEndpoint, {
       method: "GET",
@@ -14,14 +20,32 @@ export function noteStoreService() {
         "Content-Type": "application/json",
       },
     })
-      .then((response) => response.json())
+      .then((response) => {
+        if (response.status === 429) {
+          // Retry unless another note was opened in the meantime
+          const retryAfterSeconds =
+            Number(response.headers.get("Retry-After")) || 1;
+          setTimeout(() => {
+            if (noteId === selectedNote.selectedNoteId) loadNoteContent();
+          }, retryAfterSeconds * 1000);
+          return null;
+        }
+        return response.json();
+      })
       .then((data) => {
+        if (data === null) return;
         if (data.status !== "ok") {
           console.error("Error fetching note:", data);
-        } else {
+        } else if (noteId === selectedNote.selectedNoteId) {
+          cacheNote(noteId, {
+            title: data.result.note_title,
+            content: data.result.note_content,
+            type: data.result.note_type,
+          });
           selectedNote.title = data.result.note_title;
           selectedNote.content = data.result.note_content;
           selectedNote.type = data.result.note_type;
+          selectedNote.isRevalidating = false;
         }
       })
       .catch((err) => console.error("Ajax error:", err));
@@ -32,26 +56,90 @@ export function noteStoreService() {
       localStorage.setItem("localNote", selectedNote.content);
     }
 
-    if (!selectedNote.selectedNoteId) return;
+    // A cached copy may be older than the stored note; saving it would
+    // overwrite edits made elsewhere
+    if (!selectedNote.selectedNoteId || selectedNote.isRevalidating) return;
+    cacheNote(selectedNote.selectedNoteId, selectedNote);
     selectedNote.isSaving = true;
-    fetch(selectedNote.ajaxNoteEndpoint, {
+    // Only the latest content of a note is worth sending; anything queued
+    // behind an in-flight save or a 429 is replaced, never dropped
+    pendingSaves.set(selectedNote.ajaxNoteEndpoint, selectedNote.content);
+    flushSave(selectedNote.ajaxNoteEndpoint);
+  }
+
+  function flushSave(endpoint) {
+    if (savesInFlight.has(endpoint) || !pendingSaves.has(endpoint)) return;
+    const content = pendingSaves.get(endpoint);
+    pendingSaves.delete(endpoint);
+    savesInFlight.add(endpoint);
+
+    const finish = (retryAfterSeconds = 0) => {
+      if (retryAfterSeconds) {
+        if (!pendingSaves.has(endpoint)) pendingSaves.set(endpoint, content);
+        setTimeout(() => {
+          savesInFlight.delete(endpoint);
+          flushSave(endpoint);
+        }, retryAfterSeconds * 1000);
+        return;
+      }
+      savesInFlight.delete(endpoint);
+      if (pendingSaves.has(endpoint)) {
+        flushSave(endpoint);
+      } else if (savesInFlight.size === 0 && pendingSaves.size === 0) {
+        selectedNote.isSaving = false;
+      }
+    };
+
+    fetch(endpoint, {
       method: "POST",
       headers: {
         "X-CSRFToken": selectedNote.csrfToken,
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ content: selectedNote.content }),
+      body: JSON.stringify({ content }),
     })
-      .then((response) => response.json())
+      .then((response) => {
+        if (response.status === 429) {
+          finish(Number(response.headers.get("Retry-After")) || 1);
+          return null;
+        }
+        return response.json();
+      })
       .then((data) => {
-        selectedNote.isSaving = false;
+        if (data === null) return;
         if (data.status !== "ok") {
           console.error("Error updating note:", data);
         }
+        finish();
       })
       .catch((err) => {
         console.error("Ajax error:", err);
-        selectedNote.isSaving = false;
+        finish();
+      });
+  }
+
+  function uploadAttachment(file) {
+    const formData = new FormData();
+    formData.append("file", file, file.name);
+
+    return fetch(`${selectedNote.ajaxNoteEndpoint}attachments/`, {
+      method: "POST",
+      headers: {
+        "X-CSRFToken": selectedNote.csrfToken,
+      },
+      body: formData,
+    })
+      .then((response) => response.json())
+      .then((data) => {
+        if (data.status !== "ok") {
+          console.error("Error uploading attachment:", data);
+          return null;
+        }
+        return data.result;
+      })
+      .catch((err) => {
+        console.error("Ajax error:", err);
+        return null;
       });
   }
 
@@ -59,5 +147,6 @@ export function noteStoreService() {
     loadDefaultNote,
     loadNoteContent,
     saveNoteContent,
+    uploadAttachment,
   };
 }
@@ -0,0 +1,87 @@
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+# JSON with short keys and no whitespace, for clients that ask for it with
+# `Accept: application/vnd.notes.compact+json`
+COMPACT_JSON_CONTENT_TYPE = "application/vnd.notes.compact+json"
+
+# Clients expand keys back with the inverse of this table; keys missing from
+# it are sent as they are. Never reuse a short key.
+COMPACT_KEYS = {
+    "status": "s",
+    "result": "r",
+    "message": "m",
+    "notes": "n",
+    "note_id": "i",
+    "note_title": "t",
+    "note_type": "y",
+    "note_content": "c",
+    "directory_id": "d",
+    "snippet": "p",
+    "size": "z",
+    "word_count": "w",
+    "next_cursor": "nc",
+    "titles": "ts",
+    "tags": "tg",
+    "total": "tt",
+    "facets": "f",
+    "date": "da",
+    "end_date": "ed",
+    "outgoing": "o",
+    "backlinks": "b",
+    "target_id": "ti",
+    "target_title": "tn",
+    "modified": "v",
+    "missing": "x",
+}
+# Maps keyed by data (tag names, dates) rather than by field names; sent as
+# they are so a tag called "status" keeps its name
+VERBATIM_KEYS = {"facets", "days"}
+
+
+def wants_compact_json(request):
+    """
+    True when the client names the compact type in Accept and prefers it to
+    plain JSON. Wildcards do not count.
+    """
+    weights = {}
+    for media_type in request.accepted_types:
+        try:
+            weight = float(media_type.params.get("q", 1))
+        except ValueError:
+            continue
+        weights[f"{media_type.main_type}/{media_type.sub_type}"] = weight
+    compact = weights.get(COMPACT_JSON_CONTENT_TYPE, 0)
+    return compact > 0 and compact >= weights.get("application/json", 0)
+
+
+def shorten_keys(value):
+    if isinstance(value, dict):
+        return {
+            COMPACT_KEYS.get(key, key): (
+                item if key in VERBATIM_KEYS else shorten_keys(item)
+            )
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [shorten_keys(item) for item in value]
+    return value
+
+
+class ApiJsonResponse(JsonResponse):
+    """
+    A JsonResponse in the format the request negotiated: plain JSON, or
+    compact JSON with short keys.
+    """
+
+    def __init__(self, request, data, **kwargs):
+        if wants_compact_json(request):
+            data = shorten_keys(data)
+            kwargs.setdefault("content_type", COMPACT_JSON_CONTENT_TYPE)
+            kwargs["json_dumps_params"] = {
+                "separators": (",", ":"),
+                "ensure_ascii": False,
+                **kwargs.get("json_dumps_params", {}),
+            }
+        super().__init__(data, **kwargs)
+        patch_vary_headers(self, ("Accept",))
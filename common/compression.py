@@ -0,0 +1,240 @@
+"""
+Compression of dynamic responses, negotiated through Accept-Encoding.
+
+gzip is always available; brotli and zstd are offered when the `brotli` and
+`zstandard` packages from requirements-compression.txt are installed. Static files are left to WhiteNoise,
+which serves its precompressed copies.
+
+Against BREACH, gzip and zstd responses carry a random amount of padding
+the decoder skips, so their compressed sizes vary from one response to the
+next. brotli has no such field: its stream is a bit stream whose only
+skippable block (metadata) would have to be spliced in bit by bit, so br
+responses are not padded. They still do not leak the CSRF token, which
+Django masks differently in every response; set COMPRESSION_SETTINGS
+"BROTLI" to False where pages reflect user input next to other secrets.
+"""
+
+import gzip
+import io
+import re
+import secrets
+import struct
+
+from django.conf import settings
+from django.http import FileResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SETTINGS = getattr(settings, "COMPRESSION_SETTINGS", {})
+
+# Smaller bodies are sent as they are: the headers and CPU cost more than
+# the bytes saved
+MIN_SIZE = COMPRESSION_SETTINGS.get("MIN_SIZE", 1024)
+# Levels tuned for per-request compression, not for archives
+BROTLI_QUALITY = COMPRESSION_SETTINGS.get("BROTLI_QUALITY", 4)
+ZSTD_LEVEL = COMPRESSION_SETTINGS.get("ZSTD_LEVEL", 3)
+# br responses are not padded against BREACH (see above)
+BROTLI_ENABLED = COMPRESSION_SETTINGS.get("BROTLI", True)
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+}
+
+ACCEPT_ENCODING_RE = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+class Gzip:
+    name = "gzip"
+
+    # Random bytes in the gzip header, as Django's GZipMiddleware does, so
+    # compressed sizes do not leak page secrets (BREACH)
+    max_random_bytes = GZipMiddleware.max_random_bytes
+
+    def compress(self, data):
+        return compress_string(data, max_random_bytes=self.max_random_bytes)
+
+    def compress_sequence(self, sequence):
+        # Django's compress_sequence only emits what zlib has flushed on its
+        # own; flushing every chunk lets a streamed page render as it arrives
+        buffer = io.BytesIO()
+        filename = b"a" * secrets.randbelow(self.max_random_bytes)
+        with gzip.GzipFile(
+            filename=filename, mode="wb", compresslevel=6, fileobj=buffer, mtime=0
+        ) as zfile:
+            for chunk in sequence:
+                zfile.write(chunk)
+                zfile.flush()
+                yield _drain(buffer)
+        yield _drain(buffer)
+
+
+class Brotli:
+    name = "br"
+
+    def compress(self, data):
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    def compress_sequence(self, sequence):
+        # Flushed per chunk, as with gzip
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in sequence:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class Zstd:
+    name = "zstd"
+
+    # A skippable frame of random length ahead of the data, which decoders
+    # ignore (RFC 8878, section 3.1.2), pads the size as gzip's header does
+    max_random_bytes = GZipMiddleware.max_random_bytes
+    SKIPPABLE_FRAME_MAGIC = 0x184D2A50
+
+    def padding(self):
+        size = secrets.randbelow(self.max_random_bytes)
+        return struct.pack("<II", self.SKIPPABLE_FRAME_MAGIC, size) + b"\0" * size
+
+    def compress(self, data):
+        return self.padding() + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(
+            data
+        )
+
+    def compress_sequence(self, sequence):
+        yield self.padding()
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        for chunk in sequence:
+            data = compressor.compress(chunk) + compressor.flush(
+                zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            )
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def available_codecs():
+    """
+    Installed codecs, most preferred first. Browsers weigh br and zstd the
+    same; br wins the tie as the more widely supported of the two.
+    """
+    codecs = []
+    if brotli is not None and BROTLI_ENABLED:
+        codecs.append(Brotli())
+    if zstandard is not None:
+        codecs.append(Zstd())
+    codecs.append(Gzip())
+    return codecs
+
+
+CODECS = available_codecs()
+
+
+def negotiate_codec(accept_encoding, codecs=CODECS):
+    """
+    Pick the codec the client weighs highest in `accept_encoding`, breaking
+    ties by our preference. None when the client accepts none of them.
+    """
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        match = ACCEPT_ENCODING_RE.match(part)
+        if not match:
+            continue
+        try:
+            weights[match[1]] = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+
+    best, best_weight = None, 0
+    for codec in codecs:
+        weight = weights.get(codec.name, weights.get("*", 0))
+        if weight > best_weight:
+            best, best_weight = codec, weight
+    return best
+
+
+def is_compressible(content_type):
+    media_type = content_type.split(";")[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith(("+json", "+xml"))
+    )
+
+
+class CompressionMiddleware:
+    """
+    Compress text responses with the best codec the client accepts.
+    Streaming responses are compressed as they stream, never buffered.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self._should_compress(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        codec = negotiate_codec(request.headers.get("Accept-Encoding", ""))
+        if codec is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                # Not served under WSGI; left uncompressed
+                return response
+            response.streaming_content = codec.compress_sequence(
+                response.streaming_content
+            )
+            del response["Content-Length"]
+        else:
+            if len(response.content) < MIN_SIZE:
+                return response
+            compressed = codec.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            # For the access log, which sees the compressed body
+            response.uncompressed_size = len(response.content)
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # The representation changed, so a strong ETag no longer holds
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = codec.name
+        return response
+
+    def _should_compress(self, response):
+        return (
+            response.status_code == 200
+            and not response.has_header("Content-Encoding")
+            # Byte ranges refer to the uncompressed body
+            and not response.has_header("Accept-Ranges")
+            # Files (attachments, static) are streamed as they are stored
+            and not isinstance(response, FileResponse)
+            and is_compressible(response.get("Content-Type", ""))
+        )
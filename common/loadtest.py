@@ -0,0 +1,410 @@
+"""
+Load generator for the notes app: asyncio clients that behave like the
+browser during an editing session.
+
+Every virtual user logs in, opens a note, then picks actions from a weighted
+mix: sidebar polls (as Unpoly's up-poll sends them, with the last ETag),
+autosaves of a growing note (as saveNoteContent posts them), reloads of the
+note (as the inactivity timer does), switches to another note and
+drag-and-drop moves between directories. The actions taken are recorded as
+JSONL and can be replayed with the same timing.
+
+Abusive users stand for a runaway tab: they only autosave, with almost no
+pause, and their requests are reported apart ("abusive:autosave").
+
+Only the standard library is used, so it runs wherever the app runs.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+ACTIONS = ("poll", "autosave", "reload", "switch", "reorder")
+
+DEFAULT_MIX = {"autosave": 6, "poll": 2, "reload": 1, "switch": 1, "reorder": 0.5}
+
+SIDEBAR_TARGET = "#notes-sidebar"
+ACCEPT_ENCODING = "gzip, deflate, br, zstd"
+
+
+def parse_mix(value):
+    """
+    Parse `autosave=6,poll=2` into a weight per action.
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise ValueError(
+                f"Unknown action {name!r}; choose from {', '.join(ACTIONS)}."
+            )
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one action with a positive weight.")
+    return mix
+
+
+class HttpClient:
+    """
+    A minimal HTTP/1.1 client with keep-alive and a cookie jar, one per
+    virtual user (one browser tab).
+    """
+
+    def __init__(self, address, host_header):
+        self.address = address
+        self.host_header = host_header
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b"", headers=None):
+        # A connection the server closed while idle is retried once
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(*self.address)
+            try:
+                self._send(method, path, body, headers or {})
+                await self.writer.drain()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+
+    def _send(self, method, path, body, headers):
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host_header}",
+            f"Accept-Encoding: {ACCEPT_ENCODING}",
+            f"Content-Length: {len(body)}",
+        ]
+        if self.cookies:
+            cookies = "; ".join(
+                f"{name}={value}" for name, value in self.cookies.items()
+            )
+            lines.append(f"Cookie: {cookies}")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server.")
+        status = int(status_line.split()[1])
+        headers = {}
+        while line := (await self.reader.readline()).rstrip(b"\r\n"):
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                cookie_name, _, cookie_value = value.split(";", 1)[0].partition("=")
+                self.cookies[cookie_name] = cookie_value
+            else:
+                headers[name] = value
+
+        if headers.get("transfer-encoding") == "chunked":
+            body = bytearray()
+            while size := int((await self.reader.readline()).split(b";")[0], 16):
+                body += await self.reader.readexactly(size + 2)
+                del body[-2:]
+            await self.reader.readline()
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        elif status in (204, 304):
+            body = b""
+        else:
+            body = await self.reader.read()
+            headers["connection"] = "close"
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, headers, bytes(body)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.bytes = Counter()
+        self.failures = Counter()
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, endpoint, status, latency_ms, size):
+        self.latencies[endpoint].append(latency_ms)
+        self.statuses[endpoint][status] += 1
+        self.bytes[endpoint] += size
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        total = sum(len(values) for values in self.latencies.values())
+        statuses = Counter()
+        for counter in self.statuses.values():
+            statuses.update(counter)
+        lines = [
+            f"{total} requests in {elapsed:.1f} s, {total / elapsed:.1f} req/s; "
+            f"statuses {dict(sorted(statuses.items()))}"
+            + (
+                f"; connection failures {sum(self.failures.values())}"
+                if self.failures
+                else ""
+            ),
+            f"  {'endpoint':<16}{'count':>7}{'p50':>9}{'p90':>9}{'p99':>9}"
+            f"{'max':>9}{'KB/req':>9}  errors",
+        ]
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            errors = sum(
+                count
+                for status, count in self.statuses[endpoint].items()
+                if status >= 400
+            )
+            lines.append(
+                f"  {endpoint:<16}{len(values):>7}"
+                + "".join(
+                    f"{values[min(int(len(values) * q), len(values) - 1)]:>9.1f}"
+                    for q in (0.5, 0.9, 0.99)
+                )
+                + f"{values[-1]:>9.1f}"
+                + f"{self.bytes[endpoint] / len(values) / 1024:>9.1f}  {errors}"
+            )
+        lines.append("  (latencies in ms)")
+        return "\n".join(lines)
+
+
+class VirtualUser:
+    def __init__(
+        self, index, account, address, host_header, stats, recorder, rng, label=""
+    ):
+        self.index = index
+        self.label = label
+        self.account = account
+        self.client = HttpClient(address, host_header)
+        self.stats = stats
+        self.recorder = recorder
+        self.rng = rng
+        self.note = 0
+        self.contents = {}
+        self.sidebar_etag = None
+
+    @property
+    def note_id(self):
+        return self.account["note_ids"][self.note]
+
+    async def call(self, endpoint, method, path, body=b"", headers=None):
+        endpoint = self.label + endpoint
+        started = time.perf_counter()
+        try:
+            status, response_headers, response_body = await self.client.request(
+                method, path, body, headers
+            )
+        except (OSError, asyncio.IncompleteReadError):
+            self.stats.failures[endpoint] += 1
+            return None, {}
+        self.stats.add(
+            endpoint,
+            status,
+            (time.perf_counter() - started) * 1000,
+            len(response_body),
+        )
+        return status, response_headers
+
+    def _json_headers(self):
+        return {
+            "Content-Type": "application/json",
+            "X-CSRFToken": self.client.cookies.get("csrftoken", ""),
+        }
+
+    async def login(self):
+        await self.call("login_page", "GET", "/accounts/login/")
+        body = urlencode(
+            {
+                "username": self.account["username"],
+                "password": self.account["password"],
+                "csrfmiddlewaretoken": self.client.cookies.get("csrftoken", ""),
+            }
+        ).encode()
+        await self.call(
+            "login",
+            "POST",
+            "/accounts/login/",
+            body,
+            {"Content-Type": "application/x-www-form-urlencoded"},
+        )
+
+    async def open_note(self):
+        await self.call("note_list", "GET", f"/notes/?note={self.note_id}")
+        await self.call("note_api", "GET", f"/api/v1/notes/{self.note_id}/")
+
+    async def perform(self, action, params):
+        if action == "poll":
+            headers = {"X-Up-Target": SIDEBAR_TARGET, "X-Up-Version": "3.10.2"}
+            if self.sidebar_etag:
+                headers["If-None-Match"] = self.sidebar_etag
+            status, response_headers = await self.call(
+                "sidebar_poll", "GET", f"/notes/?note={self.note_id}", headers=headers
+            )
+            if status == 200:
+                self.sidebar_etag = response_headers.get("etag")
+        elif action == "autosave":
+            content = self.contents.get(self.note, "") + "x" * params["typed"]
+            self.contents[self.note] = content
+            await self.call(
+                "autosave",
+                "POST",
+                f"/api/v1/notes/{self.note_id}/",
+                json.dumps({"content": content}).encode(),
+                self._json_headers(),
+            )
+        elif action == "reload":
+            await self.call("note_api", "GET", f"/api/v1/notes/{self.note_id}/")
+        elif action == "switch":
+            self.note = params["note"]
+            await self.open_note()
+        elif action == "reorder":
+            directory_ids = self.account["directory_ids"]
+            await self.call(
+                "reorder",
+                "POST",
+                "/notes/ajax_update_note_order/",
+                json.dumps(
+                    {
+                        "note_id": self.account["note_ids"][params["note"]],
+                        "new_index": params["index"],
+                        "new_directory": (
+                            directory_ids[params["directory"]]
+                            if params["directory"] is not None
+                            else None
+                        ),
+                    }
+                ).encode(),
+                self._json_headers(),
+            )
+
+    def random_params(self, action):
+        notes = len(self.account["note_ids"])
+        if action == "autosave":
+            return {"typed": self.rng.randint(1, 200)}
+        if action == "switch":
+            return {"note": self.rng.randrange(notes)}
+        if action == "reorder":
+            directories = len(self.account["directory_ids"])
+            return {
+                "note": self.rng.randrange(notes),
+                "index": self.rng.randrange(notes),
+                "directory": (
+                    self.rng.randrange(directories)
+                    if directories and self.rng.random() < 0.8
+                    else None
+                ),
+            }
+        return {}
+
+    async def run_random(self, mix, think_time, deadline, started):
+        actions, weights = zip(*mix.items())
+        while True:
+            await asyncio.sleep(self.rng.expovariate(1 / think_time))
+            if time.perf_counter() >= deadline:
+                break
+            action = self.rng.choices(actions, weights)[0]
+            params = self.random_params(action)
+            self.recorder(
+                {
+                    "t": round(time.perf_counter() - started, 3),
+                    "user": self.index,
+                    "action": action,
+                    **params,
+                }
+            )
+            await self.perform(action, params)
+
+    async def run_replay(self, events, started, speed):
+        for event in events:
+            delay = started + event["t"] / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            params = {
+                key: value
+                for key, value in event.items()
+                if key not in ("t", "user", "action")
+            }
+            await self.perform(event["action"], params)
+
+
+async def run_load(
+    accounts,
+    address,
+    host_header,
+    *,
+    mix=None,
+    duration=60,
+    think_time=1.0,
+    ramp_up=5,
+    seed=None,
+    replay=None,
+    speed=1.0,
+    recorder=None,
+    abusive_users=0,
+    abusive_think_time=0.02,
+    abusive_connections=4,
+):
+    """
+    Run one virtual user per account until `duration` elapses, or until the
+    `replay` events (grouped by user index) run out. Return the Stats.
+
+    The first `abusive_users` accounts are runaway tabs instead: each is
+    logged in on `abusive_connections` connections that autosave every
+    `abusive_think_time` seconds on average, until `duration` elapses.
+    They are neither recorded nor replayed.
+    """
+    stats = Stats()
+    rng = random.Random(seed)
+    recorder = recorder or (lambda event: None)
+    users = []
+    for index, account in enumerate(accounts):
+        abusive = index < abusive_users
+        for _ in range(abusive_connections if abusive else 1):
+            users.append(
+                VirtualUser(
+                    index,
+                    account,
+                    address,
+                    host_header,
+                    stats,
+                    (lambda event: None) if abusive else recorder,
+                    random.Random(rng.random()),
+                    label="abusive:" if abusive else "",
+                )
+            )
+
+    async def session(user):
+        if replay is None:
+            await asyncio.sleep(user.rng.uniform(0, ramp_up))
+        await user.login()
+        await user.open_note()
+        if user.label:
+            await user.run_random(
+                {"autosave": 1},
+                abusive_think_time,
+                started + ramp_up + duration,
+                started,
+            )
+        elif replay is None:
+            await user.run_random(
+                mix or DEFAULT_MIX, think_time, started + ramp_up + duration, started
+            )
+        else:
+            await user.run_replay(replay.get(user.index, []), started, speed)
+        user.client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(user) for user in users))
+    stats.finished = time.perf_counter()
+    return stats
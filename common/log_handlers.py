@@ -0,0 +1,207 @@
+import atexit
+import datetime
+import fcntl
+import json
+import logging
+import os
+import queue
+import time
+import weakref
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+}
+
+# Seconds between the warnings about records dropped on a full queue
+DROPPED_REPORT_INTERVAL = 60
+
+# Open NonBlockingRotatingFileHandlers, whose writer threads need restarting
+# in forked children
+_handlers = weakref.WeakSet()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with `extra` fields merged in at the top level.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text or record.exc_info:
+            entry["exception"] = record.exc_text or self.formatException(
+                record.exc_info
+            )
+        return json.dumps(entry, default=str)
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    A RotatingFileHandler for several processes (gunicorn workers) appending
+    to the same file. Rotation happens under an exclusive lock on
+    `<filename>.lock`, once: a process that finds the file already rotated
+    by another one reopens it instead of rotating again.
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self.lock_file = None
+
+    def emit(self, record):
+        try:
+            # Past the size limit, either this process rotates or another
+            # one already has and the stream points at the backup
+            if self.stream is not None and self._size() >= self.maxBytes > 0:
+                self._rotate_once()
+            logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+    def _size(self):
+        return os.fstat(self.stream.fileno()).st_size
+
+    def _rotate_once(self):
+        if self.lock_file is None:
+            self.lock_file = open(self.baseFilename + ".lock", "a")
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                current = os.stat(self.baseFilename)
+                opened = os.fstat(self.stream.fileno())
+                moved = (current.st_dev, current.st_ino) != (
+                    opened.st_dev,
+                    opened.st_ino,
+                )
+            except FileNotFoundError:
+                moved = True
+            if moved:
+                self.stream.close()
+                self.stream = self._open()
+            if self._size() >= self.maxBytes:
+                self.doRollover()
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def close(self):
+        with self.lock:
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
+        super().close()
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # A full queue must not make stop() fail; wait for the writer
+        self.queue.put(self._sentinel)
+
+
+class NonBlockingRotatingFileHandler(QueueHandler):
+    """
+    Hands records to a background thread that writes them to a size-rotated
+    file, so the calling (request) thread never waits on disk I/O.
+
+    When the queue is full, records are dropped (and counted) rather than
+    blocking the caller; a warning with the count is logged at most every
+    DROPPED_REPORT_INTERVAL seconds, and when the handler closes.
+    """
+
+    def __init__(
+        self, filename, maxBytes=10 * 1024 * 1024, backupCount=5, queueSize=10000
+    ):
+        super().__init__(queue.Queue(maxsize=queueSize))
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.next_dropped_report = 0
+        self.target = SharedRotatingFileHandler(
+            filename, maxBytes=maxBytes, backupCount=backupCount, delay=True
+        )
+        self.listener = _Listener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+        _handlers.add(self)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve everything that cannot safely cross threads; leave the
+        # (comparatively expensive) serialization to the writer thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped > self.reported_dropped:
+            now = time.monotonic()
+            if now >= self.next_dropped_report:
+                self.next_dropped_report = now + DROPPED_REPORT_INTERVAL
+                try:
+                    self.queue.put_nowait(self._dropped_record())
+                except queue.Full:
+                    pass
+
+    def _dropped_record(self):
+        count, self.reported_dropped = (
+            self.dropped - self.reported_dropped,
+            self.dropped,
+        )
+        return logging.makeLogRecord(
+            {
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {count} log records: the log queue was full.",
+                "dropped": count,
+            }
+        )
+
+    def restart_listener(self):
+        self.listener = _Listener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+
+    def close(self):
+        _handlers.discard(self)
+        if self.listener._thread is not None:
+            self.listener.stop()
+        if self.dropped > self.reported_dropped:
+            self.target.handle(self._dropped_record())
+        self.target.close()
+        super().close()
+
+
+def _restart_listeners_after_fork():
+    # Threads do not survive fork(): preloaded gunicorn workers need their own
+    for handler in list(_handlers):
+        handler.restart_listener()
+
+
+def _stop_listeners():
+    for handler in list(_handlers):
+        if handler.listener._thread is not None:
+            handler.listener.stop()
+
+
+os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+atexit.register(_stop_listeners)
@@ -0,0 +1,93 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from common.log_handlers import JsonFormatter, NonBlockingRotatingFileHandler
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long a logging call keeps the calling thread with the "
+        "background writer, compared with a synchronous FileHandler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--records", type=int, default=20000)
+        parser.add_argument(
+            "--rate", type=int, default=5000, help="Records per second, all threads."
+        )
+        parser.add_argument(
+            "--fsync",
+            action="store_true",
+            help="fsync after every record, as a slow disk would behave.",
+        )
+
+    def handle(self, *args, threads, records, rate, fsync, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, handler in (
+                ("FileHandler", logging.FileHandler(Path(directory) / "sync.log")),
+                (
+                    "NonBlockingRotatingFileHandler",
+                    NonBlockingRotatingFileHandler(Path(directory) / "queued.log"),
+                ),
+            ):
+                handler.setFormatter(JsonFormatter())
+                if fsync:
+                    self._fsync_after_writes(handler)
+                try:
+                    latencies = self.measure(handler, threads, records, rate)
+                finally:
+                    handler.close()
+                self.report(name, latencies, getattr(handler, "dropped", 0))
+
+    def measure(self, handler, threads, records, rate):
+        logger = logging.Logger("benchmark_logging")
+        logger.addHandler(handler)
+        latencies = []
+
+        def log():
+            timings = []
+            for number in range(records // threads):
+                started = time.perf_counter()
+                logger.info(
+                    "request",
+                    extra={"route": "note_detail", "status": 200, "n": number},
+                )
+                timings.append(time.perf_counter() - started)
+                time.sleep(threads / rate)
+            latencies.extend(timings)
+
+        workers = [threading.Thread(target=log) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sorted(latencies)
+
+    def report(self, name, latencies, dropped):
+        def percentile(q):
+            return latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1e6
+
+        self.stdout.write(
+            f"{name}: {len(latencies)} records, p50 {percentile(0.5):.1f} us, "
+            f"p99 {percentile(0.99):.1f} us, max {latencies[-1] * 1e6:.0f} us, "
+            f"dropped {dropped}"
+        )
+
+    @staticmethod
+    def _fsync_after_writes(handler):
+        target = getattr(handler, "target", handler)
+        flush = target.flush
+
+        def flush_and_sync():
+            flush()
+            if target.stream:
+                os.fsync(target.stream.fileno())
+
+        target.flush = flush_and_sync
@@ -0,0 +1,134 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure import time of the settings and app configs, gunicorn cold "
+        "start and time to first request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top", type=int, default=15, help="Slowest imports to list."
+        )
+        parser.add_argument(
+            "--path",
+            default="/accounts/login/",
+            help="Page requested to measure time to first request.",
+        )
+        parser.add_argument("--skip-server", action="store_true")
+
+    def handle(self, *args, top, path, skip_server, **options):
+        self.profile_imports(top)
+        if not skip_server:
+            self.measure_server_start(path)
+
+    def profile_imports(self, top):
+        # -X importtime only sees import statements, not importlib calls, so
+        # import the settings and app configs explicitly before setup()
+        project_apps = [
+            app for app in settings.INSTALLED_APPS if not app.startswith("django.")
+        ]
+        code = "; ".join(
+            [
+                "import django",
+                f"import {os.environ['DJANGO_SETTINGS_MODULE']}",
+                *(f"import {app}.apps" for app in project_apps),
+                "django.setup()",
+            ]
+        )
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+
+        rows = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_us, cumulative_us, module = (
+                part.strip() for part in line.split(":", 1)[1].split("|")
+            )
+            rows.append((int(cumulative_us), int(self_us), module))
+
+        self.stdout.write(f"django.setup() in a fresh interpreter: {elapsed:.0f} ms")
+        project_modules = ("core", *project_apps)
+        self.stdout.write("Project modules (cumulative ms):")
+        for cumulative_us, _, module in rows:
+            name = module.strip()
+            if name.split(".")[0] in project_modules:
+                self.stdout.write(f"  {cumulative_us / 1000:8.1f}  {name}")
+        self.stdout.write(f"Slowest {top} imports (cumulative ms):")
+        for cumulative_us, _, module in sorted(rows, reverse=True)[:top]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f}  {module.strip()}")
+
+    def measure_server_start(self, path):
+        port = _free_port()
+        env = os.environ.copy()
+        env.update(PORT=str(port), GUNICORN_WORKERS="1")
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "core.wsgi"],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            listening = None
+            deadline = started + 60
+            while time.perf_counter() < deadline:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                    listening = time.perf_counter()
+                    break
+                except OSError:
+                    time.sleep(0.01)
+            if listening is None:
+                self.stderr.write("Server did not start within 60 s.")
+                return
+
+            url = f"http://127.0.0.1:{port}{path}"
+            request = urllib.request.Request(url, headers={"Host": "localhost"})
+            first_response = None
+            while time.perf_counter() < deadline:
+                try:
+                    urllib.request.urlopen(request, timeout=5).read()
+                    first_response = time.perf_counter()
+                    break
+                except urllib.error.HTTPError:
+                    first_response = time.perf_counter()
+                    break
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.01)
+
+            self.stdout.write(
+                f"Cold start (spawn to listening): {(listening - started) * 1000:.0f} ms"
+            )
+            if first_response:
+                self.stdout.write(
+                    f"Time to first response: {(first_response - started) * 1000:.0f} ms"
+                )
+        finally:
+            server.terminate()
+            server.wait()
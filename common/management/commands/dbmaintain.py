@@ -0,0 +1,198 @@
+import sqlite3
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone
+
+from failedlogins.models import FailedLogin
+
+STEPS = ("prune", "vacuum", "optimize", "integrity")
+
+
+def _sqlite_aliases():
+    return [
+        alias
+        for alias, options in settings.DATABASES.items()
+        if options["ENGINE"] == "django.db.backends.sqlite3"
+    ]
+
+
+def _pragma(alias, name):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f"PRAGMA {name}")
+        return cursor.fetchone()[0]
+
+
+def _free_bytes(alias):
+    return _pragma(alias, "freelist_count") * _pragma(alias, "page_size")
+
+
+def _file_bytes(alias):
+    return _pragma(alias, "page_count") * _pragma(alias, "page_size")
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the SQLite databases: prune expired sessions and old failed "
+        "logins in batches, reclaim free pages with incremental vacuum, refresh "
+        "planner statistics and check integrity. Every step works in short "
+        "transactions, so it can run against a live database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "steps",
+            nargs="*",
+            help=f"Steps to run (default: all, in the order {', '.join(STEPS)}).",
+        )
+        parser.add_argument(
+            "--time-limit",
+            type=float,
+            default=30,
+            help="Seconds each step may spend per database before stopping.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--failed-login-days",
+            type=int,
+            default=30,
+            help="Delete failed logins older than this.",
+        )
+        parser.add_argument(
+            "--enable-incremental-vacuum",
+            action="store_true",
+            help=(
+                "Switch databases still in auto_vacuum=NONE to INCREMENTAL. "
+                "This needs one full VACUUM, which locks the database while it "
+                "rewrites it: run it in a maintenance window."
+            ),
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run a full ANALYZE instead of PRAGMA optimize.",
+        )
+        parser.add_argument(
+            "--full-integrity-check",
+            action="store_true",
+            help="Run integrity_check (also verifies indexes) not quick_check.",
+        )
+
+    def handle(self, *args, steps, **options):
+        unknown = set(steps) - set(STEPS)
+        if unknown:
+            raise CommandError(f"Unknown steps: {', '.join(sorted(unknown))}.")
+        self.options = options
+        for step in steps or STEPS:
+            for alias in _sqlite_aliases():
+                started = time.perf_counter()
+                free_before = _free_bytes(alias)
+                size_before = _file_bytes(alias)
+                summary = getattr(self, f"run_{step}")(alias)
+                self.stdout.write(
+                    f"[{alias}] {step}: {summary}; "
+                    f"file shrank by {size_before - _file_bytes(alias)} bytes, "
+                    f"free pages {_free_bytes(alias) - free_before:+d} bytes, "
+                    f"{time.perf_counter() - started:.2f} s"
+                )
+
+    def _deadline(self):
+        return time.monotonic() + self.options["time_limit"]
+
+    def _delete_in_batches(self, queryset, deadline):
+        """
+        Delete rows a batch at a time, each batch one
+        `DELETE ... WHERE pk IN (SELECT pk ... LIMIT n)` statement, so the
+        writer lock is taken at once and released between batches. (A
+        SELECT then DELETE in one transaction starts as a reader and can hit
+        SQLITE_BUSY when it upgrades to the writer lock.)
+        """
+        deleted = 0
+        batch = queryset.values("pk")[: self.options["batch_size"]]
+        while time.monotonic() < deadline:
+            count, _ = (
+                queryset.model._base_manager.using(queryset.db)
+                .filter(pk__in=batch)
+                .delete()
+            )
+            if not count:
+                return deleted, True
+            deleted += count
+        return deleted, False
+
+    def run_prune(self, alias):
+        deadline = self._deadline()
+        now = timezone.now()
+        cutoff = now - timedelta(days=self.options["failed_login_days"])
+        results = []
+        for model, queryset in (
+            (Session, Session.objects.filter(expire_date__lt=now)),
+            (FailedLogin, FailedLogin.objects.filter(timestamp__lt=cutoff)),
+        ):
+            if router.db_for_write(model) != alias:
+                continue
+            deleted, done = self._delete_in_batches(queryset.using(alias), deadline)
+            results.append(
+                f"{deleted} {model._meta.verbose_name_plural}"
+                f"{'' if done else ' (time limit reached)'}"
+            )
+        return f"deleted {', '.join(results)}" if results else "nothing to prune"
+
+    def run_vacuum(self, alias):
+        mode = _pragma(alias, "auto_vacuum")  # 0 none, 1 full, 2 incremental
+        if mode == 0:
+            if not self.options["enable_incremental_vacuum"]:
+                return "skipped, auto_vacuum is NONE (see --enable-incremental-vacuum)"
+            with connections[alias].cursor() as cursor:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+            return "switched to incremental auto_vacuum with a full VACUUM"
+        if mode == 1:
+            return "skipped, auto_vacuum is FULL (pages are freed on commit)"
+
+        deadline = self._deadline()
+        free_before = _pragma(alias, "freelist_count")
+        connection = connections[alias]
+        connection.ensure_connection()
+        # A few hundred pages per statement keeps each write lock short
+        while time.monotonic() < deadline and _pragma(alias, "freelist_count"):
+            # executescript() steps the pragma to completion; execute() would
+            # stop after the first page
+            connection.connection.executescript("PRAGMA incremental_vacuum(256)")
+        released = free_before - _pragma(alias, "freelist_count")
+        return f"released {released} free pages"
+
+    def run_optimize(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = 'sqlite_stat1'"
+            )
+            if self.options["analyze"] or not cursor.fetchone():
+                cursor.execute("ANALYZE")
+                return "ran ANALYZE"
+            # Only re-analyzes tables whose statistics went stale; before
+            # 3.46 a fresh connection needs the plain form
+            if sqlite3.sqlite_version_info >= (3, 46):
+                cursor.execute("PRAGMA optimize = 0x10002")
+            else:
+                cursor.execute("PRAGMA optimize")
+        return "ran PRAGMA optimize"
+
+    def run_integrity(self, alias):
+        check = (
+            "integrity_check" if self.options["full_integrity_check"] else "quick_check"
+        )
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f"PRAGMA {check}")
+            problems = [row[0] for row in cursor.fetchall() if row[0] != "ok"]
+        if problems:
+            self.stderr.write(f"[{alias}] {check} found problems:")
+            for problem in problems[:20]:
+                self.stderr.write(f"  {problem}")
+            return f"{check} FAILED ({len(problems)} problems)"
+        return f"{check} ok"
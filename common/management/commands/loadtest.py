@@ -0,0 +1,310 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from common.loadtest import DEFAULT_MIX, parse_mix, run_load
+from notes.models import Directory, Note
+from notes.sharding import shard_for_user, use_shard
+
+USERNAME_PREFIX = "loadtest-"
+ERROR_LOG = os.path.join(settings.BASE_DIR, "logs/django_errors.log")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate users editing notes against a gunicorn started for each "
+        "--workers/--threads combination (or against --url) and report "
+        "throughput, latency percentiles per endpoint and SQLite lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument(
+            "--duration", type=float, default=60, help="Seconds after ramp-up."
+        )
+        parser.add_argument(
+            "--ramp-up",
+            type=float,
+            default=5,
+            help="Seconds over which users log in.",
+        )
+        parser.add_argument(
+            "--mix",
+            type=parse_mix,
+            default=DEFAULT_MIX,
+            help="Action weights, e.g. autosave=6,poll=2,reload=1,switch=1,reorder=0.5",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=1.0,
+            help="Mean seconds between the actions of a user.",
+        )
+        parser.add_argument(
+            "--abusive-users",
+            type=int,
+            default=0,
+            help="Users, among --users, that autosave in a tight loop "
+            "(a runaway tab); not recorded or replayed.",
+        )
+        parser.add_argument(
+            "--abusive-think-time",
+            type=float,
+            default=0.02,
+            help="Mean seconds between the autosaves of an abusive connection.",
+        )
+        parser.add_argument(
+            "--abusive-connections",
+            type=int,
+            default=4,
+            help="Connections each abusive user autosaves on at the same time.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--notes-per-user", type=int, default=30)
+        parser.add_argument("--directories-per-user", type=int, default=5)
+        parser.add_argument("--workers", type=_int_list, default=[2])
+        parser.add_argument("--threads", type=_int_list, default=[2])
+        parser.add_argument(
+            "--url", help="Run against this server instead of starting one."
+        )
+        parser.add_argument("--record", help="Write the actions taken as JSONL.")
+        parser.add_argument("--replay", help="Replay the actions of a recording.")
+        parser.add_argument(
+            "--speed", type=float, default=1.0, help="Replay time scale."
+        )
+        parser.add_argument(
+            "--keep-data",
+            action="store_true",
+            help="Keep the load test users and their notes afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        replay = None
+        if options["replay"]:
+            replay, meta = self._read_recording(options["replay"])
+            for name in ("users", "notes_per_user", "directories_per_user", "seed"):
+                options[name] = meta[name]
+            # Older recordings have no abusive users
+            for name in ("abusive_users", "abusive_think_time", "abusive_connections"):
+                options[name] = meta.get(name, options[name])
+
+        accounts = self.seed(
+            options["users"],
+            options["notes_per_user"],
+            options["directories_per_user"],
+            options["seed"],
+        )
+        try:
+            if options["url"]:
+                configs = [(None, None)]
+            else:
+                configs = list(
+                    itertools.product(options["workers"], options["threads"])
+                )
+            for workers, threads in configs:
+                self.run_config(accounts, workers, threads, replay, options)
+        finally:
+            if not options["keep_data"]:
+                get_user_model().objects.filter(
+                    username__startswith=USERNAME_PREFIX
+                ).delete()
+
+    def seed(self, users, notes_per_user, directories_per_user, seed):
+        """
+        Create fresh users with their own directories and notes; leftovers
+        of an earlier run with --keep-data are replaced.
+        """
+        User = get_user_model()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        password = f"loadtest-{seed}"
+        # Hashing is deliberately slow; every user shares one hash
+        password_hash = make_password(password)
+        accounts = []
+        for index in range(users):
+            # Created one by one so the signals mirror users to their shard
+            user = User.objects.create(
+                username=f"{USERNAME_PREFIX}{index}", password=password_hash
+            )
+            with use_shard(shard_for_user(user.pk)):
+                directories = [
+                    Directory.objects.create(user=user, title=f"Directory {number}")
+                    for number in range(directories_per_user)
+                ]
+                notes = [
+                    Note.objects.create(
+                        user=user,
+                        title=f"Load test note {number}",
+                        content=f"Note {number} of {user.username}.\n",
+                        index=number,
+                        directory=(
+                            directories[number % len(directories)]
+                            if directories and number % 3
+                            else None
+                        ),
+                    )
+                    for number in range(notes_per_user)
+                ]
+            accounts.append(
+                {
+                    "username": user.username,
+                    "password": password,
+                    "note_ids": [note.pk for note in notes],
+                    "directory_ids": [directory.pk for directory in directories],
+                }
+            )
+        return accounts
+
+    def run_config(self, accounts, workers, threads, replay, options):
+        server = None
+        if options["url"]:
+            url = urlsplit(options["url"])
+            address = (url.hostname, url.port or 80)
+            host_header = url.netloc
+            label = options["url"]
+        else:
+            port = _free_port()
+            address = ("127.0.0.1", port)
+            host_header = "localhost"
+            label = f"workers={workers} threads={threads}"
+            server = self.start_server(port, workers, threads)
+
+        errors_before = self._error_log_size()
+        recording = open(options["record"], "w") if options["record"] else None
+        try:
+            if recording:
+                meta = {
+                    name: options[name]
+                    for name in (
+                        "users",
+                        "notes_per_user",
+                        "directories_per_user",
+                        "seed",
+                        "think_time",
+                        "mix",
+                        "abusive_users",
+                        "abusive_think_time",
+                        "abusive_connections",
+                    )
+                }
+                recording.write(json.dumps({"meta": meta}) + "\n")
+            stats = asyncio.run(
+                run_load(
+                    accounts,
+                    address,
+                    host_header,
+                    mix=options["mix"],
+                    duration=options["duration"],
+                    think_time=options["think_time"],
+                    ramp_up=options["ramp_up"],
+                    seed=options["seed"],
+                    replay=replay,
+                    speed=options["speed"],
+                    abusive_users=options["abusive_users"],
+                    abusive_think_time=options["abusive_think_time"],
+                    abusive_connections=options["abusive_connections"],
+                    recorder=(
+                        (lambda event: recording.write(json.dumps(event) + "\n"))
+                        if recording
+                        else None
+                    ),
+                )
+            )
+        finally:
+            if recording:
+                recording.close()
+            if server:
+                server.terminate()
+                server.wait()
+
+        self.stdout.write(f"== {label}, {len(accounts)} users")
+        self.stdout.write(stats.report())
+        server_errors = sum(
+            count
+            for statuses in stats.statuses.values()
+            for status, count in statuses.items()
+            if status >= 500
+        )
+        self.stdout.write(
+            f"  5xx responses: {server_errors}, "
+            f"'database is locked' errors logged: {self._count_locks(errors_before)}"
+        )
+
+    def start_server(self, port, workers, threads):
+        env = os.environ.copy()
+        env.update(
+            PORT=str(port), GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads)
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "core.wsgi"],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.perf_counter() + 60
+        while time.perf_counter() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                return server
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.05)
+        server.terminate()
+        server.wait()
+        raise CommandError("Server did not start within 60 s.")
+
+    @staticmethod
+    def _read_recording(path):
+        events = defaultdict(list)
+        meta = None
+        with open(path) as recording:
+            for line in recording:
+                event = json.loads(line)
+                if "meta" in event:
+                    meta = event["meta"]
+                else:
+                    events[event["user"]].append(event)
+        if meta is None:
+            raise CommandError(f"{path} has no meta line; is it a recording?")
+        return events, meta
+
+    @staticmethod
+    def _error_log_size():
+        try:
+            return os.path.getsize(ERROR_LOG)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _count_locks(offset):
+        # Only the lines written during this run; a rotation starts over
+        try:
+            with open(ERROR_LOG, "rb") as log:
+                if os.path.getsize(ERROR_LOG) >= offset:
+                    log.seek(offset)
+                return sum(line.count(b"database is locked") for line in log)
+        except OSError:
+            return 0
@@ -0,0 +1,61 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger("access")
+
+ACCESS_LOG_SETTINGS = getattr(settings, "ACCESS_LOG_SETTINGS", {})
+
+
+class AccessLogMiddleware:
+    """
+    Log a sampled share of requests with route, status, latency, user id and
+    response size. Errors and slow requests are always logged.
+
+    It runs outside CompressionMiddleware: `bytes` is the body as sent
+    (compressed when `encoding` is set), `uncompressed_bytes` the body the
+    view returned. Both are None for streamed responses, whose size is only
+    known once they have been sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = ACCESS_LOG_SETTINGS.get("SAMPLE_RATE", 0.1)
+        self.slow_request_ms = ACCESS_LOG_SETTINGS.get("SLOW_REQUEST_MS", 500)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        if (
+            response.status_code < 500
+            and latency_ms < self.slow_request_ms
+            and random.random() >= self.sample_rate
+        ):
+            return response
+
+        resolver_match = request.resolver_match
+        user = getattr(request, "user", None)
+        size = None if response.streaming else len(response.content)
+        logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "method": request.method,
+                "route": resolver_match.route if resolver_match else None,
+                "view": resolver_match.view_name if resolver_match else None,
+                "status": response.status_code,
+                "latency_ms": round(latency_ms, 2),
+                "user_id": user.pk if user and user.is_authenticated else None,
+                "bytes": size,
+                "uncompressed_bytes": getattr(response, "uncompressed_size", size),
+                "encoding": response.get("Content-Encoding"),
+                "sample_rate": self.sample_rate,
+            },
+        )
+        return response
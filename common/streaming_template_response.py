@@ -0,0 +1,45 @@
+import itertools
+import secrets
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+# Context variable the templates output where the streamed chunks go
+STREAMED_CONTENT = "streamed_content"
+
+
+def render_split(template, context, request=None):
+    """
+    Render `template` (a name or a loaded template) and return the markup
+    before and after its `{{ streamed_content }}` slot.
+    """
+    if isinstance(template, str):
+        template = get_template(template)
+    marker = mark_safe(f"<!--stream-{secrets.token_hex(8)}-->")
+    rendered = template.render({**context, STREAMED_CONTENT: marker}, request)
+    before, found, after = rendered.partition(marker)
+    if not found:
+        raise ImproperlyConfigured(
+            f"{template.origin.template_name} has no {{{{ {STREAMED_CONTENT} }}}} slot."
+        )
+    return before, after
+
+
+class StreamingTemplateResponse(StreamingHttpResponse):
+    """
+    Render `template_name` around its `{{ streamed_content }}` slot right
+    away, then send the markup `chunks` yields into the slot while the
+    response is being written.
+
+    Everything outside the slot is rendered before the view returns, so
+    messages are consumed and the CSRF cookie is set as with `render()`.
+    Chunks are produced after the middleware has run: they must not use
+    the request, and their querysets must already be bound to a database.
+    """
+
+    def __init__(self, request, template_name, context, chunks, **kwargs):
+        head, tail = render_split(template_name, context, request)
+        kwargs.setdefault("content_type", "text/html; charset=utf-8")
+        super().__init__(itertools.chain([head], chunks, [tail]), **kwargs)
@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 
@@ -10,6 +11,22 @@ register = template.Library()
 CLIENT_COMPONENT_SETTINGS = getattr(settings, "CLIENT_COMPONENT_SETTINGS", {})
 
 
+@functools.cache
+def load_manifest():
+    """Read the Vite manifest once per process; it only changes on deploy."""
+    manifest_path = CLIENT_COMPONENT_SETTINGS.get(
+        "MANIFEST_FILE_PATH", os.path.join(settings.BASE_DIR, "dist", ".vite", "manifest.json")
+    )
+    if not os.path.exists(manifest_path):
+        raise template.TemplateSyntaxError(f"Vite manifest.json not found at {manifest_path}")
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        raise template.TemplateSyntaxError(f"Error loading Vite manifest.json: {str(e)}")
+
+
 @register.simple_tag
 def load_client_components():
     """Load JS & CSS assets dynamically, supporting both Vite Dev Mode and production."""
@@ -19,9 +36,6 @@ def load_client_components():
 
     # **Production Mode Settings**
     client_components_static_url = getattr(settings, "STATIC_URL", "/static/")
-    manifest_path = CLIENT_COMPONENT_SETTINGS.get(
-        "MANIFEST_FILE_PATH", os.path.join(settings.BASE_DIR, "dist", ".vite", "manifest.json")
-    )
     vite_dev_url = CLIENT_COMPONENT_SETTINGS.get("DEV_URL", "http://localhost:5173/")
     client_components_path = CLIENT_COMPONENT_SETTINGS.get("CLIENT_COMPONENTS_PATH", "client_components/")
 
@@ -37,14 +51,7 @@ def load_client_components():
         )
 
     # **If in Production Mode, load from manifest.json**
-    if not os.path.exists(manifest_path):
-        raise template.TemplateSyntaxError(f"Vite manifest.json not found at {manifest_path}")
-
-    try:
-        with open(manifest_path, "r", encoding="utf-8") as f:
-            manifest = json.load(f)
-    except Exception as e:
-        raise template.TemplateSyntaxError(f"Error loading Vite manifest.json: {str(e)}")
+    manifest = load_manifest()
 
     # **Extract JS & CSS files**
     js_files = {k: v for k, v in manifest.items() if k.endswith(".js")}
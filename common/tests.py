@@ -1,3 +1,227 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+import zlib
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from failedlogins.models import FailedLogin
+
+from . import log_handlers
+from .admin_changelists import estimate_row_count
+from .compression import (
+    Brotli,
+    CompressionMiddleware,
+    Gzip,
+    Zstd,
+    brotli,
+    negotiate_codec,
+    zstandard,
+)
+from .log_handlers import (
+    JsonFormatter,
+    NonBlockingRotatingFileHandler,
+    SharedRotatingFileHandler,
+)
+from .middleware import AccessLogMiddleware
+
+
+class NegotiateCodecTests(SimpleTestCase):
+    @skipIf(brotli is None or zstandard is None, "brotli and zstandard needed")
+    def test_brotli_wins_a_tie_with_zstd(self):
+        self.assertEqual(negotiate_codec("gzip, deflate, br, zstd").name, "br")
+        self.assertEqual(negotiate_codec("zstd;q=1, br;q=0.9").name, "zstd")
+
+    def test_nothing_acceptable(self):
+        self.assertIsNone(negotiate_codec("identity, gzip;q=0"))
+
+
+class CompressSequenceTests(SimpleTestCase):
+    """
+    Every chunk must be decodable as soon as it is sent, so streamed pages
+    render while they arrive.
+    """
+
+    chunks = [b"<li>first</li>" * 20, b"<li>second</li>" * 20]
+
+    def assert_flushes_chunks(self, codec, decompressor, padded=False):
+        compressed = codec.compress_sequence(iter(self.chunks))
+        if padded:
+            self.assertEqual(decompressor(next(compressed)), b"")
+        for chunk in self.chunks:
+            self.assertEqual(decompressor(next(compressed)), chunk)
+        decompressor(b"".join(compressed))
+
+    def test_gzip(self):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assert_flushes_chunks(Gzip(), decompressor.decompress)
+
+    @skipIf(brotli is None, "brotli not installed")
+    def test_brotli(self):
+        self.assert_flushes_chunks(Brotli(), brotli.Decompressor().process)
+
+    @skipIf(zstandard is None, "zstandard not installed")
+    def test_zstd(self):
+        # Past the skippable frame padding the stream
+        decompressor = zstandard.ZstdDecompressor().decompressobj(
+            read_across_frames=True
+        )
+        self.assert_flushes_chunks(Zstd(), decompressor.decompress, padded=True)
+
+    def test_gzip_stream_is_complete(self):
+        body = b"".join(Gzip().compress_sequence(iter(self.chunks)))
+        self.assertEqual(gzip.decompress(body), b"".join(self.chunks))
+
+
+class BreachPaddingTests(SimpleTestCase):
+    data = b"<p>csrf and other secrets</p>" * 50
+
+    def assert_sizes_vary(self, compress):
+        self.assertGreater(len({len(compress(self.data)) for _ in range(20)}), 1)
+
+    def test_gzip(self):
+        self.assert_sizes_vary(Gzip().compress)
+        self.assert_sizes_vary(
+            lambda data: b"".join(Gzip().compress_sequence(iter([data])))
+        )
+
+    @skipIf(zstandard is None, "zstandard not installed")
+    def test_zstd(self):
+        self.assert_sizes_vary(Zstd().compress)
+        self.assert_sizes_vary(
+            lambda data: b"".join(Zstd().compress_sequence(iter([data])))
+        )
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(Zstd().compress(self.data)), read_across_frames=True
+        )
+        self.assertEqual(reader.read(), self.data)
+
+
+class AccessLogTests(SimpleTestCase):
+    def log(self, response):
+        middleware = AccessLogMiddleware(
+            CompressionMiddleware(lambda request: response)
+        )
+        middleware.sample_rate = 1
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        with self.assertLogs("access") as logs:
+            middleware(request)
+        (record,) = logs.records
+        return record
+
+    def test_logs_sent_and_uncompressed_sizes(self):
+        record = self.log(HttpResponse(b"x" * 5000))
+        self.assertEqual(record.encoding, "gzip")
+        self.assertEqual(record.uncompressed_bytes, 5000)
+        self.assertLess(record.bytes, 5000)
+
+        record = self.log(HttpResponse(b"x" * 10))
+        self.assertIsNone(record.encoding)
+        self.assertEqual((record.bytes, record.uncompressed_bytes), (10, 10))
+
+    def test_streamed_sizes_are_unknown(self):
+        record = self.log(StreamingHttpResponse(iter([b"x" * 5000])))
+        self.assertEqual(record.encoding, "gzip")
+        self.assertIsNone(record.bytes)
+        self.assertIsNone(record.uncompressed_bytes)
+
+
+class EstimateRowCountTests(TestCase):
+    # Users are mirrored to the note shards when sharding is on
+    databases = "__all__"
+
+    def test_counts_from_the_largest_index(self):
+        User = get_user_model()
+        self.assertIsNone(estimate_row_count(User, "default"))
+        for number in range(3):
+            User.objects.create(username=f"user{number}")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            # A partial index covers fewer rows than the table
+            cursor.execute(
+                "INSERT INTO sqlite_stat1 VALUES (%s, 'partial_idx', '1 1')",
+                [User._meta.db_table],
+            )
+        self.assertEqual(estimate_row_count(User, "default"), 3)
+
+
+class LogHandlerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "app.log"
+
+    def test_processes_rotate_a_shared_file_once(self):
+        children = []
+        for worker in range(3):
+            pid = os.fork()
+            if pid == 0:
+                handler = SharedRotatingFileHandler(
+                    self.path, maxBytes=2000, backupCount=100, delay=True
+                )
+                for number in range(300):
+                    handler.emit(
+                        logging.makeLogRecord(
+                            {"msg": f"{worker} {number:03d} " + "x" * 30}
+                        )
+                    )
+                handler.close()
+                os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+
+        lines = [
+            line
+            for path in self.path.parent.glob("app.log*")
+            if path.suffix != ".lock"
+            for line in path.read_text().splitlines()
+        ]
+        self.assertEqual(len(lines), 900)
+        self.assertEqual(len(set(lines)), 900)
+
+    def test_dropped_records_are_reported(self):
+        handler = NonBlockingRotatingFileHandler(self.path, queueSize=1)
+        handler.setFormatter(JsonFormatter())
+        # Nothing drains the queue, so it holds one record
+        handler.listener.stop()
+        for number in range(3):
+            handler.handle(logging.makeLogRecord({"msg": f"record {number}"}))
+        self.assertEqual(handler.queue.get_nowait().msg, "record 0")
+        handler.close()
+
+        (entry,) = map(json.loads, self.path.read_text().splitlines())
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual(entry["dropped"], 2)
+
+    def test_closed_handlers_are_not_restarted_after_fork(self):
+        handler = NonBlockingRotatingFileHandler(self.path)
+        self.assertIn(handler, log_handlers._handlers)
+        handler.close()
+        self.assertNotIn(handler, log_handlers._handlers)
+
+
+class PruneTests(TestCase):
+    databases = "__all__"
+
+    def test_prunes_old_failed_logins_in_batches(self):
+        FailedLogin.objects.bulk_create(FailedLogin() for _ in range(5))
+        FailedLogin.objects.update(timestamp=timezone.now() - timedelta(days=31))
+        FailedLogin.objects.create()
+
+        output = StringIO()
+        call_command("dbmaintain", "prune", "--batch-size", "2", stdout=output)
+        self.assertIn("5 failed logins;", output.getvalue())
+        self.assertEqual(FailedLogin.objects.count(), 1)
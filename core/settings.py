@@ -42,9 +42,13 @@ INSTALLED_APPS = [
     "customizedusers",
     "notes",
     "failedlogins",
+    "attachments",
+    "backgroundjobs",
 ]
 
 MIDDLEWARE = [
+    "common.middleware.AccessLogMiddleware",
+    "common.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -52,6 +56,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.auth.middleware.LoginRequiredMiddleware",
+    "notes.sharding.UserShardMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -69,6 +74,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "notes.selection.selected_note",
             ],
         },
     },
@@ -86,6 +92,16 @@ DATABASES = {
     }
 }
 
+# Optional: spread notes over N SQLite files, one writer lock each
+# (see notes/sharding.py and `manage.py migrate_shards`)
+NOTE_SHARD_COUNT = int(os.getenv("NOTE_SHARD_COUNT", 0))
+for shard_index in range(NOTE_SHARD_COUNT):
+    DATABASES[f"shard_{shard_index}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "shards" / f"shard_{shard_index}.sqlite3",
+    }
+DATABASE_ROUTERS = ["notes.sharding.UserShardRouter"] if NOTE_SHARD_COUNT else []
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -136,11 +152,24 @@ STORAGES = {
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "json": {
+            "()": "common.log_handlers.JsonFormatter",
+        },
+    },
     "handlers": {
         "file": {
             "level": "ERROR",
-            "class": "logging.FileHandler",
+            "class": "common.log_handlers.NonBlockingRotatingFileHandler",
             "filename": os.path.join(BASE_DIR, "logs/django_errors.log"),
+            "formatter": "json",
+        },
+        "access": {
+            "level": "INFO",
+            "class": "common.log_handlers.NonBlockingRotatingFileHandler",
+            "filename": os.path.join(BASE_DIR, "logs/access.log"),
+            "maxBytes": 50 * 1024 * 1024,
+            "formatter": "json",
         },
     },
     "loggers": {
@@ -149,9 +178,27 @@ LOGGING = {
             "level": "ERROR",
             "propagate": True,
         },
+        "access": {
+            "handlers": ["access"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
+ACCESS_LOG_SETTINGS = {
+    "SAMPLE_RATE": float(os.getenv("ACCESS_LOG_SAMPLE_RATE", 0.1)),
+    "SLOW_REQUEST_MS": 500,
+}
+
+COMPRESSION_SETTINGS = {
+    "MIN_SIZE": 1024,
+    "BROTLI_QUALITY": 4,
+    "ZSTD_LEVEL": 3,
+    # Unlike gzip and zstd, br responses carry no padding against BREACH
+    "BROTLI": True,
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "customizedusers.CustomizedUser"
 LOGIN_REDIRECT_URL = "notes:note_list"
@@ -162,6 +209,30 @@ X_FRAME_OPTIONS = "DENY"
 CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SECURE = True
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Admission buckets shared by every gunicorn worker; opt in with
+    # ADMISSION_CACHE=admission (see notes/admission.py for the trade-off)
+    "admission": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "admission",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+NOTE_SETTINGS = {
+    "MAX_NOTE_SIZE": int(os.getenv("MAX_NOTE_SIZE", 10 * 1024 * 1024)),
+    "STREAMING_THRESHOLD": 256 * 1024,
+    "ADMISSION_CACHE": os.getenv("ADMISSION_CACHE", "default"),
+}
+
+ATTACHMENT_SETTINGS = {
+    "STORAGE_ROOT": BASE_DIR / "attachments_store",
+    "MAX_SIZE": 50 * 1024 * 1024,
+}
+
 CLIENT_COMPONENT_SETTINGS = {
     "MANIFEST_FILE_PATH": "client_components__dist/.vite/manifest.json",
     "CLIENT_COMPONENTS_PATH": "client_components/",
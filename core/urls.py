@@ -25,4 +25,9 @@ urlpatterns = [
     path("", RedirectView.as_view(url=reverse_lazy("notes:note_list"), permanent=True)),
     path("notes/", include("notes.urls", namespace="notes")),
     path("api/v1/notes/", include("notes.urls_api", namespace="notes_api")),
+    path(
+        "api/v1/notes/",
+        include("attachments.urls_api", namespace="attachments_api"),
+    ),
+    path("attachments/", include("attachments.urls", namespace="attachments")),
 ]
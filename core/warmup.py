@@ -0,0 +1,56 @@
+"""
+Warm-up run before a server process accepts traffic.
+
+With gunicorn's preload_app this runs once in the master, so every forked
+worker starts with the URLconf, views, compiled templates and asset manifest
+already in memory.
+"""
+
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template import TemplateSyntaxError, engines
+from django.template.loaders.app_directories import get_app_template_dirs
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def _template_names(directory):
+    for path in directory.rglob("*.html"):
+        yield path.relative_to(directory).as_posix()
+
+
+def warm_up():
+    started = time.perf_counter()
+
+    # Importing the URLconf imports every view module
+    get_resolver()._populate()
+
+    # Compile every project template into the cached loader
+    template_count = 0
+    engine = engines["django"]
+    template_dirs = [Path(d) for d in engine.engine.dirs]
+    template_dirs += get_app_template_dirs("templates")
+    for directory in template_dirs:
+        for name in _template_names(directory):
+            engine.get_template(name)
+            template_count += 1
+
+    if not settings.DEBUG:
+        from common.templatetags.client_components_integration import load_manifest
+
+        try:
+            load_manifest()
+        except TemplateSyntaxError as e:
+            # Pages will report it on render; do not keep the server down
+            logger.warning("Could not preload the asset manifest: %s", e)
+
+    logger.info(
+        "Warm-up compiled %s templates in %.1f ms",
+        template_count,
+        (time.perf_counter() - started) * 1000,
+    )
+    return template_count
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customizedusers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customizeduser',
+            name='notes_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.db import models
+from django.utils import timezone
 
 
 class CustomizedUser(AbstractUser):
-    pass
\ No newline at end of file
+    # Bumped whenever the user's notes list or directories change, so polls
+    # can be answered with 304 without querying notes
+    notes_modified = models.DateTimeField(default=timezone.now, editable=False)
@@ -1,9 +1,24 @@
-from django.apps import AppConfig
+from django.contrib import admin
 
+from common.admin_changelists import FastChangeListMixin
+from .models import FailedLogin
 
-class MyAppConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'myapp'
 
-    def ready(self):
-        pass
+@admin.register(FailedLogin)
+class FailedLoginAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ("timestamp", "provided_username", "user")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    date_hierarchy = "timestamp"
+    ordering = ("-timestamp",)
+    sortable_by = ("timestamp",)
+    search_fields = ("provided_username",)
+    search_help_text = "Username prefix (case-sensitive)."
+    prefix_search_fields = {"provided_username": str}
+    actions = ("delete_matching",)
+
+    @admin.action(description="Delete selected failed logins (one statement)")
+    def delete_matching(self, request, queryset):
+        # No signals or cascades: Django issues a single DELETE
+        deleted, _ = queryset.delete()
+        self.message_user(request, f"Deleted {deleted} failed logins.")
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('failedlogins', '0003_failedlogin_provided_username'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='failedlogin',
+            index=models.Index(fields=['timestamp'], name='failedlogin_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='failedlogin',
+            index=models.Index(
+                fields=['provided_username'], name='failedlogin_username_idx'
+            ),
+        ),
+    ]
@@ -10,3 +10,9 @@ class FailedLogin(models.Model):
     )
     provided_username = models.CharField(max_length=255, null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["timestamp"], name="failedlogin_timestamp_idx"),
+            models.Index(fields=["provided_username"], name="failedlogin_username_idx"),
+        ]
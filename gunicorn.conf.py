@@ -0,0 +1,60 @@
+"""
+Production server configuration.
+
+    gunicorn -c gunicorn.conf.py core.wsgi
+
+Every setting can be overridden through the GUNICORN_* environment variables
+below.
+
+Graceful reload: SIGHUP replaces the workers without dropping requests, but
+with preload_app they fork from the already loaded master, so it does not
+pick up new code. To deploy code, send SIGUSR2 (starts a new master with the
+new code next to the old one), then SIGWINCH and SIGQUIT to the old master
+once the new one is serving.
+"""
+
+import multiprocessing
+import os
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# SQLite serializes writers, so a few processes with a couple of threads each
+# beat many processes fighting for the write lock
+workers = int(
+    os.getenv("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8))
+)
+threads = int(os.getenv("GUNICORN_THREADS", 2))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Load Django in the master once; workers fork with everything imported
+preload_app = True
+
+# Recycle workers to cap slow memory growth; jitter avoids restarting all
+# workers at the same moment
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+_started = time.perf_counter()
+
+
+def when_ready(server):
+    """
+    Runs in the master after the app is preloaded and before any worker is
+    forked, so the warm-up is shared with every worker.
+    """
+    from core.warmup import warm_up
+
+    warm_up()
+    server.log.info("Server ready in %.1f ms", (time.perf_counter() - _started) * 1000)
+
+
+def post_fork(server, worker):
+    # Never share database connections opened in the master with workers
+    from django.db import connections
+
+    connections.close_all()
@@ -1,12 +1,77 @@
 from django.contrib import admin
-from .models import Directory, Note
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from common.admin_changelists import FastChangeListMixin
+from .counters import move_note_counters
+from .models import Directory, Note, normalize_title
+from .sharding import ShardedModelAdminMixin
 
 
 @admin.register(Directory)
-class DirectoryAdmin(admin.ModelAdmin):
-    list_display = ("title", "index", "created", "modified")
+class DirectoryAdmin(ShardedModelAdminMixin, admin.ModelAdmin):
+    list_display = (
+        "title",
+        "user",
+        "parent",
+        "index",
+        "note_count",
+        "created",
+        "modified",
+    )
+    list_select_related = ("user", "parent")
+    raw_id_fields = ("user", "parent")
+    readonly_fields = ("note_count", "note_bytes", "notes_modified")
+
+    def delete_queryset(self, request, queryset):
+        # Directory.delete moves each subtree's counters to the unassigned notes
+        for directory in queryset:
+            directory.delete()
 
 
 @admin.register(Note)
-class NoteAdmin(admin.ModelAdmin):
-    list_display = ("title", "directory", "index", "created", "modified")
+class NoteAdmin(ShardedModelAdminMixin, FastChangeListMixin, admin.ModelAdmin):
+    list_display = (
+        "title",
+        "user",
+        "directory",
+        "type",
+        "index",
+        "created",
+        "modified",
+    )
+    list_select_related = ("user", "directory")
+    raw_id_fields = ("user", "directory")
+    list_filter = ("type",)
+    date_hierarchy = "created"
+    ordering = ("-created",)
+    sortable_by = ("created",)
+    search_fields = ("normalized_title",)
+    search_help_text = "Title prefix."
+    prefix_search_fields = {"normalized_title": normalize_title}
+    actions = ("enable_notes", "disable_notes", "unassign_directory")
+
+    def _bulk_update(self, request, queryset, message, **values):
+        # One UPDATE for the owners' notes list stamps (before the change
+        # can move notes out of the filtered queryset), one for the notes
+        with transaction.atomic(using=queryset.db):
+            get_user_model().objects.filter(
+                pk__in=queryset.values("user_id").distinct()
+            ).update(notes_modified=timezone.now())
+            if "directory" in values:
+                move_note_counters(queryset, values["directory"])
+            updated = queryset.update(**values)
+        self.message_user(request, message.format(updated))
+
+    @admin.action(description="Enable selected notes")
+    def enable_notes(self, request, queryset):
+        self._bulk_update(request, queryset, "Enabled {} notes.", enabled=True)
+
+    @admin.action(description="Disable selected notes")
+    def disable_notes(self, request, queryset):
+        self._bulk_update(request, queryset, "Disabled {} notes.", enabled=False)
+
+    @admin.action(description="Move selected notes out of their directory")
+    def unassign_directory(self, request, queryset):
+        self._bulk_update(request, queryset, "Unassigned {} notes.", directory=None)
@@ -0,0 +1,139 @@
+"""
+Admission control for the note API: token buckets per user and per note,
+plus a cap on each user's in-flight writes. Over the limit, requests get
+429 with a Retry-After header instead of queueing for a worker and the
+SQLite writer lock.
+
+State lives in the Django cache named by NOTE_SETTINGS["ADMISSION_CACHE"].
+The default local-memory cache is per process: every gunicorn worker keeps
+its own buckets, so the limits are multiplied by the number of workers a
+user's requests reach. Each keep-alive connection stays with one worker,
+so that only happens when a user's requests spread over connections. The
+file-based "admission" cache in settings is shared by all workers, at the
+cost of file reads and writes on every request; under load it roughly
+doubled the latency of other users' autosaves (see `manage.py loadtest
+--abusive-users`). Buckets are updated with a get then a set, atomic only
+among the threads of a process.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+NOTE_SETTINGS = getattr(settings, "NOTE_SETTINGS", {})
+
+# Requests per second (and burst) a user may make to guarded endpoints
+USER_RATE = NOTE_SETTINGS.get("USER_REQUEST_RATE", 10)
+USER_BURST = NOTE_SETTINGS.get("USER_REQUEST_BURST", 30)
+# Writes per second (and burst) to a single note
+NOTE_WRITE_RATE = NOTE_SETTINGS.get("NOTE_WRITE_RATE", 2)
+NOTE_WRITE_BURST = NOTE_SETTINGS.get("NOTE_WRITE_BURST", 10)
+# Writes of one user being processed at the same time
+MAX_WRITES_IN_FLIGHT = NOTE_SETTINGS.get("MAX_WRITES_IN_FLIGHT", 2)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_bucket_lock = threading.Lock()
+
+
+def _cache():
+    return caches[NOTE_SETTINGS.get("ADMISSION_CACHE", "default")]
+
+
+def take_token(key, rate, burst):
+    """
+    Take one token from the bucket `key`. Return 0 when admitted, otherwise
+    the seconds until a token is available.
+    """
+    cache = _cache()
+    now = time.time()
+    with _bucket_lock:
+        tokens, updated = cache.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            cache.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+            return (1 - tokens) / rate
+        cache.set(key, (tokens - 1, now), timeout=math.ceil(burst / rate) + 1)
+    return 0
+
+
+class WriteSlot:
+    """
+    Count one of the user's in-flight writes for the duration of a block.
+    """
+
+    # Stale counters (a worker killed mid-write) expire on their own
+    TIMEOUT = 60
+
+    def __init__(self, user_id):
+        self.key = f"admission:writes:{user_id}"
+
+    def acquire(self):
+        cache = _cache()
+        cache.add(self.key, 0, timeout=self.TIMEOUT)
+        try:
+            in_flight = cache.incr(self.key)
+        except ValueError:  # Expired between add() and incr()
+            cache.add(self.key, 1, timeout=self.TIMEOUT)
+            in_flight = 1
+        if in_flight > MAX_WRITES_IN_FLIGHT:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        try:
+            _cache().decr(self.key)
+        except ValueError:
+            pass
+
+
+def _too_many_requests_response(retry_after):
+    response = JsonResponse(
+        {"status": "error", "message": "Too many requests, retry later."},
+        status=429,
+    )
+    response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admission_controlled(view):
+    """
+    Guard a note API view: every request spends a token from the user's
+    bucket; writes also spend one from the note's bucket and hold a write
+    slot while the view runs.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user_id = request.user.pk
+        retry_after = take_token(f"admission:user:{user_id}", USER_RATE, USER_BURST)
+        if retry_after:
+            return _too_many_requests_response(retry_after)
+        if request.method in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+
+        note_id = kwargs.get("id")
+        if note_id is not None:
+            retry_after = take_token(
+                f"admission:note:{user_id}:{note_id}",
+                NOTE_WRITE_RATE,
+                NOTE_WRITE_BURST,
+            )
+            if retry_after:
+                return _too_many_requests_response(retry_after)
+
+        slot = WriteSlot(user_id)
+        if not slot.acquire():
+            return _too_many_requests_response(1)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            slot.release()
+
+    return wrapper
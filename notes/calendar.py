@@ -0,0 +1,112 @@
+import calendar
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db.models import Count, Q
+
+from .models import MAX_DATE_RANGE_DAYS, Note
+
+# Windows up to this many days also return note stubs, not just counts
+MAX_STUB_WINDOW_DAYS = 62
+MAX_WINDOW_DAYS = 366
+# Windows stay clear of date.min and date.max, so walking the days of a
+# window never steps out of range
+MIN_WINDOW_DATE = date(2, 1, 1)
+MAX_WINDOW_DATE = date(9998, 12, 31)
+
+
+def parse_window(params):
+    """
+    Resolve `start`/`end` (ISO dates, inclusive) or `year` with an optional
+    `month` into a (start, end) pair. Raises ValueError on bad input.
+    """
+    if params.get("start") and params.get("end"):
+        start = date.fromisoformat(params["start"])
+        end = date.fromisoformat(params["end"])
+    elif params.get("year"):
+        year = int(params["year"])
+        if params.get("month"):
+            month = int(params["month"])
+            start = date(year, month, 1)
+            end = date(year, month, calendar.monthrange(year, month)[1])
+        else:
+            start, end = date(year, 1, 1), date(year, 12, 31)
+    else:
+        raise ValueError("Provide start and end, or year (and month).")
+
+    if start < MIN_WINDOW_DATE or end > MAX_WINDOW_DATE:
+        raise ValueError(
+            f"The window must lie between {MIN_WINDOW_DATE.year} and "
+            f"{MAX_WINDOW_DATE.year}."
+        )
+    if end < start:
+        raise ValueError("End cannot be before start.")
+    if (end - start).days >= MAX_WINDOW_DAYS:
+        raise ValueError(f"The window cannot exceed {MAX_WINDOW_DAYS} days.")
+    return start, end
+
+
+def _days_in_window(first, last, start, end):
+    day, last = max(first, start), min(last, end)
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def calendar_summary(user, start, end):
+    """
+    Per-day counts of the user's enabled dated notes overlapping the window,
+    plus note stubs for short windows. Runs a single range query over the
+    calendar index; date ranges are expanded in Python.
+    """
+    # Ranges are capped at MAX_DATE_RANGE_DAYS, so anything overlapping the
+    # window starts within that many days before it; the end dates are
+    # checked on the index before any row is read
+    notes = Note.objects.filter(
+        Q(end_date__gte=start) | Q(end_date__isnull=True, date__gte=start),
+        user=user,
+        enabled=True,
+        date__gte=date.fromordinal(
+            max(start.toordinal() - MAX_DATE_RANGE_DAYS, date.min.toordinal())
+        ),
+        date__lte=end,
+    )
+
+    day_counts = Counter()
+    stubs = None
+    if (end - start).days < MAX_STUB_WINDOW_DAYS:
+        stubs = []
+        for note_id, title, note_type, first, last in notes.order_by(
+            "date", "title"
+        ).values_list("id", "title", "type", "date", "end_date"):
+            last = last or first
+            day_counts.update(_days_in_window(first, last, start, end))
+            stubs.append(
+                {
+                    "note_id": note_id,
+                    "note_title": title,
+                    "note_type": note_type,
+                    "date": first.isoformat(),
+                    "end_date": last.isoformat(),
+                }
+            )
+    else:
+        # Year views only need counts: group in SQL, off the covering index
+        for first, last, count in (
+            notes.values("date", "end_date")
+            .annotate(count=Count("id"))
+            .values_list("date", "end_date", "count")
+            .order_by()
+        ):
+            last = last or first
+            for day in _days_in_window(first, last, start, end):
+                day_counts[day] += count
+
+    result = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": {day.isoformat(): count for day, count in sorted(day_counts.items())},
+    }
+    if stubs is not None:
+        result["notes"] = stubs
+    return result
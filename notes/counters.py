@@ -0,0 +1,103 @@
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Directory, Note, UnassignedNotes
+
+
+def apply_note_delta(user_id, directory_id, count, size, using, create=False):
+    """
+    Add `count` notes of `size` bytes to the counters of `directory_id`, or
+    of the user's unassigned notes when it is None. The user's row is only
+    created with `create`, never while the user may be being deleted.
+    """
+    changes = {
+        # Clamped so that drift never fails a save; reconciling repairs it
+        "note_count": Greatest(F("note_count") + count, Value(0)),
+        "note_bytes": Greatest(F("note_bytes") + size, Value(0)),
+        "notes_modified": timezone.now(),
+    }
+    if directory_id is not None:
+        Directory.objects.using(using).filter(pk=directory_id).update(**changes)
+        return
+    rows = UnassignedNotes.objects.using(using).filter(user_id=user_id)
+    if not rows.update(**changes) and create:
+        UnassignedNotes.objects.using(using).bulk_create(
+            [UnassignedNotes(user_id=user_id)], ignore_conflicts=True
+        )
+        rows.update(**changes)
+
+
+def read_locked(rows, *fields):
+    """
+    Take the write lock of the database holding `rows`, then read `fields`
+    of its first row (None when there is none). Inside a transaction, what
+    was read cannot change until it ends.
+    """
+    # SQLite has no row locks; a no-op UPDATE takes the database's, which
+    # a plain read in a deferred transaction would not
+    rows.update(**{fields[0]: F(fields[0])})
+    return rows.values_list(*fields).first()
+
+
+def unassign_directory_counters(directories):
+    """
+    Move the counters of the `directories` queryset to their users'
+    unassigned notes, ahead of a delete whose SET_NULL bypasses Note.save.
+    """
+    # Take the write lock first, as read_locked does, so the counters cannot
+    # change before the delete
+    directories.update(note_count=F("note_count"))
+    groups = (
+        directories.values("user_id")
+        .annotate(count=Sum("note_count"), size=Sum("note_bytes"))
+        .order_by()
+    )
+    for group in groups:
+        if group["count"]:
+            apply_note_delta(
+                group["user_id"],
+                None,
+                group["count"],
+                group["size"],
+                directories.db,
+                create=True,
+            )
+
+
+def move_note_counters(notes, directory_id):
+    """
+    Move the counters of the `notes` queryset to `directory_id` (None for
+    unassigned) ahead of a bulk update that bypasses Note.save.
+    """
+    groups = (
+        notes.exclude(directory_id=directory_id)
+        .values("user_id", "directory_id")
+        .annotate(count=Count("pk"), size=Sum("size"))
+        .order_by()
+    )
+    for group in groups:
+        count, size = group["count"], group["size"] or 0
+        apply_note_delta(
+            group["user_id"], group["directory_id"], -count, -size, notes.db
+        )
+        apply_note_delta(
+            group["user_id"], directory_id, count, size, notes.db, create=True
+        )
+
+
+def expected_note_counters(using):
+    """
+    Counters recomputed from the notes, keyed by (user_id, directory_id).
+    """
+    return {
+        (row["user_id"], row["directory_id"]): (
+            row["count"],
+            row["size"] or 0,
+            row["modified"],
+        )
+        for row in Note.objects.using(using)
+        .values("user_id", "directory_id")
+        .annotate(count=Count("pk"), size=Sum("size"), modified=Max("modified"))
+        .order_by()
+    }
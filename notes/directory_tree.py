@@ -0,0 +1,32 @@
+from collections import defaultdict
+
+
+def build_directory_tree(directories):
+    """
+    Order a flat list of directories depth-first (siblings keep their incoming
+    order) and annotate each one with `depth` and a slash-separated `path_title`.
+
+    Works on a single fetched list, so rendering a deep tree never issues a
+    query per level.
+    """
+    directories = list(directories)
+    known_ids = {directory.id for directory in directories}
+    children = defaultdict(list)
+    for directory in directories:
+        parent_id = directory.parent_id if directory.parent_id in known_ids else None
+        children[parent_id].append(directory)
+
+    ordered = []
+    stack = [(directory, 0, "") for directory in reversed(children[None])]
+    while stack:
+        directory, depth, parent_path = stack.pop()
+        directory.depth = depth
+        directory.path_title = (
+            f"{parent_path} / {directory.title}" if parent_path else directory.title
+        )
+        ordered.append(directory)
+        stack.extend(
+            (child, depth + 1, directory.path_title)
+            for child in reversed(children[directory.id])
+        )
+    return ordered
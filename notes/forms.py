@@ -1,15 +1,34 @@
 from django import forms
 from django.core.exceptions import ValidationError
 import re
-from .models import Note, Directory
+from .models import Note, Directory, normalize_title
 
 LOCAL_NOTE_NAME = "local~note"
 
 
+def clean_note_title(title, user, instance):
+    if not re.match(r"^[A-Za-z0-9   \s\-_]+$", title):
+        raise ValidationError(
+            "Title can only contain letters, dashes, underscores, and spaces."
+        )
+
+    if title.lower() == LOCAL_NOTE_NAME:
+        raise ValidationError(f"Title cannot be '{LOCAL_NOTE_NAME}'.")
+
+    # A single probe of the (user, normalized_title) unique index
+    qs = Note.objects.filter(user=user, normalized_title=normalize_title(title))
+    if instance.pk:
+        qs = qs.exclude(pk=instance.pk)
+    if qs.exists():
+        raise ValidationError("Note title must be unique.")
+
+    return title
+
+
 class NoteForm(forms.ModelForm):
     class Meta:
         model = Note
-        fields = ["title", "type", "directory"]
+        fields = ["title", "type", "directory", "date", "end_date"]
 
     title = forms.CharField(
         max_length=250,
@@ -28,27 +47,34 @@ class NoteForm(forms.ModelForm):
         widget=forms.Select(attrs={"class": "form-element"}),
     )
 
-    def clean_title(self):
-        title = self.cleaned_data.get("title")
-
-        if not re.match(r"^[A-Za-z0-9   \s\-_]+$", title):
-            raise ValidationError(
-                "Title can only contain letters, dashes, underscores, and spaces."
-            )
+    date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"class": "form-element", "type": "date"}),
+    )
 
-        if title.lower() == LOCAL_NOTE_NAME:
-            raise ValidationError(f"Title cannot be '{LOCAL_NOTE_NAME}'.")
+    end_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"class": "form-element", "type": "date"}),
+    )
 
-        qs = Note.objects.filter(title=title)
-        if self.instance.pk:
-            qs = qs.exclude(pk=self.instance.pk)
-        if qs.exists():
-            raise ValidationError("Note title must be unique.")
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        if user is not None:
+            self.fields["directory"].queryset = Directory.objects.filter(user=user)
 
-        return title
+    def clean_title(self):
+        return clean_note_title(
+            self.cleaned_data.get("title"), self.user, self.instance
+        )
 
 
 class RenameNoteForm(forms.ModelForm):
+    rewrite_links = forms.BooleanField(
+        required=False,
+        label="Update [[links]] to this note in other notes",
+    )
+
     class Meta:
         model = Note
         fields = ["title"]
@@ -57,20 +83,6 @@ class RenameNoteForm(forms.ModelForm):
         }
 
     def clean_title(self):
-        title = self.cleaned_data.get("title")
-
-        if not re.match(r"^[A-Za-z0-9   \s\-_]+$", title):
-            raise ValidationError(
-                "Title can only contain letters, dashes, underscores, and spaces."
-            )
-
-        if title.lower() == LOCAL_NOTE_NAME:
-            raise ValidationError(f"Title cannot be '{LOCAL_NOTE_NAME}'.")
-
-        qs = Note.objects.filter(title=title)
-        if self.instance.pk:
-            qs = qs.exclude(pk=self.instance.pk)
-        if qs.exists():
-            raise ValidationError("Note title must be unique.")
-
-        return title
+        return clean_note_title(
+            self.cleaned_data.get("title"), self.instance.user_id, self.instance
+        )
@@ -0,0 +1,207 @@
+import codecs
+import io
+import json
+import re
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from common.api_json_response import (
+    COMPACT_JSON_CONTENT_TYPE,
+    COMPACT_KEYS,
+    shorten_keys,
+    wants_compact_json,
+)
+
+from .models import Note
+
+NOTE_SETTINGS = getattr(settings, "NOTE_SETTINGS", {})
+
+# Upper bound, in bytes, of a note upload body (JSON or raw text)
+MAX_NOTE_SIZE = NOTE_SETTINGS.get("MAX_NOTE_SIZE", 10 * 1024 * 1024)
+# Notes larger than this are streamed instead of serialized in one piece
+STREAMING_THRESHOLD = NOTE_SETTINGS.get("STREAMING_THRESHOLD", 256 * 1024)
+# Bytes pulled from the database (and read from the request) at a time
+CHUNK_SIZE = NOTE_SETTINGS.get("CHUNK_SIZE", 256 * 1024)
+
+# Address space SQLite may map while streaming a note (PRAGMA mmap_size).
+# Every slice reopens the note's BLOB, which walks its overflow pages from
+# the start; mapped pages make that walk cheap instead of a read() per page
+STREAMING_MMAP_SIZE = NOTE_SETTINGS.get("STREAMING_MMAP_SIZE", 256 * 1024 * 1024)
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class NoteTooLarge(Exception):
+    pass
+
+
+class NoteChanged(Exception):
+    pass
+
+
+def declared_size_exceeds_limit(request, limit=MAX_NOTE_SIZE):
+    """
+    Check the Content-Length header so oversize uploads are rejected before a
+    single byte of the body is read.
+    """
+    try:
+        return int(request.META.get("CONTENT_LENGTH") or 0) > limit
+    except ValueError:
+        return False
+
+
+def read_body(request, limit=MAX_NOTE_SIZE):
+    """
+    Read the request body chunk by chunk, giving up as soon as it exceeds
+    `limit` (covers bodies without a Content-Length header).
+    """
+    buffer = io.BytesIO()
+    while chunk := request.read(CHUNK_SIZE):
+        buffer.write(chunk)
+        if buffer.tell() > limit:
+            raise NoteTooLarge()
+    return buffer.getvalue()
+
+
+def read_text_body(request, limit=MAX_NOTE_SIZE):
+    """
+    Decode a text/plain body incrementally so the raw bytes are never held
+    alongside the decoded string.
+    """
+    decoder = codecs.getincrementaldecoder(request.encoding or "utf-8")()
+    buffer = io.StringIO()
+    size = 0
+    while chunk := request.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > limit:
+            raise NoteTooLarge()
+        buffer.write(decoder.decode(chunk))
+    buffer.write(decoder.decode(b"", final=True))
+    return buffer.getvalue()
+
+
+def iter_content_bytes(note, start=0, end=None):
+    """
+    Yield the UTF-8 bytes of a note's content between `start` and `end`
+    (inclusive), reading one CHUNK_SIZE slice from the database at a time.
+
+    Each slice is read in its own short transaction, so autosaves are not
+    held off while a slow client downloads. Raises NoteChanged when the note
+    is saved or deleted mid-stream rather than send a body mixing two
+    versions; the server then drops the connection before the body ends.
+    """
+    # Streams are read after UserShardMiddleware has returned, so stay on
+    # the database the note was loaded from
+    using = note._state.db
+    queryset = Note.objects.using(using).filter(pk=note.pk)
+    modified = note.modified
+    connection = connections[using]
+    connection.ensure_connection()
+    connection.connection.execute(f"PRAGMA mmap_size = {STREAMING_MMAP_SIZE}")
+    position = start
+    while end is None or position <= end:
+        length = CHUNK_SIZE if end is None else min(CHUNK_SIZE, end - position + 1)
+        with transaction.atomic(using=using):
+            if queryset.values_list("modified", flat=True).first() != modified:
+                raise NoteChanged()
+            chunk = _read_content_slice(connection, note.pk, position, length)
+        if not chunk:
+            return
+        yield chunk
+        position += len(chunk)
+
+
+def _read_content_slice(connection, pk, position, length):
+    # SQLite's incremental BLOB I/O reads the stored UTF-8 bytes of the TEXT
+    # value at an offset; SUBSTR would copy the whole value for every slice
+    with connection.connection.blobopen(
+        Note._meta.db_table, "content", pk, readonly=True
+    ) as blob:
+        if position >= len(blob):
+            return b""
+        blob.seek(position)
+        return blob.read(length)
+
+
+def iter_note_json(note, compact=False):
+    """
+    Yield the notes_detail_ajax GET payload piece by piece, as plain or
+    compact JSON; `note` must be loaded without its content.
+    """
+    data = {
+        "status": "ok",
+        "result": {"note_title": note.title, "note_type": note.type},
+    }
+    dumps_params = {"separators": (",", ":"), "ensure_ascii": False} if compact else {}
+    item_separator, key_separator = dumps_params.get("separators", (", ", ": "))
+    result_key, content_key = "result", "note_content"
+    if compact:
+        data = shorten_keys(data)
+        result_key, content_key = COMPACT_KEYS[result_key], COMPACT_KEYS[content_key]
+    head = json.dumps(data, **dumps_params)
+    # Splice the content in as the first key of "result"
+    opening = json.dumps(result_key) + key_separator + "{"
+    split_at = head.index(opening) + len(opening)
+    yield head[:split_at] + json.dumps(content_key) + key_separator + '"'
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in iter_content_bytes(note):
+        yield json.dumps(decoder.decode(chunk), **dumps_params)[1:-1]
+    yield json.dumps(decoder.decode(b"", final=True), **dumps_params)[1:-1]
+    yield '"' + item_separator + head[split_at:]
+
+
+def streaming_note_json_response(request, note):
+    """
+    Stream `note` in the JSON format the request negotiated, as
+    ApiJsonResponse would send it.
+    """
+    compact = wants_compact_json(request)
+    response = StreamingHttpResponse(
+        iter_note_json(note, compact),
+        content_type=COMPACT_JSON_CONTENT_TYPE if compact else "application/json",
+    )
+    patch_vary_headers(response, ("Accept",))
+    return response
+
+
+def ranged_content_response(request, note):
+    """
+    Serve a note's raw content as text/plain, honouring a single
+    `Range: bytes=` request. `note.size` holds the content length in bytes.
+    """
+    total = note.size
+    start, end = 0, total - 1
+
+    match = RANGE_RE.match(request.headers.get("Range", "").strip())
+    if match and (match[1] or match[2]):
+        if match[1]:
+            start = int(match[1])
+            end = min(int(match[2]), total - 1) if match[2] else total - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(total - int(match[2]), 0)
+        if start >= total or start > end:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{total}"
+            return response
+        status = 206
+    else:
+        status = 200
+
+    if total == 0:
+        response = HttpResponse(b"", content_type="text/plain; charset=utf-8")
+    else:
+        response = StreamingHttpResponse(
+            iter_content_bytes(note, start, end),
+            status=status,
+            content_type="text/plain; charset=utf-8",
+        )
+    response["Content-Length"] = str(max(end - start + 1, 0))
+    response["Accept-Ranges"] = "bytes"
+    if status == 206:
+        response["Content-Range"] = f"bytes {start}-{end}/{total}"
+    return response
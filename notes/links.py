@@ -0,0 +1,140 @@
+import re
+
+from django.db import transaction
+
+from .models import Note, NoteLink, normalize_title
+
+# [[Title]] or [[Title|label]]
+TITLE_LINK_RE = re.compile(r"\[\[([^\[\]|\n]+)(\|[^\[\]\n]*)?\]\]")
+# /notes/<id>/... and ?note=<id> (the notes list with a note selected)
+NOTE_URL_RES = (
+    re.compile(r"/notes/(\d+)/"),
+    re.compile(r"/notes/\?(?:[^\s#]*&)?note=(\d+)"),
+)
+# Links past this many per note are not indexed
+MAX_LINKS_PER_NOTE = 1000
+
+
+def parse_links(content):
+    """
+    Return the normalized titles and the note ids `content` refers to.
+    """
+    titles = set()
+    for match in TITLE_LINK_RE.finditer(content):
+        title = normalize_title(match.group(1))
+        if title:
+            titles.add(title)
+            if len(titles) >= MAX_LINKS_PER_NOTE:
+                break
+    ids = set()
+    for url_re in NOTE_URL_RES:
+        for match in url_re.finditer(content):
+            ids.add(int(match.group(1)))
+            if len(ids) >= MAX_LINKS_PER_NOTE:
+                break
+    return titles, ids
+
+
+def update_note_links(note):
+    """
+    Bring the note's outgoing links in line with its content, touching only
+    edges that changed: one query to read the current edges, at most one to
+    check new URL targets, one to resolve new titles, one delete and one
+    insert.
+    """
+    titles, ids = parse_links(note.content)
+    ids.discard(note.pk)
+
+    existing = {}
+    for pk, target_title, target_id in NoteLink.objects.filter(source=note).values_list(
+        "pk", "target_title", "target_id"
+    ):
+        key = (target_title, None) if target_title else ("", target_id)
+        existing[key] = pk
+
+    new_ids = {target_id for target_id in ids if ("", target_id) not in existing}
+    if new_ids:
+        # Only the user's own, existing notes can be link targets
+        new_ids = set(
+            Note.objects.filter(user_id=note.user_id, pk__in=new_ids).values_list(
+                "pk", flat=True
+            )
+        )
+    wanted = {(title, None) for title in titles}
+    wanted |= {("", target_id) for target_id in ids if ("", target_id) in existing}
+    wanted |= {("", target_id) for target_id in new_ids}
+
+    removed = [pk for key, pk in existing.items() if key not in wanted]
+    added = [key for key in wanted if key not in existing]
+    if not removed and not added:
+        return
+
+    added_titles = {title for title, _ in added if title}
+    resolved = {}
+    if added_titles:
+        resolved = dict(
+            Note.objects.filter(
+                user_id=note.user_id, normalized_title__in=added_titles
+            ).values_list("normalized_title", "pk")
+        )
+
+    with transaction.atomic(using=note._state.db):
+        if removed:
+            NoteLink.objects.filter(pk__in=removed).delete()
+        NoteLink.objects.bulk_create(
+            [
+                NoteLink(
+                    source=note,
+                    target_title=title,
+                    target_id=resolved.get(title) if title else target_id,
+                )
+                for title, target_id in added
+            ]
+        )
+
+
+def relink_title(note, old_normalized_title):
+    """
+    After `note` was created or renamed: links to its old title dangle, and
+    dangling links to its new title point at it.
+    """
+    if old_normalized_title and old_normalized_title != note.normalized_title:
+        NoteLink.objects.filter(target=note, target_title=old_normalized_title).update(
+            target=None
+        )
+    NoteLink.objects.filter(
+        source__user_id=note.user_id,
+        target_title=note.normalized_title,
+        target__isnull=True,
+    ).update(target=note)
+
+
+def rewrite_title_links(note, old_normalized_title, batch_size=100):
+    """
+    Replace `[[Old Title]]` references in the user's other notes with the
+    note's current title. Returns the number of notes rewritten.
+    """
+    if old_normalized_title == note.normalized_title:
+        return 0
+
+    def replace(match):
+        if normalize_title(match.group(1)) != old_normalized_title:
+            return match.group(0)
+        return f"[[{note.title}{match.group(2) or ''}]]"
+
+    source_ids = list(
+        Note.objects.filter(
+            user_id=note.user_id, outgoing_links__target_title=old_normalized_title
+        )
+        .exclude(pk=note.pk)
+        .values_list("pk", flat=True)
+        .distinct()
+    )
+    for start in range(0, len(source_ids), batch_size):
+        for source in Note.objects.filter(
+            pk__in=source_ids[start : start + batch_size]
+        ):
+            source.content = TITLE_LINK_RE.sub(replace, source.content)
+            # Reindexes the source's links (see signals)
+            source.save(update_fields=["content", "modified"])
+    return len(source_ids)
@@ -0,0 +1,100 @@
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from notes.calendar import calendar_summary
+from notes.models import Note, normalize_title
+from notes.sharding import shard_for_user, use_shard
+
+USERNAME = "calendarbench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the calendar API: a year heatmap and a month view over one "
+        "user's dated notes, summarized and serialized to JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--notes", type=int, default=50000)
+        parser.add_argument("--year", type=int, default=2025)
+        parser.add_argument(
+            "--range-share",
+            type=float,
+            default=0.1,
+            help="Share of the notes spanning several days rather than one.",
+        )
+        parser.add_argument("--queries", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, notes, year, range_share, queries, seed, **options):
+        User = get_user_model()
+        for user in User.objects.filter(username=USERNAME):
+            self.delete_user(user)
+        user = User.objects.create(username=USERNAME)
+        rng = random.Random(seed)
+        try:
+            with use_shard(shard_for_user(user.pk)) as alias:
+                self.seed(user, alias, notes, year, range_share, rng)
+                self.stdout.write(f"{notes} dated notes for one user")
+                for label, start, end in (
+                    ("year", date(year, 1, 1), date(year, 12, 31)),
+                    ("month", date(year, 6, 1), date(year, 6, 30)),
+                ):
+                    self.measure(label, user, start, end, queries)
+        finally:
+            self.delete_user(user)
+
+    def seed(self, user, alias, note_count, year, range_share, rng):
+        # Dates spill into the neighbouring years, as real calendars do
+        first_day = date(year - 1, 7, 1)
+        span = (date(year + 1, 6, 30) - first_day).days
+        with transaction.atomic(using=alias):
+            Note.objects.bulk_create(
+                (
+                    # bulk_create skips save(), which fills normalized_title
+                    Note(
+                        user=user,
+                        title=f"Note {number}",
+                        normalized_title=normalize_title(f"Note {number}"),
+                        content="",
+                        date=(day := first_day + timedelta(rng.randrange(span))),
+                        end_date=(
+                            day + timedelta(rng.randint(1, 14))
+                            if rng.random() < range_share
+                            else None
+                        ),
+                        enabled=rng.random() < 0.95,
+                    )
+                    for number in range(note_count)
+                ),
+                batch_size=5000,
+            )
+
+    def measure(self, label, user, start, end, queries):
+        timings = []
+        for _ in range(queries):
+            started = time.perf_counter()
+            json.dumps(calendar_summary(user, start, end))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label} view: p50 {timings[len(timings) // 2]:.1f} ms, "
+            f"max {timings[-1]:.1f} ms"
+        )
+
+    @staticmethod
+    def delete_user(user):
+        # Deleting the notes one by one through their signals takes minutes;
+        # the benchmark notes have nothing else to clean up
+        alias = shard_for_user(user.pk)
+        with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Note._meta.db_table} WHERE user_id = %s", [user.pk]
+            )
+        user.delete()
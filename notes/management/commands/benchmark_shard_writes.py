@@ -0,0 +1,63 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from notes.models import Note
+from notes.sharding import note_databases, shard_for_user, use_shard
+
+USERNAME_PREFIX = "shardbench-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure autosave throughput over the configured shards: threads "
+        "saving the notes of users spread over every shard. Compare runs "
+        "with different NOTE_SHARD_COUNT values."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--saves", type=int, default=1200)
+        parser.add_argument("--content-size", type=int, default=2000)
+
+    def handle(self, *args, threads, saves, content_size, **options):
+        User = get_user_model()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        notes = []
+        for number in range(threads):
+            user = User.objects.create(username=f"{USERNAME_PREFIX}{number}")
+            with use_shard(shard_for_user(user.pk)):
+                notes.append(Note.objects.create(user=user, title="Bench"))
+
+        def autosave(note, count):
+            try:
+                for number in range(count):
+                    note.content = f"{number} " + "x" * content_size
+                    note.save(update_fields=["content", "modified"])
+            finally:
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=autosave, args=(note, saves // threads))
+            for note in notes
+        ]
+        try:
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        total = saves // threads * threads
+        used = len({note._state.db for note in notes})
+        self.stdout.write(
+            f"{total} autosaves from {threads} threads over {used} of "
+            f"{len(note_databases())} databases: {elapsed:.2f} s, "
+            f"{total / elapsed:.0f} writes/s"
+        )
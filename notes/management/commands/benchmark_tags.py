@@ -0,0 +1,119 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from notes import tags
+from notes.models import Note, NoteTag, Tag, normalize_title
+from notes.sharding import shard_for_user, use_shard
+
+USERNAME = "tagbench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the tag index: build time of one user's index from the "
+        "database and the latency of boolean queries with facet counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--notes", type=int, default=100000)
+        parser.add_argument("--tags", type=int, default=1000)
+        parser.add_argument(
+            "--tags-per-note",
+            type=float,
+            default=4.7,
+            help="Mean tags per note; tag popularity follows a Zipf-like curve.",
+        )
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, notes, tags, tags_per_note, queries, seed, **options):
+        User = get_user_model()
+        for user in User.objects.filter(username=USERNAME):
+            self.delete_user(user)
+        user = User.objects.create(username=USERNAME)
+        rng = random.Random(seed)
+        try:
+            with use_shard(shard_for_user(user.pk)) as alias:
+                links = self.seed(user, alias, notes, tags, tags_per_note, rng)
+                self.stdout.write(
+                    f"{notes} notes, {tags} tags, {links} links for one user"
+                )
+                self.measure(user, tags, queries, rng)
+        finally:
+            self.delete_user(user)
+
+    def seed(self, user, alias, note_count, tag_count, tags_per_note, rng):
+        names = [f"tag{number}" for number in range(tag_count)]
+        weights = [1 / (rank + 1) for rank in range(tag_count)]
+        with transaction.atomic(using=alias):
+            Note.objects.bulk_create(
+                (
+                    # bulk_create skips save(), which fills normalized_title
+                    Note(
+                        user=user,
+                        title=f"Note {number}",
+                        normalized_title=normalize_title(f"Note {number}"),
+                        content="",
+                    )
+                    for number in range(note_count)
+                ),
+                batch_size=5000,
+            )
+            Tag.objects.bulk_create(Tag(user=user, name=name) for name in names)
+            ids_by_name = dict(Tag.objects.filter(user=user).values_list("name", "id"))
+            tag_ids = [ids_by_name[name] for name in names]
+            links = set()
+            for note_id in Note.objects.filter(user=user).values_list("id", flat=True):
+                count = min(int(rng.expovariate(1 / tags_per_note)) + 1, tag_count)
+                for tag_id in rng.choices(tag_ids, weights, k=count):
+                    links.add((note_id, tag_id))
+            NoteTag.objects.bulk_create(
+                (NoteTag(note_id=note_id, tag_id=tag_id) for note_id, tag_id in links),
+                batch_size=5000,
+            )
+        return len(links)
+
+    def measure(self, user, tag_count, queries, rng):
+        tags.clear_index_cache()
+        started = time.perf_counter()
+        index = tags.get_tag_index(user)
+        self.stdout.write(
+            f"cold index build: {time.perf_counter() - started:.2f} s, "
+            f"{index.nbytes / 1024 / 1024:.1f} MB"
+        )
+
+        # Popular tags, so the queries match and facet over many notes
+        popular = [f"tag{number}" for number in range(min(tag_count, 20))]
+        timings = []
+        for _ in range(queries):
+            included, excluded = rng.sample(popular, 2), rng.sample(popular, 1)
+            query = " AND ".join(included) + f" NOT {excluded[0]}"
+            started = time.perf_counter()
+            list(tags.search_by_tags(user, query)[0])
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"warm queries with facets: p50 {timings[len(timings) // 2]:.1f} ms, "
+            f"max {timings[-1]:.1f} ms"
+        )
+
+    @staticmethod
+    def delete_user(user):
+        # Deleting the notes one by one through their signals takes minutes;
+        # the benchmark notes have nothing but their tags to clean up
+        alias = shard_for_user(user.pk)
+        with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+            for table, condition in (
+                (
+                    NoteTag._meta.db_table,
+                    f"tag_id IN (SELECT id FROM {Tag._meta.db_table} WHERE user_id = %s)",
+                ),
+                (Note._meta.db_table, "user_id = %s"),
+                (Tag._meta.db_table, "user_id = %s"),
+            ):
+                cursor.execute(f"DELETE FROM {table} WHERE {condition}", [user.pk])
+        user.delete()
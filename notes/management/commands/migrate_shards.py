@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.sharding import (
+    mirror_users,
+    reset_id_sequences,
+    shard_aliases,
+    shard_for_user,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create missing note shards, apply migrations to every shard and mirror "
+        "users into their shard. Run after changing NOTE_SHARD_COUNT, then "
+        "run rebalance_shards."
+    )
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError("Sharding is disabled; set NOTE_SHARD_COUNT.")
+
+        for alias in aliases:
+            settings.DATABASES[alias]["NAME"].parent.mkdir(exist_ok=True)
+            self.stdout.write(f"Migrating {alias}")
+            call_command("migrate", database=alias, verbosity=0, interactive=False)
+            reset_id_sequences(alias)
+
+        users_by_shard = defaultdict(list)
+        for user in get_user_model().objects.using("default").iterator():
+            users_by_shard[shard_for_user(user.pk)].append(user)
+        for alias, users in users_by_shard.items():
+            mirror_users(users, alias)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(aliases)} shards ready, "
+                f"{sum(map(len, users_by_shard.values()))} users mirrored."
+            )
+        )
@@ -0,0 +1,106 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from notes.models import Directory, Note, Tag
+from notes.sharding import (
+    delete_user_data,
+    drop_user_mirror,
+    mirror_users,
+    reset_id_sequences,
+    shard_aliases,
+    shard_for_user,
+)
+
+BATCH_SIZE = 1000
+
+# Copy order, with the lookup selecting one user's rows
+USER_ROWS = [
+    ("notes.Directory", "user_id"),
+    ("notes.DirectoryClosure", "descendant__user_id"),
+    ("notes.UnassignedNotes", "user_id"),
+    ("notes.Tag", "user_id"),
+    ("notes.Note", "user_id"),
+    ("notes.NoteTag", "note__user_id"),
+    ("notes.NoteLink", "source__user_id"),
+    ("attachments.Blob", "references__note__user_id"),
+    ("attachments.NoteAttachment", "note__user_id"),
+]
+
+
+def _user_rows(alias, user_id):
+    for label, lookup in USER_ROWS:
+        model = apps.get_model(label)
+        rows = model._base_manager.using(alias).filter(**{lookup: user_id})
+        # Blobs are reached through a reverse relation and may repeat
+        yield model, rows.distinct() if label == "attachments.Blob" else rows
+
+
+def _user_ids(alias):
+    return set().union(
+        *(
+            model._base_manager.using(alias).values_list("user_id", flat=True)
+            for model in (Directory, Note, Tag)
+        )
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Move every user's notes to the shard NOTE_SHARD_COUNT now assigns "
+        "them, including notes still in the default database from before "
+        "sharding was enabled. Stop the app while it runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, dry_run, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError("Sharding is disabled; set NOTE_SHARD_COUNT.")
+
+        moved = 0
+        for source in ["default", *aliases]:
+            for user_id in sorted(_user_ids(source)):
+                target = shard_for_user(user_id)
+                if target == source:
+                    continue
+                self.stdout.write(f"User {user_id}: {source} -> {target}")
+                moved += 1
+                if not dry_run:
+                    self._move_user(user_id, source, target)
+
+        if not dry_run:
+            for alias in aliases:
+                reset_id_sequences(alias)
+        self.stdout.write(
+            self.style.SUCCESS(f"{'Would move' if dry_run else 'Moved'} {moved} users.")
+        )
+
+    def _move_user(self, user_id, source, target):
+        User = get_user_model()
+        mirror_users([User.objects.using("default").get(pk=user_id)], target)
+
+        # Copying keeps primary keys (they are unique across shards) and
+        # skips rows already there, so an interrupted move can be rerun
+        with transaction.atomic(using=target):
+            for model, rows in _user_rows(source, user_id):
+                batch = []
+                for row in rows.iterator(chunk_size=BATCH_SIZE):
+                    batch.append(row)
+                    if len(batch) == BATCH_SIZE:
+                        model._base_manager.using(target).bulk_create(
+                            batch, ignore_conflicts=True
+                        )
+                        batch = []
+                model._base_manager.using(target).bulk_create(
+                    batch, ignore_conflicts=True
+                )
+
+        with transaction.atomic(using=source):
+            if source == "default":
+                delete_user_data(source, user_id)
+            else:
+                drop_user_mirror(source, user_id)
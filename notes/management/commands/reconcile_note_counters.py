@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes.counters import expected_note_counters
+from notes.models import Directory, UnassignedNotes
+from notes.sharding import note_databases
+
+COUNTER_FIELDS = ["note_count", "note_bytes", "notes_modified"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-directory and unassigned note counters from the "
+        "notes and fix the ones that drifted (after bulk updates, raw SQL or "
+        "notes saved with their directory or size deferred)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, dry_run, **options):
+        for alias in note_databases():
+            with transaction.atomic(using=alias):
+                expected = expected_note_counters(alias)
+                directories = self._drifted(
+                    Directory.objects.using(alias).only("user_id", *COUNTER_FIELDS),
+                    lambda row: expected.get((row.user_id, row.pk)),
+                )
+                unassigned = self._drifted(
+                    UnassignedNotes.objects.using(alias),
+                    lambda row: expected.get((row.user_id, None)),
+                )
+                # Users with unassigned notes but no counters row yet
+                known = set(
+                    UnassignedNotes.objects.using(alias).values_list(
+                        "user_id", flat=True
+                    )
+                )
+                missing = [
+                    UnassignedNotes(user_id=user_id, **self._values(counters))
+                    for (user_id, directory_id), counters in expected.items()
+                    if directory_id is None and user_id not in known
+                ]
+                if not dry_run:
+                    Directory.objects.using(alias).bulk_update(
+                        directories, COUNTER_FIELDS, batch_size=500
+                    )
+                    UnassignedNotes.objects.using(alias).bulk_update(
+                        unassigned, COUNTER_FIELDS, batch_size=500
+                    )
+                    UnassignedNotes.objects.using(alias).bulk_create(
+                        missing, batch_size=500
+                    )
+            self.stdout.write(
+                f"[{alias}] {'would fix' if dry_run else 'fixed'} "
+                f"{len(directories)} directories and "
+                f"{len(unassigned) + len(missing)} unassigned counters"
+            )
+
+    @staticmethod
+    def _values(counters):
+        count, size, modified = counters or (0, 0, None)
+        return {"note_count": count, "note_bytes": size, "notes_modified": modified}
+
+    def _drifted(self, rows, expected_for):
+        drifted = []
+        for row in rows.iterator(chunk_size=1000):
+            values = self._values(expected_for(row))
+            if (row.note_count, row.note_bytes) == (
+                values["note_count"],
+                values["note_bytes"],
+            ):
+                continue
+            # Keep a newer stamp (a deleted note also counts as a change)
+            if row.notes_modified and (
+                values["notes_modified"] is None
+                or row.notes_modified > values["notes_modified"]
+            ):
+                values["notes_modified"] = row.notes_modified
+            for name, value in values.items():
+                setattr(row, name, value)
+            drifted.append(row)
+        return drifted
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from notes.links import update_note_links
+from notes.models import Note, NoteLink
+from notes.sharding import note_databases, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the note link index from note contents. Saving a note keeps "
+        "its links up to date, so this is only needed once after migrating, "
+        "or after notes were changed without signals (bulk updates, raw SQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, batch_size, **options):
+        started = time.perf_counter()
+        total = 0
+        for alias in note_databases():
+            with use_shard(alias):
+                notes = Note.objects.using(alias).only("id", "user_id", "content")
+                note_ids = list(notes.order_by("pk").values_list("pk", flat=True))
+                for start in range(0, len(note_ids), batch_size):
+                    # One commit per batch rather than per note
+                    with transaction.atomic(using=alias):
+                        for note in notes.filter(
+                            pk__in=note_ids[start : start + batch_size]
+                        ):
+                            update_note_links(note)
+                    total += len(note_ids[start : start + batch_size])
+                resolved = self._resolve_titles(alias)
+                edges = NoteLink.objects.using(alias).count()
+            self.stdout.write(
+                f"[{alias}] {len(note_ids)} notes, {edges} links, "
+                f"{resolved} title links re-resolved"
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reindexed {total} notes in {elapsed:.2f} s "
+                f"({total / elapsed if elapsed else 0:.0f} notes/s)."
+            )
+        )
+
+    def _resolve_titles(self, alias):
+        """
+        Point every title link at the note currently holding that title (or
+        at nothing), in one statement.
+        """
+        link_table = NoteLink._meta.db_table
+        note_table = Note._meta.db_table
+        resolved_id = (
+            f"(SELECT target.id FROM {note_table} AS target "
+            f"JOIN {note_table} AS source ON source.id = {link_table}.source_id "
+            f"WHERE target.user_id = source.user_id "
+            f"AND target.normalized_title = {link_table}.target_title)"
+        )
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {link_table} SET target_id = {resolved_id} "
+                f"WHERE target_title != '' AND target_id IS NOT {resolved_id}"
+            )
+            return cursor.rowcount
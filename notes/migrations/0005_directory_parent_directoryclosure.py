@@ -0,0 +1,70 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_self_links(apps, schema_editor):
+    Directory = apps.get_model('notes', 'Directory')
+    DirectoryClosure = apps.get_model('notes', 'DirectoryClosure')
+    db_alias = schema_editor.connection.alias
+    DirectoryClosure.objects.using(db_alias).bulk_create(
+        DirectoryClosure(ancestor_id=pk, descendant_id=pk, depth=0)
+        for pk in Directory.objects.using(db_alias).values_list('pk', flat=True).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_remove_note_slug'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='directory',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='notes.directory'),
+        ),
+        migrations.AlterField(
+            model_name='directory',
+            name='title',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddConstraint(
+            model_name='directory',
+            constraint=models.UniqueConstraint(fields=('user', 'parent', 'title'), name='unique_directory_title_per_parent'),
+        ),
+        migrations.AddConstraint(
+            model_name='directory',
+            constraint=models.UniqueConstraint(condition=models.Q(('parent__isnull', True)), fields=('user', 'title'), name='unique_root_directory_title'),
+        ),
+        migrations.AddField(
+            model_name='directoryclosure',
+            name='ancestor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='notes.directory'),
+        ),
+        migrations.AddField(
+            model_name='directoryclosure',
+            name='descendant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='notes.directory'),
+        ),
+        migrations.AddIndex(
+            model_name='directoryclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='notes_direc_descend_55d4c2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='directoryclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_directory_closure'),
+        ),
+        migrations.RunPython(create_self_links, migrations.RunPython.noop),
+    ]
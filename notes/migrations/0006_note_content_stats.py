@@ -0,0 +1,50 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_content_stats(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    db_alias = schema_editor.connection.alias
+    batch = []
+    for note in Note.objects.using(db_alias).only('id', 'content').iterator(chunk_size=500):
+        note.snippet = ' '.join(note.content[:400].split())[:200]
+        note.size = len(note.content.encode('utf-8'))
+        note.word_count = len(note.content.split())
+        batch.append(note)
+        if len(batch) >= 500:
+            Note.objects.using(db_alias).bulk_update(batch, ['snippet', 'size', 'word_count'])
+            batch = []
+    Note.objects.using(db_alias).bulk_update(batch, ['snippet', 'size', 'word_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_directory_parent_directoryclosure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='snippet',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', 'directory', 'index', 'title', 'id'], name='note_list_order_idx'),
+        ),
+        migrations.RunPython(backfill_content_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0006_note_content_stats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="enabled",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="end_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                condition=models.Q(("date__isnull", False)),
+                fields=["user", "enabled", "date", "end_date"],
+                name="note_calendar_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:40
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+TITLE_MAX_LENGTH = 255
+
+
+def unique_title(title, user_id, taken):
+    """
+    Return `title`, or `title-N` with the title cut short enough for the
+    suffix to fit, whichever normalized form `taken` does not hold yet for
+    the user; then record it as taken.
+    """
+    candidate = title
+    normalized = ' '.join(candidate.split()).casefold()
+    suffix = 1
+    while (user_id, normalized) in taken:
+        suffix += 1
+        ending = f'-{suffix}'
+        candidate = title[:TITLE_MAX_LENGTH - len(ending)] + ending
+        normalized = ' '.join(candidate.split()).casefold()
+    taken.add((user_id, normalized))
+    return candidate, normalized
+
+
+def backfill_normalized_titles(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+    db_alias = schema_editor.connection.alias
+    taken = set()
+    batch = []
+    for note in Note.objects.using(db_alias).only('id', 'title', 'user_id').order_by('id').iterator(chunk_size=500):
+        # Titles used to be compared exactly; rename the later of any notes
+        # that only differ in case or spacing
+        title, note.normalized_title = unique_title(note.title, note.user_id, taken)
+        if title != note.title:
+            logger.warning(
+                'Renamed note %s of user %s from %r to %r: its title differed '
+                'from an earlier note\'s only in case or spacing.',
+                note.pk, note.user_id, note.title, title,
+            )
+            note.title = title
+        batch.append(note)
+        if len(batch) >= 500:
+            Note.objects.using(db_alias).bulk_update(batch, ['title', 'normalized_title'])
+            batch = []
+    Note.objects.using(db_alias).bulk_update(batch, ['title', 'normalized_title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_tags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='normalized_title',
+            field=models.CharField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_normalized_titles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='note',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_title'), name='unique_note_title'),
+        ),
+    ]
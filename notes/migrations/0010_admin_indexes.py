@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-19 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_note_normalized_title'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['created'], name='note_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(
+                fields=['type', 'created'], name='note_type_created_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(
+                fields=['normalized_title'], name='note_title_search_idx'
+            ),
+        ),
+    ]
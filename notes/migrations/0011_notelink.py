@@ -0,0 +1,71 @@
+# Generated by Django 5.1.5 on 2026-10-19 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0010_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteLink',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'target_title',
+                    models.CharField(blank=True, default='', max_length=255),
+                ),
+                (
+                    'source',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='outgoing_links',
+                        to='notes.note',
+                    ),
+                ),
+                (
+                    'target',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='incoming_links',
+                        to='notes.note',
+                    ),
+                ),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        condition=models.Q(('target_title', ''), _negated=True),
+                        fields=['target_title'],
+                        name='notelink_title_idx',
+                    )
+                ],
+                'constraints': [
+                    models.UniqueConstraint(
+                        condition=models.Q(('target_title', ''), _negated=True),
+                        fields=('source', 'target_title'),
+                        name='unique_note_title_link',
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(('target_title', '')),
+                        fields=('source', 'target'),
+                        name='unique_note_url_link',
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_note_counters(apps, schema_editor):
+    Directory = apps.get_model('notes', 'Directory')
+    Note = apps.get_model('notes', 'Note')
+    UnassignedNotes = apps.get_model('notes', 'UnassignedNotes')
+    db_alias = schema_editor.connection.alias
+    groups = (
+        Note.objects.using(db_alias)
+        .values('user_id', 'directory_id')
+        .annotate(count=Count('pk'), size=Sum('size'), modified=Max('modified'))
+        .order_by()
+    )
+    directories, unassigned = [], []
+    for group in groups:
+        counters = {
+            'note_count': group['count'],
+            'note_bytes': group['size'] or 0,
+            'notes_modified': group['modified'],
+        }
+        if group['directory_id'] is None:
+            unassigned.append(UnassignedNotes(user_id=group['user_id'], **counters))
+        else:
+            directories.append(Directory(pk=group['directory_id'], **counters))
+    Directory.objects.using(db_alias).bulk_update(
+        directories, ['note_count', 'note_bytes', 'notes_modified'], batch_size=500
+    )
+    UnassignedNotes.objects.using(db_alias).bulk_create(unassigned, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0011_notelink'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnassignedNotes',
+            fields=[
+                ('note_count', models.PositiveIntegerField(default=0)),
+                ('note_bytes', models.PositiveBigIntegerField(default=0)),
+                ('notes_modified', models.DateTimeField(blank=True, null=True)),
+                (
+                    'user',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='unassigned_notes',
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='directory',
+            name='note_bytes',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='directory',
+            name='note_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='directory',
+            name='notes_modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_note_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0012_note_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="note",
+            name="note_calendar_idx",
+        ),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                condition=models.Q(("date__isnull", False), ("enabled", True)),
+                fields=["user", "date", "end_date", "enabled"],
+                name="note_calendar_idx",
+            ),
+        ),
+    ]
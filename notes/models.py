@@ -1,24 +1,270 @@
 from django.conf import settings  # Import settings to use AUTH_USER_MODEL
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connections, models, router, transaction
+from django.db.models import Q
 from django.urls import reverse
 
+SNIPPET_LENGTH = 200
+# Bounding the span lets calendar queries scan a bounded slice of the date index
+MAX_DATE_RANGE_DAYS = 366
+CONTENT_STATS_FIELDS = ("snippet", "size", "word_count")
 
-class Directory(models.Model):
+
+def normalize_title(title):
+    return " ".join(title.split()).casefold()
+
+
+class DirectoryClosureManager(models.Manager):
+    """
+    Maintains the closure table so that every subtree operation costs a constant
+    number of queries, regardless of the depth of the tree.
+    """
+
+    def insert_node(self, directory):
+        """
+        Add the closure rows of a freshly created directory: a self-link plus
+        one link per ancestor of its parent.
+        """
+        table = self.model._meta.db_table
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (ancestor_id, descendant_id, depth) "
+                f"VALUES (%s, %s, 0)",
+                [directory.pk, directory.pk],
+            )
+            if directory.parent_id is not None:
+                cursor.execute(
+                    f"INSERT INTO {table} (ancestor_id, descendant_id, depth) "
+                    f"SELECT ancestor_id, %s, depth + 1 FROM {table} "
+                    f"WHERE descendant_id = %s",
+                    [directory.pk, directory.parent_id],
+                )
+
+    def move_subtree(self, directory, new_parent_id):
+        """
+        Re-link the subtree rooted at `directory` below `new_parent_id`
+        (None moves it to the top level).
+        """
+        table = self.model._meta.db_table
+        with self._cursor() as cursor:
+            # Drop the links between the subtree and its old ancestors
+            cursor.execute(
+                f"DELETE FROM {table} "
+                f"WHERE descendant_id IN "
+                f"(SELECT descendant_id FROM {table} WHERE ancestor_id = %s) "
+                f"AND ancestor_id NOT IN "
+                f"(SELECT descendant_id FROM {table} WHERE ancestor_id = %s)",
+                [directory.pk, directory.pk],
+            )
+            if new_parent_id is not None:
+                # Link every new ancestor with every node of the subtree
+                cursor.execute(
+                    f"INSERT INTO {table} (ancestor_id, descendant_id, depth) "
+                    f"SELECT above.ancestor_id, below.descendant_id, "
+                    f"above.depth + below.depth + 1 "
+                    f"FROM {table} above, {table} below "
+                    f"WHERE above.descendant_id = %s AND below.ancestor_id = %s",
+                    [new_parent_id, directory.pk],
+                )
+
+    def _cursor(self):
+        return connections[self.db].cursor()
+
+
+class NoteCounters(models.Model):
     """
-    A simple Directory model (not nested).
+    Number, total size and last change of a set of notes, kept up to date
+    with F() updates as notes are saved, moved and deleted (notes/counters.py)
+    and repaired by the reconcile_note_counters command.
     """
 
-    title = models.CharField(max_length=200, unique=True)
+    note_count = models.PositiveIntegerField(default=0)
+    note_bytes = models.PositiveBigIntegerField(default=0)
+    notes_modified = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class Directory(NoteCounters):
+    """
+    A Directory that can be nested under another Directory.
+
+    The hierarchy is mirrored in DirectoryClosure, so subtrees can be fetched,
+    counted, moved and deleted without recursive queries.
+    """
+
+    title = models.CharField(max_length=200)
     index = models.PositiveIntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
+    parent = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="children",
+    )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="directories"
     )  # Use settings.AUTH_USER_MODEL for the custom user model
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "parent", "title"],
+                name="unique_directory_title_per_parent",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "title"],
+                condition=Q(parent__isnull=True),
+                name="unique_root_directory_title",
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get("parent_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        is_moved = not is_new and self.parent_id != getattr(
+            self, "_loaded_parent_id", self.parent_id
+        )
+        if is_moved:
+            self._check_move_target(self.parent_id)
+        using = kwargs.get("using") or router.db_for_write(Directory, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if is_new:
+                DirectoryClosure.objects.insert_node(self)
+            elif is_moved:
+                DirectoryClosure.objects.move_subtree(self, self.parent_id)
+        self._loaded_parent_id = self.parent_id
+
+    def delete(self, *args, **kwargs):
+        """
+        Delete the directory with its whole subtree in a single collection
+        pass; notes inside fall back to "not assigned", and so do their
+        counters, moved with one aggregate over the subtree.
+        """
+        from .counters import unassign_directory_counters  # imports the models
+
+        using = kwargs.get("using") or router.db_for_write(Directory, instance=self)
+        subtree = self.get_descendants(include_self=True).using(using)
+        with transaction.atomic(using=using):
+            unassign_directory_counters(subtree)
+            return subtree.delete()
+
+    def get_descendants(self, include_self=False):
+        descendants = Directory.objects.filter(ancestor_links__ancestor=self)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+    def get_ancestors(self, include_self=False):
+        ancestors = Directory.objects.filter(descendant_links__descendant=self)
+        if not include_self:
+            ancestors = ancestors.exclude(pk=self.pk)
+        return ancestors.order_by("-descendant_links__depth")
+
+    def get_subtree_notes(self):
+        return Note.objects.filter(directory__ancestor_links__ancestor=self)
+
+    def move_to(self, new_parent):
+        """
+        Move the directory (with its subtree) under `new_parent`, or to the
+        top level when `new_parent` is None.
+        """
+        self.parent = new_parent
+        self.save(update_fields=["parent", "modified"])
+
+    def _check_move_target(self, new_parent_id):
+        if new_parent_id is None:
+            return
+        if DirectoryClosure.objects.filter(
+            ancestor=self, descendant_id=new_parent_id
+        ).exists():
+            raise ValueError("A directory cannot be moved into its own subtree.")
+
+
+class DirectoryClosure(models.Model):
+    """
+    One row per (ancestor, descendant) pair of the directory tree, including a
+    zero-depth self-link for every directory.
+    """
+
+    ancestor = models.ForeignKey(
+        Directory, on_delete=models.CASCADE, related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Directory, on_delete=models.CASCADE, related_name="ancestor_links"
+    )
+    depth = models.PositiveIntegerField()
+
+    objects = DirectoryClosureManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="unique_directory_closure"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "depth"]),
+        ]
+
+
+class UnassignedNotes(NoteCounters):
+    """
+    The counters of a user's notes outside any directory.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="unassigned_notes",
+    )
+
+
+class Tag(models.Model):
+    """
+    A per-user facet that notes can be tagged with (many-to-many, unlike
+    directories).
+    """
+
+    name = models.CharField(max_length=100)
+    # Number of tagged notes; maintained alongside NoteTag changes
+    note_count = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tags"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "name"], name="unique_tag_name"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class NoteTag(models.Model):
+    note = models.ForeignKey("Note", on_delete=models.CASCADE, related_name="tag_links")
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="note_links")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tag", "note"], name="unique_note_tag"),
+        ]
+
 
 class Note(models.Model):
     """
@@ -32,6 +278,8 @@ class Note(models.Model):
     }
 
     title = models.CharField(max_length=255)
+    # Case- and whitespace-insensitive form of `title`, unique per user
+    normalized_title = models.CharField(max_length=255, editable=False)
     content = models.TextField()
     index = models.PositiveIntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
@@ -49,6 +297,142 @@ class Note(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notes"
     )
+    tags = models.ManyToManyField(
+        Tag, through=NoteTag, related_name="notes", blank=True
+    )
+    # Optional day or day range, shown on the calendar while `enabled`
+    date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    enabled = models.BooleanField(default=True)
+    # Precomputed on save so that lists never need to load `content`
+    snippet = models.CharField(max_length=SNIPPET_LENGTH, blank=True, default="")
+    size = models.PositiveIntegerField(default=0)  # Content size in bytes
+    word_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "normalized_title"], name="unique_note_title"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "directory", "index", "title", "id"],
+                name="note_list_order_idx",
+            ),
+            # Enabled dated notes only: Django writes enabled=True as a bare
+            # "enabled" term, which SQLite can match to a partial index
+            # condition but cannot seek on; the trailing column keeps the
+            # index covering
+            models.Index(
+                fields=["user", "date", "end_date", "enabled"],
+                name="note_calendar_idx",
+                condition=Q(date__isnull=False, enabled=True),
+            ),
+            # Admin: date hierarchy, type filter and title prefix search
+            models.Index(fields=["created"], name="note_created_idx"),
+            models.Index(fields=["type", "created"], name="note_type_created_idx"),
+            models.Index(fields=["normalized_title"], name="note_title_search_idx"),
+        ]
 
     def __str__(self):
         return self.title
+
+    def clean(self):
+        if self.end_date and not self.date:
+            raise ValidationError({"end_date": "An end date needs a start date."})
+        if self.date and self.end_date:
+            if self.end_date < self.date:
+                raise ValidationError(
+                    {"end_date": "End date cannot be before the start date."}
+                )
+            if (self.end_date - self.date).days > MAX_DATE_RANGE_DAYS:
+                raise ValidationError(
+                    {
+                        "end_date": f"A note cannot span more than "
+                        f"{MAX_DATE_RANGE_DAYS} days."
+                    }
+                )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_normalized_title = instance.__dict__.get("normalized_title")
+        if "directory_id" in instance.__dict__ and "size" in instance.__dict__:
+            # What the note added to its directory's counters when loaded
+            instance._loaded_counted = (instance.directory_id, instance.size)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        # Deferred or left out, the content is unchanged; reading it would
+        # load it from the database just to recompute the same stats
+        if "content" in self.__dict__ and (
+            update_fields is None or "content" in update_fields
+        ):
+            self.refresh_content_stats()
+        self.normalized_title = normalize_title(self.title)
+        if update_fields is not None and "content" in update_fields:
+            kwargs["update_fields"] = {*update_fields, *CONTENT_STATS_FIELDS}
+        if update_fields is not None and "title" in update_fields:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "normalized_title"}
+        # The counters signals re-read the stored note and apply the delta in
+        # the same transaction as the save
+        using = kwargs.get("using") or router.db_for_write(Note, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+        self._loaded_normalized_title = self.normalized_title
+        if "size" in self.__dict__:
+            self._loaded_counted = (self.directory_id, self.size)
+
+    def refresh_content_stats(self):
+        self.snippet = " ".join(self.content[: SNIPPET_LENGTH * 2].split())[
+            :SNIPPET_LENGTH
+        ]
+        self.size = len(self.content.encode("utf-8"))
+        self.word_count = len(self.content.split())
+
+
+class NoteLink(models.Model):
+    """
+    A reference from a note's content to another note of the same user,
+    either `[[Title]]` or a URL of the note.
+
+    Title links keep the normalized title, so links to a note that does not
+    exist yet (or was renamed away) stay dangling with an empty target until
+    a note takes that title.
+    """
+
+    source = models.ForeignKey(
+        Note, on_delete=models.CASCADE, related_name="outgoing_links"
+    )
+    target = models.ForeignKey(
+        Note,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="incoming_links",
+    )
+    # Normalized title of a [[Title]] link; empty for URL links
+    target_title = models.CharField(max_length=255, blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "target_title"],
+                condition=~Q(target_title=""),
+                name="unique_note_title_link",
+            ),
+            models.UniqueConstraint(
+                fields=["source", "target"],
+                condition=Q(target_title=""),
+                name="unique_note_url_link",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["target_title"],
+                condition=~Q(target_title=""),
+                name="notelink_title_idx",
+            ),
+        ]
@@ -0,0 +1,81 @@
+from django.core import signing
+from django.db.models import F, Q
+
+NOTE_LIST_PAGE_SIZE = 100
+
+# Columns needed to render a row of the sidebar / list API; the note body
+# itself is never loaded for lists.
+NOTE_LIST_FIELDS = (
+    "id",
+    "title",
+    "directory_id",
+    "index",
+    "type",
+    "snippet",
+    "size",
+    "word_count",
+)
+
+NOTE_LIST_ORDERING = (
+    F("directory").asc(nulls_first=True),
+    "index",
+    "title",
+    "id",
+)
+
+CURSOR_SALT = "notes.pagination.note_list"
+
+
+def encode_cursor(note):
+    return signing.dumps(
+        [note.directory_id, note.index, note.title, note.id], salt=CURSOR_SALT
+    )
+
+
+def decode_cursor(cursor):
+    """
+    Return the (directory_id, index, title, id) key encoded in `cursor`.
+    Raises ValueError for tampered or malformed cursors.
+    """
+    try:
+        directory_id, index, title, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValueError("Invalid pagination cursor.")
+    return directory_id, index, title, pk
+
+
+def _after_key(directory_id, index, title, pk):
+    """
+    Rows strictly after the given key in NOTE_LIST_ORDERING.
+    """
+    same_directory_tail = (
+        Q(index__gt=index)
+        | Q(index=index, title__gt=title)
+        | Q(index=index, title=title, id__gt=pk)
+    )
+    if directory_id is None:
+        return Q(directory__isnull=False) | (
+            Q(directory__isnull=True) & same_directory_tail
+        )
+    return Q(directory_id__gt=directory_id) | (
+        Q(directory_id=directory_id) & same_directory_tail
+    )
+
+
+def paginate_notes(queryset, after=None, page_size=NOTE_LIST_PAGE_SIZE):
+    """
+    Keyset-paginate a Note queryset over (directory, index, title, id).
+
+    Returns the page as a list and the cursor of the next page (None on the
+    last page). The cost of a page does not depend on how deep it is.
+    """
+    queryset = queryset.only(*NOTE_LIST_FIELDS).order_by(*NOTE_LIST_ORDERING)
+    if after:
+        queryset = queryset.filter(_after_key(*decode_cursor(after)))
+
+    page = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(page[-1])
+    return page, next_cursor
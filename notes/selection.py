@@ -0,0 +1,44 @@
+"""
+The note last selected in the notes list, kept in a signed cookie instead of
+the session so that browsing notes never writes to the database.
+"""
+
+from django.conf import settings
+
+SELECTED_NOTE_COOKIE = "selected_note"
+SELECTED_NOTE_SALT = "notes.selected_note"
+SELECTED_NOTE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def get_selected_note_id(request):
+    return request.get_signed_cookie(
+        SELECTED_NOTE_COOKIE, default=None, salt=SELECTED_NOTE_SALT
+    )
+
+
+def remember_selected_note(request, response, note_id):
+    """
+    Set (or clear, for a falsy `note_id`) the cookie, only when it changes.
+    """
+    note_id = str(note_id) if note_id else None
+    if note_id == get_selected_note_id(request):
+        return
+    if note_id is None:
+        response.delete_cookie(SELECTED_NOTE_COOKIE)
+    else:
+        response.set_signed_cookie(
+            SELECTED_NOTE_COOKIE,
+            note_id,
+            salt=SELECTED_NOTE_SALT,
+            max_age=SELECTED_NOTE_MAX_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite="Lax",
+        )
+
+
+def selected_note(request):
+    """
+    Context processor exposing the remembered note id to every template.
+    """
+    return {"remembered_note_id": get_selected_note_id(request)}
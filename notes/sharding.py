@@ -0,0 +1,216 @@
+"""
+Optional per-user sharding of notes across several SQLite files.
+
+With NOTE_SHARD_COUNT > 0 every user's notes, directories, tags and
+attachments live in one `shard_N` database picked by rendezvous hashing of
+the user id, so autosaves of users on different shards do not wait for the
+same SQLite writer lock. Auth, sessions, failed logins and jobs stay in the
+default database; user rows are mirrored into the user's shard so foreign
+keys hold.
+
+Each shard hands out primary keys from its own range, so ids stay unique
+across shards and survive a move between them.
+"""
+
+import contextlib
+import contextvars
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+SHARDED_APPS = {"notes", "attachments"}
+
+# Apps the sharded tables reference through foreign keys
+SHARD_SUPPORT_APPS = {"auth", "contenttypes", "customizedusers"}
+
+SHARD_ID_RANGE = 1 << 40
+
+_current_shard = contextvars.ContextVar("current_shard", default=None)
+
+
+def shard_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("shard_")]
+
+
+def sharding_enabled():
+    return bool(shard_aliases())
+
+
+def note_databases():
+    """
+    Every database holding notes: the shards, or just the default one.
+    """
+    return shard_aliases() or ["default"]
+
+
+def shard_for_user(user_id):
+    """
+    Rendezvous hashing: adding a shard only moves the users it wins.
+    """
+    aliases = shard_aliases()
+    if not aliases:
+        return "default"
+    return max(
+        aliases,
+        key=lambda alias: hashlib.sha1(f"{alias}:{user_id}".encode()).digest(),
+    )
+
+
+@contextlib.contextmanager
+def use_shard(alias):
+    """
+    Route queries without an instance to `alias` inside the block.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+class UserShardRouter:
+    def _db_for(self, model, instance=None, **hints):
+        if model._meta.app_label not in SHARDED_APPS:
+            return None
+        if instance is not None:
+            if instance._meta.app_label in SHARDED_APPS and instance._state.db:
+                return instance._state.db
+            if isinstance(instance, get_user_model()):
+                return shard_for_user(instance.pk)
+            user_id = getattr(instance, "user_id", None)
+            if user_id is not None:
+                return shard_for_user(user_id)
+        return _current_shard.get()
+
+    db_for_read = _db_for
+    db_for_write = _db_for
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Notes point at users that live (mirrored) in the default database
+        if {obj1._meta.app_label, obj2._meta.app_label} & SHARDED_APPS:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in shard_aliases():
+            return app_label in SHARDED_APPS | SHARD_SUPPORT_APPS
+        return None
+
+
+class UserShardMiddleware:
+    """
+    Route the request's note queries to the signed-in user's shard.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sharding_enabled() or not request.user.is_authenticated:
+            return self.get_response(request)
+        with use_shard(shard_for_user(request.user.pk)):
+            return self.get_response(request)
+
+
+class ShardedModelAdminMixin:
+    """
+    Hide a sharded model from the admin while sharding is on. The admin
+    queries one database, the staff user's own shard, so it would list,
+    count and change only the rows that happen to live there.
+    """
+
+    def has_module_permission(self, request):
+        return not sharding_enabled() and super().has_module_permission(request)
+
+    def has_view_permission(self, request, obj=None):
+        return not sharding_enabled() and super().has_view_permission(request, obj)
+
+    def has_add_permission(self, request):
+        return not sharding_enabled() and super().has_add_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return not sharding_enabled() and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return not sharding_enabled() and super().has_delete_permission(request, obj)
+
+
+def mirror_users(users, alias):
+    """
+    Insert or refresh copies of `users` in `alias`.
+    """
+    User = get_user_model()
+    fields = [field.attname for field in User._meta.concrete_fields]
+    pk_name = User._meta.pk.attname
+    User.objects.using(alias).bulk_create(
+        [User(**{name: getattr(user, name) for name in fields}) for user in users],
+        update_conflicts=True,
+        unique_fields=[pk_name],
+        update_fields=[name for name in fields if name != pk_name],
+    )
+
+
+def delete_user_data(alias, user_id):
+    """
+    Delete everything `user_id` owns in `alias`, leaving the user row alone.
+    """
+    from notes.models import Directory, Note, Tag, UnassignedNotes
+
+    # Notes cascade to their tag links and attachments, directories to
+    # their closure rows
+    for model in (Note, Directory, Tag, UnassignedNotes):
+        model._base_manager.using(alias).filter(user_id=user_id).delete()
+
+
+def drop_user_mirror(alias, user_id):
+    """
+    Delete a mirrored user row without the ORM collector, which would look
+    for tables (such as the admin log) that only the default database has.
+    """
+    delete_user_data(alias, user_id)
+    User = get_user_model()
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {User._meta.db_table} WHERE {User._meta.pk.column} = %s",
+            [user_id],
+        )
+
+
+def sharded_models():
+    from django.apps import apps
+
+    return [
+        model
+        for app_label in sorted(SHARDED_APPS)
+        for model in apps.get_app_config(app_label).get_models()
+    ]
+
+
+def reset_id_sequences(alias):
+    """
+    Point every sharded table's AUTOINCREMENT sequence at the top of the
+    shard's own id range, whatever rows were copied in from other shards.
+    """
+    if alias not in shard_aliases():
+        return
+    low = (shard_aliases().index(alias) + 1) * SHARD_ID_RANGE
+    high = low + SHARD_ID_RANGE
+    with connections[alias].cursor() as cursor:
+        for model in sharded_models():
+            if model._meta.pk.get_internal_type() not in ("AutoField", "BigAutoField"):
+                continue
+            table = model._meta.db_table
+            cursor.execute(
+                f"SELECT COALESCE(MAX({model._meta.pk.column}), %s) FROM {table} "
+                f"WHERE {model._meta.pk.column} >= %s AND "
+                f"{model._meta.pk.column} < %s",
+                [low, low, high],
+            )
+            (seq,) = cursor.fetchone()
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = %s", [table])
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                [table, seq],
+            )
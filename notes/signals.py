@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from notes.counters import apply_note_delta, read_locked
+from notes.links import relink_title, update_note_links
+from notes.models import CONTENT_STATS_FIELDS, Directory, Note, Tag
+from notes.sharding import (
+    drop_user_mirror,
+    mirror_users,
+    shard_for_user,
+    sharding_enabled,
+)
+
+# Saves touching only these fields do not change the notes list
+CONTENT_ONLY_FIELDS = {"content", "modified", *CONTENT_STATS_FIELDS}
+
+
+def touch_notes_modified(user_id):
+    get_user_model().objects.filter(pk=user_id).update(notes_modified=timezone.now())
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_save, sender=Directory)
+def notes_list_changed_recv(sender, instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) <= CONTENT_ONLY_FIELDS:
+        return
+    touch_notes_modified(instance.user_id)
+
+
+@receiver(post_save, sender=Note)
+def note_links_recv(sender, instance, created, update_fields, **kwargs):
+    # Content may be deferred (e.g. on renames); then its links did not change
+    if "content" in instance.__dict__ and (
+        update_fields is None or "content" in update_fields
+    ):
+        update_note_links(instance)
+    old_title = None if created else getattr(instance, "_loaded_normalized_title", None)
+    if created or old_title != instance.normalized_title:
+        relink_title(instance, old_title)
+
+
+def stored_note_counted(instance, using):
+    # What the stored note adds to its directory's counters, read under the
+    # write lock: an instance loaded earlier may be stale by now
+    return read_locked(
+        Note._base_manager.using(using).filter(pk=instance.pk), "directory_id", "size"
+    )
+
+
+@receiver(pre_save, sender=Note)
+def note_counted_recv(sender, instance, using, update_fields, **kwargs):
+    if instance._state.adding:
+        return
+    loaded = getattr(instance, "_loaded_counted", None)
+    if (
+        update_fields is not None
+        and not {"directory", "directory_id"} & update_fields
+        and loaded == (instance.directory_id, instance.size)
+    ):
+        # Nothing counted changes, as on most autosaves: the delta is only
+        # the last change stamp, and needs no lock
+        instance._counted = loaded
+        return
+    # Note.save runs in a transaction, so the row cannot change between this
+    # read and the delta applied after the save
+    instance._counted = stored_note_counted(instance, using)
+
+
+@receiver(post_save, sender=Note)
+def note_counters_recv(sender, instance, created, using, **kwargs):
+    directory_id, size = instance.directory_id, instance.size
+    counted = instance.__dict__.pop("_counted", None)
+    if created:
+        apply_note_delta(instance.user_id, directory_id, 1, size, using, create=True)
+        return
+    if counted is None:
+        # A new instance saved over an existing row; left to reconciling
+        return
+    old_directory_id, old_size = counted
+    if old_directory_id != directory_id:
+        apply_note_delta(instance.user_id, old_directory_id, -1, -old_size, using)
+        apply_note_delta(instance.user_id, directory_id, 1, size, using, create=True)
+    else:
+        apply_note_delta(
+            instance.user_id, directory_id, 0, size - old_size, using, create=True
+        )
+
+
+@receiver(pre_delete, sender=Note)
+def note_counted_deleted_recv(sender, instance, using, origin, **kwargs):
+    # Deletions run in a transaction from the pre_delete signals on; the
+    # counters go along with a deleted user
+    if not isinstance(origin, get_user_model()):
+        instance._counted = stored_note_counted(instance, using)
+
+
+@receiver(post_delete, sender=Note)
+def note_counters_deleted_recv(sender, instance, using, **kwargs):
+    counted = instance.__dict__.pop("_counted", None)
+    if counted is None:
+        # Deleted with its user, or already by someone else who counted it
+        return
+    directory_id, size = counted
+    apply_note_delta(instance.user_id, directory_id, -1, -size, using)
+
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=Directory)
+def notes_list_deleted_recv(sender, instance, origin, **kwargs):
+    # One stamp per user and delete operation, not per deleted row; the
+    # origin (what .delete() was called on) is shared by the whole cascade.
+    # A deleted user's stamp goes with them.
+    if isinstance(origin, get_user_model()):
+        return
+    touched = (
+        origin.__dict__.setdefault("_notes_list_touched", set())
+        if origin is not None
+        else set()
+    )
+    if instance.user_id not in touched:
+        touched.add(instance.user_id)
+        touch_notes_modified(instance.user_id)
+
+
+@receiver(pre_delete, sender=Note)
+def note_deleted_recv(sender, instance, using, **kwargs):
+    # Keep tag counters (and the tag index stamp) in step with the cascade
+    Tag.objects.using(using).filter(note_links__note=instance).update(
+        note_count=F("note_count") - 1, modified=timezone.now()
+    )
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved_recv(sender, instance, using, **kwargs):
+    # Notes on the user's shard reference a mirrored copy of the user row
+    if sharding_enabled() and using == "default":
+        mirror_users([instance], shard_for_user(instance.pk))
+
+
+@receiver(pre_delete, sender=get_user_model())
+def user_deleted_recv(sender, instance, using, **kwargs):
+    # The default database's collector cannot see rows on the shard
+    if sharding_enabled() and using == "default":
+        drop_user_mirror(shard_for_user(instance.pk), instance.pk)
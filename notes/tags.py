@@ -0,0 +1,222 @@
+import shlex
+import sys
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import Note, NoteTag, Tag
+
+# Memory the tag indexes kept per process may take, whatever the number of
+# users; an index larger than this on its own is rebuilt on every query
+INDEX_CACHE_BYTES = 64 * 1024 * 1024
+# Most tags a note can carry
+MAX_TAGS_PER_NOTE = 100
+TAG_NAME_MAX_LENGTH = Tag._meta.get_field("name").max_length
+
+
+def normalize_tag_name(name):
+    return " ".join(name.split()).lower()
+
+
+def set_note_tags(note, names):
+    """
+    Replace the tags of `note` with `names`, creating missing tags. Runs a
+    constant number of queries however many tags change. Raises ValueError
+    unless `names` is a list of at most MAX_TAGS_PER_NOTE strings that fit
+    in a tag name.
+    """
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError("Tags must be a list of strings.")
+    names = {normalize_tag_name(name) for name in names} - {""}
+    if len(names) > MAX_TAGS_PER_NOTE:
+        raise ValueError(f"A note can have at most {MAX_TAGS_PER_NOTE} tags.")
+    if any(len(name) > TAG_NAME_MAX_LENGTH for name in names):
+        raise ValueError(f"Tags can be at most {TAG_NAME_MAX_LENGTH} characters long.")
+    with transaction.atomic(using=note._state.db):
+        Tag.objects.bulk_create(
+            [Tag(user_id=note.user_id, name=name) for name in names],
+            ignore_conflicts=True,
+        )
+        wanted = set(
+            Tag.objects.filter(user_id=note.user_id, name__in=names).values_list(
+                "id", flat=True
+            )
+        )
+        current = set(note.tag_links.values_list("tag_id", flat=True))
+        added, removed = wanted - current, current - wanted
+
+        if removed:
+            NoteTag.objects.filter(note=note, tag_id__in=removed).delete()
+            Tag.objects.filter(pk__in=removed).update(
+                note_count=F("note_count") - 1, modified=timezone.now()
+            )
+        if added:
+            NoteTag.objects.bulk_create(
+                [NoteTag(note=note, tag_id=tag_id) for tag_id in added]
+            )
+            Tag.objects.filter(pk__in=added).update(
+                note_count=F("note_count") + 1, modified=timezone.now()
+            )
+
+
+class TagIndex:
+    """
+    Inverted index of one user's tags: tagged note ids are numbered densely
+    (by rank in a sorted id array) and every tag keeps a bitset of ranks in a
+    Python int, so intersections and facet counts are bitwise operations.
+    """
+
+    def __init__(self, stamp, tags, links):
+        self.stamp = stamp
+        self.tag_ids = {name: tag_id for tag_id, name in tags}
+        self.tag_names = {tag_id: name for tag_id, name in tags}
+        self.note_ids = sorted({note_id for _, note_id in links})
+        size = len(self.note_ids) // 8 + 1
+        buffers = {}
+        for tag_id, note_id in links:
+            buffer = buffers.get(tag_id)
+            if buffer is None:
+                buffer = buffers[tag_id] = bytearray(size)
+            rank = bisect_left(self.note_ids, note_id)
+            buffer[rank >> 3] |= 1 << (rank & 7)
+        self.bitsets = {
+            tag_id: int.from_bytes(buffer, "little")
+            for tag_id, buffer in buffers.items()
+        }
+        self.nbytes = self._measure()
+
+    def _measure(self):
+        """
+        Approximate memory held by the index, in bytes.
+        """
+        containers = (self.tag_ids, self.tag_names, self.note_ids, self.bitsets)
+        return (
+            sum(map(sys.getsizeof, containers))
+            + sum(map(sys.getsizeof, self.tag_names.values()))
+            + sum(map(sys.getsizeof, self.note_ids))
+            + sum(map(sys.getsizeof, self.bitsets.values()))
+        )
+
+    def bits(self, name):
+        return self.bitsets.get(self.tag_ids.get(name), 0)
+
+    def match(self, included, excluded):
+        result = None
+        for name in included:
+            result = self.bits(name) if result is None else result & self.bits(name)
+        for name in excluded:
+            result &= ~self.bits(name)
+        return result
+
+    def ids(self, bitset, limit=None):
+        """
+        Note ids for the set bits, in ascending id order.
+        """
+        ids = []
+        digits = bin(bitset)[:1:-1]  # Least significant bit first
+        position = digits.find("1")
+        while position != -1 and (limit is None or len(ids) < limit):
+            ids.append(self.note_ids[position])
+            position = digits.find("1", position + 1)
+        return ids
+
+    def facet_counts(self, bitset):
+        return {
+            self.tag_names[tag_id]: count
+            for tag_id, tag_bits in self.bitsets.items()
+            if (count := (tag_bits & bitset).bit_count())
+        }
+
+
+_index_cache = OrderedDict()
+_index_cache_bytes = 0
+_index_lock = threading.Lock()
+
+
+def clear_index_cache():
+    global _index_cache_bytes
+    with _index_lock:
+        _index_cache.clear()
+        _index_cache_bytes = 0
+
+
+def get_tag_index(user):
+    """
+    Return the user's TagIndex, rebuilding it only when a tag changed since it
+    was built (checked with one aggregate over the user's tags). The least
+    recently used indexes are evicted to stay within INDEX_CACHE_BYTES.
+    """
+    global _index_cache_bytes
+    stamp = tuple(
+        Tag.objects.filter(user=user).aggregate(Max("modified"), Count("id")).values()
+    )
+    with _index_lock:
+        index = _index_cache.get(user.pk)
+        if index is not None and index.stamp == stamp:
+            _index_cache.move_to_end(user.pk)
+            return index
+
+    index = TagIndex(
+        stamp,
+        list(Tag.objects.filter(user=user).values_list("id", "name")),
+        list(
+            NoteTag.objects.filter(tag__user=user)
+            .order_by("tag", "note")
+            .values_list("tag_id", "note_id")
+        ),
+    )
+    with _index_lock:
+        previous = _index_cache.pop(user.pk, None)
+        if previous is not None:
+            _index_cache_bytes -= previous.nbytes
+        if index.nbytes <= INDEX_CACHE_BYTES:
+            _index_cache[user.pk] = index
+            _index_cache_bytes += index.nbytes
+            while _index_cache_bytes > INDEX_CACHE_BYTES:
+                _, evicted = _index_cache.popitem(last=False)
+                _index_cache_bytes -= evicted.nbytes
+    return index
+
+
+def parse_tag_query(query):
+    """
+    Parse "work AND urgent NOT archived" into ({"work", "urgent"},
+    {"archived"}). Terms are AND-ed implicitly; quote names with spaces.
+    """
+    included, excluded = set(), set()
+    negate = False
+    for token in shlex.split(query):
+        if token == "AND":
+            continue
+        if token == "NOT":
+            negate = True
+            continue
+        (excluded if negate else included).add(normalize_tag_name(token))
+        negate = False
+    return included, excluded
+
+
+def search_by_tags(user, query, limit=100):
+    """
+    Notes matching a boolean tag query, with live facet counts for every tag
+    among the matches. Returns (note stubs in ascending id order, total
+    matches, facet counts).
+    """
+    included, excluded = parse_tag_query(query)
+    if not included:
+        raise ValueError("The query needs at least one tag to match.")
+
+    index = get_tag_index(user)
+    bitset = index.match(included, excluded)
+    note_ids = index.ids(bitset, limit)
+    # The index picked the first `limit` ids; keep them in that order
+    notes = (
+        Note.objects.filter(pk__in=note_ids)
+        .only("id", "title", "type", "directory_id")
+        .order_by("id")
+    )
+    return notes, bitset.bit_count(), index.facet_counts(bitset)
@@ -1,3 +1,1369 @@
-from django.test import TestCase
+import contextlib
+import functools
+import importlib
+import json
+import re
+import tracemalloc
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.core import signing
+from django.db import IntegrityError, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from common.api_json_response import COMPACT_JSON_CONTENT_TYPE
+
+from . import admission, tags
+from .admin import DirectoryAdmin
+from .calendar import calendar_summary, parse_window
+from .counters import read_locked
+from .large_notes import CHUNK_SIZE, STREAMING_THRESHOLD, NoteChanged
+from .links import parse_links
+from .models import Directory, DirectoryClosure, Note, NoteLink, UnassignedNotes
+from .pagination import (
+    NOTE_LIST_ORDERING,
+    decode_cursor,
+    encode_cursor,
+    paginate_notes,
+)
+from .sharding import note_databases, shard_for_user, use_shard
+from .tags import set_note_tags
+from .selection import SELECTED_NOTE_COOKIE, SELECTED_NOTE_SALT
+from .views import BULK_FETCH_MAX_IDS, SIDEBAR_TARGET
+
+User = get_user_model()
+
+# Full pages need the static and Vite manifests, which only builds produce;
+# DEBUG makes the templates link the development assets instead
+RENDER_PAGES = override_settings(
+    DEBUG=True,
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+)
+
+
+class ShardedStreamingTests(TestCase):
+    databases = "__all__"
+
+    def create_user_with_large_note(self, username):
+        user = User.objects.create_user(username, password="x")
+        with use_shard(shard_for_user(user.pk)):
+            note = Note.objects.create(
+                user=user, title="Large", content="é" * STREAMING_THRESHOLD
+            )
+        return user, note
+
+    def test_large_notes_stream_from_their_shard(self):
+        # Two shards with NOTE_SHARD_COUNT=2 or more, else the default database
+        wanted = min(2, len(note_databases()))
+        shards = {}
+        for number in range(20):
+            user, note = self.create_user_with_large_note(f"user{number}")
+            shards.setdefault(shard_for_user(user.pk), (user, note))
+            if len(shards) == wanted:
+                break
+        self.assertEqual(len(shards), wanted)
+
+        for user, note in shards.values():
+            self.client.force_login(user)
+            response = self.client.get(reverse("notes_api:note_detail", args=[note.pk]))
+            self.assertTrue(response.streaming)
+            data = json.loads(b"".join(response.streaming_content))
+            self.assertEqual(data["result"]["note_content"], note.content)
+
+            response = self.client.get(
+                reverse("notes_api:note_content", args=[note.pk]),
+                HTTP_RANGE="bytes=-4",
+            )
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b"".join(response.streaming_content), "éé".encode())
+
+
+@RENDER_PAGES
+class NoteListTitleTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("writer", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(user=self.user, title="My note", content="")
+        self.url = reverse("notes:note_list")
+
+    def messages(self, response):
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_create_rejects_title_differing_in_case_and_spaces(self):
+        response = self.client.post(
+            self.url, {"action": "create_note", "note_title": "  my   NOTE "}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.messages(response), ["Note title must be unique."])
+
+    def test_create_with_a_new_title(self):
+        response = self.client.post(
+            self.url,
+            {"action": "create_note", "note_title": "Other", "note_type": "TODO"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(
+            Note.objects.filter(user=self.user, title="Other", type="TODO").exists()
+        )
+
+    def test_rename_rejects_title_differing_in_case_and_spaces(self):
+        other = Note.objects.create(user=self.user, title="Other", content="")
+        response = self.client.post(
+            self.url,
+            {"action": "rename_note", "note_id": other.pk, "new_title": "MY  note"},
+        )
+        self.assertEqual(response.status_code, 200)
+        other.refresh_from_db()
+        self.assertEqual(other.title, "Other")
+        self.assertEqual(self.messages(response), ["Note title must be unique."])
+
+    def test_title_taken_after_the_check_is_reported(self):
+        with mock.patch("notes.views.clean_note_title"):
+            response = self.client.post(
+                self.url, {"action": "create_note", "note_title": "my note"}
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.messages(response), ["Note title must be unique."])
+
+    def test_create_in_own_directory(self):
+        directory = Directory.objects.create(user=self.user, title="Work")
+        response = self.client.post(
+            self.url,
+            {
+                "action": "create_note",
+                "note_title": "Other",
+                "note_directory_id": directory.pk,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(
+            Note.objects.filter(user=self.user, title="Other", directory=directory)
+        )
+
+    def test_create_rejects_other_users_and_unknown_directories(self):
+        other_user = User.objects.create_user("other", password="x")
+        with use_shard(shard_for_user(other_user.pk)):
+            other_directory = Directory.objects.create(user=other_user, title="Theirs")
+        for directory_id in (other_directory.pk, other_directory.pk + 100, "abc"):
+            with self.subTest(directory_id=directory_id):
+                response = self.client.post(
+                    self.url,
+                    {
+                        "action": "create_note",
+                        "note_title": "Other",
+                        "note_directory_id": directory_id,
+                    },
+                )
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 1)
+        with use_shard(shard_for_user(other_user.pk)):
+            other_directory.refresh_from_db()
+        self.assertEqual(other_directory.note_count, 0)
+
+    def test_create_rejects_unknown_type(self):
+        response = self.client.post(
+            self.url,
+            {"action": "create_note", "note_title": "Other", "note_type": "BOGUS"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.messages(response), ["Select a valid note type."])
+
+    def test_other_integrity_errors_are_not_reported_as_titles(self):
+        with mock.patch.object(Note, "save", side_effect=IntegrityError("CHECK")):
+            with self.assertRaises(IntegrityError):
+                self.client.post(
+                    self.url, {"action": "create_note", "note_title": "Other"}
+                )
+
+
+@RENDER_PAGES
+@RENDER_PAGES
+class SelectedNoteTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("reader", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(user=self.user, title="Read", content="")
+        self.url = reverse("notes:note_list")
+
+    def view(self, **params):
+        with contextlib.ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.DATABASES
+            ]
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query["sql"] for queries in captured for query in queries]
+
+    def test_read_only_views_write_nothing(self):
+        # The first view of a note remembers it in the cookie
+        response, _ = self.view(note=self.note.pk)
+        self.assertIn(SELECTED_NOTE_COOKIE, response.cookies)
+        self.user.refresh_from_db()
+        last_login = self.user.last_login
+        modified = Note.objects.get(pk=self.note.pk).modified
+
+        for params in ({"note": self.note.pk}, {}):
+            response, queries = self.view(**params)
+            writes = [
+                sql
+                for sql in queries
+                if sql.startswith(("INSERT", "UPDATE", "DELETE", "REPLACE"))
+            ]
+            self.assertEqual(writes, [])
+            note_lookups = [
+                sql
+                for sql in queries
+                if f'"{Note._meta.db_table}"."id" = {self.note.pk}' in sql
+            ]
+            self.assertEqual(len(note_lookups), 1, note_lookups)
+            # Already remembered, so no Set-Cookie either
+            self.assertNotIn(SELECTED_NOTE_COOKIE, response.cookies)
+            self.assertContains(response, "Read")
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login, last_login)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).modified, modified)
+
+    def remember(self, value):
+        self.client.cookies[SELECTED_NOTE_COOKIE] = signing.get_cookie_signer(
+            salt=SELECTED_NOTE_COOKIE + SELECTED_NOTE_SALT
+        ).sign(value)
+
+    def test_remembered_note_is_shown(self):
+        self.remember(str(self.note.pk))
+        response, _ = self.view()
+        self.assertEqual(response.context["selected_note"], self.note)
+        self.assertNotIn(SELECTED_NOTE_COOKIE, response.cookies)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.remember(str(self.note.pk))
+        signed = self.client.cookies[SELECTED_NOTE_COOKIE].value
+        self.client.cookies[SELECTED_NOTE_COOKIE] = signed.replace(
+            str(self.note.pk), str(self.note.pk + 1), 1
+        )
+        response, _ = self.view()
+        self.assertIsNone(response.context["selected_note"])
+        self.assertIsNone(response.context["remembered_note_id"])
+        # Unsigned ids are not accepted either
+        self.client.cookies[SELECTED_NOTE_COOKIE] = str(self.note.pk)
+        response, _ = self.view()
+        self.assertIsNone(response.context["selected_note"])
+
+    def other_users_note(self):
+        # On the same database, so its id cannot be one of this user's
+        for number in range(20):
+            other = User.objects.create_user(f"other{number}", password="x")
+            if shard_for_user(other.pk) == shard_for_user(self.user.pk):
+                return Note.objects.create(user=other, title="Theirs", content="")
+        self.fail("No other user on this user's shard")
+
+    def test_other_users_notes_are_not_shown(self):
+        theirs = self.other_users_note()
+        response = self.client.get(self.url, {"note": theirs.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(SELECTED_NOTE_COOKIE, response.cookies)
+
+        # Remembered (say, before a logout and another login): forgotten
+        self.remember(str(theirs.pk))
+        response, _ = self.view()
+        self.assertIsNone(response.context["selected_note"])
+        self.assertNotContains(response, "Theirs")
+        self.assertEqual(response.cookies[SELECTED_NOTE_COOKIE].value, "")
+
+
+class SidebarPollTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("poller", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(user=self.user, title="Polled", content="")
+        self.url = reverse("notes:note_list")
+
+    def poll(self, etag=None):
+        headers = {"X-Up-Target": SIDEBAR_TARGET}
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.client.get(self.url, headers=headers)
+
+    def test_unchanged_poll_is_answered_before_any_notes_query(self):
+        etag = self.poll()["ETag"]
+        queries = {
+            alias: self.enterContext(CaptureQueriesContext(connections[alias]))
+            for alias in {"default", *note_databases()}
+        }
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # The session and the user row, nothing else
+        self.assertEqual(
+            sum(len(captured) for captured in queries.values()), 2, queries
+        )
+
+    def test_autosave_keeps_the_poll_unchanged(self):
+        etag = self.poll()["ETag"]
+        self.note.content = "edited"
+        self.note.save(update_fields=["content", "modified"])
+        self.assertEqual(self.poll(etag).status_code, 304)
+
+    def test_changes_invalidate_the_poll(self):
+        etag = self.poll()["ETag"]
+        Note.objects.create(user=self.user, title="Another", content="")
+        response = self.poll(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Another")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_deleting_a_subtree_stamps_the_user_once(self):
+        parent = None
+        for depth in range(4):
+            parent = Directory.objects.create(
+                user=self.user, title=f"Level {depth}", parent=parent
+            )
+            Note.objects.create(user=self.user, title=f"Note {depth}", directory=parent)
+        root = parent.get_ancestors().first()
+        with CaptureQueriesContext(connections["default"]) as queries:
+            root.delete()
+        stamps = [
+            query
+            for query in queries
+            if query["sql"].startswith(f'UPDATE "{User._meta.db_table}"')
+        ]
+        self.assertEqual(len(stamps), 1)
+
+
+class BulkNotesTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("bulk", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.notes = [
+            Note.objects.create(user=self.user, title=f"Note {number}", content="x")
+            for number in range(3)
+        ]
+        self.url = reverse("notes_api:note_bulk")
+
+    def get(self, ids):
+        return self.client.get(self.url, {"ids": ",".join(map(str, ids))})
+
+    def test_returns_notes_in_the_requested_order(self):
+        ids = [self.notes[2].pk, self.notes[0].pk]
+        result = self.get(ids).json()["result"]
+        self.assertEqual([note["note_id"] for note in result["notes"]], ids)
+        self.assertEqual(result["notes"][0]["note_content"], "x")
+        self.assertEqual(result["missing"], [])
+
+    def test_other_users_and_unknown_notes_are_missing(self):
+        other_user = User.objects.create_user("other", password="x")
+        with use_shard(shard_for_user(other_user.pk)):
+            theirs = Note.objects.create(user=other_user, title="Theirs", content="")
+        unknown = max(theirs.pk, self.notes[-1].pk) + 100
+        result = self.get([self.notes[0].pk, theirs.pk, unknown]).json()["result"]
+        self.assertEqual(
+            [note["note_id"] for note in result["notes"]], [self.notes[0].pk]
+        )
+        self.assertEqual(result["missing"], [theirs.pk, unknown])
+
+    def test_caps_the_number_of_ids(self):
+        ids = range(1, BULK_FETCH_MAX_IDS + 2)
+        response = self.get(ids)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["status"], "error")
+        # Repeated ids count once
+        self.assertEqual(self.get([self.notes[0].pk] * 30).status_code, 200)
+
+    def test_rejects_malformed_ids(self):
+        for query in ({}, {"ids": "1,a"}, {"ids": ""}):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(self.url, query).status_code, 400)
+
+
+class CalendarTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("planner", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.url = reverse("notes_api:note_calendar")
+
+    def note(self, title, first, last=None, enabled=True):
+        return Note.objects.create(
+            user=self.user, title=title, date=first, end_date=last, enabled=enabled
+        )
+
+    def test_parse_window(self):
+        for params, window in (
+            ({"year": "2024"}, (date(2024, 1, 1), date(2024, 12, 31))),
+            ({"year": "2024", "month": "2"}, (date(2024, 2, 1), date(2024, 2, 29))),
+            (
+                {"start": "2024-03-05", "end": "2024-03-05"},
+                (date(2024, 3, 5), date(2024, 3, 5)),
+            ),
+            ({"year": "2"}, (date(2, 1, 1), date(2, 12, 31))),
+            ({"year": "9998"}, (date(9998, 1, 1), date(9998, 12, 31))),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(parse_window(params), window)
+
+    def test_parse_window_rejects_bad_windows(self):
+        for params in (
+            {},
+            {"year": "abc"},
+            {"year": "2024", "month": "13"},
+            {"start": "2024-03-05"},
+            {"start": "2024-03-05", "end": "2024-03-04"},
+            {"start": "2024-01-01", "end": "2025-01-01"},
+            {"year": "0"},
+            {"year": "1"},
+            {"year": "9999"},
+            {"start": "0001-01-01", "end": "0001-01-31"},
+            {"start": "9999-12-01", "end": "9999-12-31"},
+        ):
+            with self.subTest(params=params):
+                with self.assertRaises(ValueError):
+                    parse_window(params)
+
+    def test_out_of_range_years_are_bad_requests(self):
+        for year in ("1", "9999"):
+            with self.subTest(year=year):
+                response = self.client.get(self.url, {"year": year})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["status"], "error")
+
+    def test_month_counts_and_stubs(self):
+        self.note("Before", date(2024, 1, 20), date(2024, 1, 31))
+        self.note("Into", date(2024, 1, 30), date(2024, 2, 2))
+        self.note("Single", date(2024, 2, 2))
+        self.note("Disabled", date(2024, 2, 2), enabled=False)
+        self.note("Out of", date(2024, 2, 29), date(2024, 3, 3))
+        other_user = User.objects.create_user("other", password="x")
+        with use_shard(shard_for_user(other_user.pk)):
+            Note.objects.create(user=other_user, title="Theirs", date=date(2024, 2, 2))
+
+        result = self.client.get(self.url, {"year": "2024", "month": "2"}).json()[
+            "result"
+        ]
+        self.assertEqual(
+            result["days"],
+            {"2024-02-01": 1, "2024-02-02": 2, "2024-02-29": 1},
+        )
+        self.assertEqual(
+            [(stub["note_title"], stub["end_date"]) for stub in result["notes"]],
+            [
+                ("Into", "2024-02-02"),
+                ("Single", "2024-02-02"),
+                ("Out of", "2024-03-03"),
+            ],
+        )
+
+    def test_year_counts_without_stubs(self):
+        # The longest range, ending on the window's first day
+        self.note("Long", date(2023, 1, 1), date(2024, 1, 1))
+        self.note("Same day", date(2024, 7, 4))
+        self.note("Same day too", date(2024, 7, 4))
+        self.note("New year's eve", date(2024, 12, 31), date(2025, 1, 2))
+
+        result = calendar_summary(self.user, date(2024, 1, 1), date(2024, 12, 31))
+        self.assertNotIn("notes", result)
+        self.assertEqual(
+            result["days"],
+            {"2024-01-01": 1, "2024-07-04": 2, "2024-12-31": 1},
+        )
+
+    def test_windows_at_the_bounds(self):
+        self.note("Last", date(9998, 12, 31))
+        self.assertEqual(
+            calendar_summary(self.user, date(9998, 12, 1), date(9998, 12, 31))["days"],
+            {"9998-12-31": 1},
+        )
+        self.assertEqual(
+            calendar_summary(self.user, date(2, 1, 1), date(2, 1, 31))["days"], {}
+        )
+
+
+class NoteListPaginationTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("pager", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        work = Directory.objects.create(user=self.user, title="Work")
+        home = Directory.objects.create(user=self.user, title="Home")
+        for directory in (None, work, home):
+            for index, title in ((1, "b"), (0, "c"), (0, "a"), (1, "a")):
+                Note.objects.create(
+                    user=self.user,
+                    title=f"{title} {directory or 'loose'} {index}",
+                    index=index,
+                    directory=directory,
+                )
+        self.ordered = list(
+            Note.objects.filter(user=self.user).order_by(*NOTE_LIST_ORDERING)
+        )
+        self.url = reverse("notes_api:note_list")
+
+    def pages(self, page_size):
+        pages, cursor = [], None
+        while True:
+            page, cursor = paginate_notes(
+                Note.objects.filter(user=self.user), after=cursor, page_size=page_size
+            )
+            pages.append(page)
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_the_ordering_once(self):
+        for page_size in (1, 5, 12, 20):
+            with self.subTest(page_size=page_size):
+                pages = self.pages(page_size)
+                self.assertEqual(sum(pages, []), self.ordered)
+                self.assertTrue(all(len(page) <= page_size for page in pages))
+
+    def test_cursor_round_trip(self):
+        note = self.ordered[5]
+        self.assertEqual(
+            decode_cursor(encode_cursor(note)),
+            (note.directory_id, note.index, note.title, note.id),
+        )
+
+    def test_pages_stay_stable_when_notes_are_added_before_the_cursor(self):
+        first, cursor = paginate_notes(Note.objects.filter(user=self.user), None, 6)
+        Note.objects.create(user=self.user, title="0 early", index=0)
+        rest, _ = paginate_notes(Note.objects.filter(user=self.user), cursor, 100)
+        self.assertEqual(first + rest, self.ordered)
+
+    def test_api_follows_the_cursor(self):
+        response = self.client.get(self.url, {"directory": "all"})
+        self.assertIsNone(response.json()["result"]["next_cursor"])
+        with mock.patch(
+            "notes.views.paginate_notes", functools.partial(paginate_notes, page_size=5)
+        ):
+            ids, after = [], None
+            while True:
+                query = {"directory": "all", **({"after": after} if after else {})}
+                result = self.client.get(self.url, query).json()["result"]
+                ids += [note["note_id"] for note in result["notes"]]
+                after = result["next_cursor"]
+                if after is None:
+                    break
+        self.assertEqual(ids, [note.id for note in self.ordered])
+
+    def test_tampered_and_garbled_cursors_are_bad_requests(self):
+        cursor = encode_cursor(self.ordered[0])
+        tampered = signing.dumps([None, 0, "a loose 0", 10**9], salt="other")
+        for after in (cursor[:-2] + "xx", "garbled", tampered):
+            for url in (self.url, reverse("notes:note_list_page")):
+                with self.subTest(after=after, url=url):
+                    response = self.client.get(url, {"after": after})
+                    self.assertEqual(response.status_code, 400)
+
+
+class StreamingNoteTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("reader", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.content = '"é"\n' * (STREAMING_THRESHOLD // 3)
+        self.note = Note.objects.create(
+            user=self.user, title="Large", content=self.content
+        )
+        self.url = reverse("notes_api:note_detail", args=[self.note.pk])
+
+    def test_plain_json(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(
+            data,
+            {
+                "status": "ok",
+                "result": {
+                    "note_content": self.content,
+                    "note_title": "Large",
+                    "note_type": "PLAINTEXT",
+                },
+            },
+        )
+
+    def test_compact_json(self):
+        response = self.client.get(self.url, HTTP_ACCEPT=COMPACT_JSON_CONTENT_TYPE)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], COMPACT_JSON_CONTENT_TYPE)
+        self.assertIn("Accept", response["Vary"])
+        body = b"".join(response.streaming_content)
+        self.assertTrue(body.startswith(b'{"s":"ok","r":{"c":"\\"\xc3\xa9'))
+        self.assertEqual(
+            json.loads(body),
+            {"s": "ok", "r": {"c": self.content, "t": "Large", "y": "PLAINTEXT"}},
+        )
+
+    def test_range_across_chunks(self):
+        start, end = CHUNK_SIZE - 3, CHUNK_SIZE + 6
+        response = self.client.get(
+            reverse("notes_api:note_content", args=[self.note.pk]),
+            HTTP_RANGE=f"bytes={start}-{end}",
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            b"".join(response.streaming_content),
+            self.content.encode()[start : end + 1],
+        )
+
+    def test_memory_does_not_grow_with_the_note(self):
+        self.note.content = "é" * (4 * 1024 * 1024)
+        self.note.save()
+        response = self.client.get(self.url)
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # A chunk is held as bytes, text and escaped JSON at once; the body
+        # itself is 24 MB of \u00e9 escapes
+        self.assertGreater(size, 64 * CHUNK_SIZE)
+        self.assertLess(peak, 16 * CHUNK_SIZE)
+
+    def test_saving_mid_stream_aborts(self):
+        response = self.client.get(self.url)
+        chunks = iter(response.streaming_content)
+        next(chunks)
+        next(chunks)
+        Note.objects.get(pk=self.note.pk).save()
+        with self.assertRaises(NoteChanged):
+            list(chunks)
+
+    def test_deleting_mid_stream_aborts(self):
+        response = self.client.get(self.url)
+        chunks = iter(response.streaming_content)
+        next(chunks)
+        Note.objects.filter(pk=self.note.pk).delete()
+        with self.assertRaises(NoteChanged):
+            list(chunks)
+
+
+class NoteTagsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("tagger", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+        self.note = Note.objects.create(user=self.user, title="Tagged", content="")
+        self.url = reverse("notes_api:note_tags", args=[self.note.pk])
+
+    def post_tags(self, tags):
+        return self.client.post(
+            self.url, json.dumps({"tags": tags}), content_type="application/json"
+        )
+
+    def test_replaces_tags(self):
+        response = self.post_tags(["Work", " urgent  now", "work"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["result"]["tags"], ["urgent now", "work"])
+
+    def test_rejects_invalid_tags(self):
+        for tags in (
+            "work",
+            {"work": 1},
+            ["work", 3],
+            [["work"]],
+            ["x" * 101],
+            [f"tag{number}" for number in range(101)],
+        ):
+            with self.subTest(tags=str(tags)[:40]):
+                response = self.post_tags(tags)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["status"], "error")
+        self.assertFalse(self.note.tags.exists())
+
+    def tag(self, title, names, user=None):
+        note = Note.objects.create(user=user or self.user, title=title, content="")
+        set_note_tags(note, names)
+        return note
+
+    def test_search_keeps_id_order_and_counts_facets(self):
+        tags.clear_index_cache()
+        self.addCleanup(tags.clear_index_cache)
+        notes = [self.tag(f"Note {number}", ["work"]) for number in range(5)]
+        set_note_tags(notes[1], ["work", "archived"])
+        set_note_tags(notes[3], ["work", "urgent"])
+
+        response = self.client.get(
+            reverse("notes_api:note_tags_search"), {"q": "work NOT archived"}
+        )
+        result = response.json()["result"]
+        self.assertEqual(
+            [note["note_id"] for note in result["notes"]],
+            [notes[number].pk for number in (0, 2, 3, 4)],
+        )
+        self.assertEqual(result["total"], 4)
+        self.assertEqual(result["facets"], {"work": 4, "urgent": 1})
+
+        found, total, _ = tags.search_by_tags(self.user, "work", limit=2)
+        self.assertEqual([note.pk for note in found], [notes[0].pk, notes[1].pk])
+        self.assertEqual(total, 5)
+
+    def test_index_cache_is_bounded_by_bytes(self):
+        tags.clear_index_cache()
+        self.addCleanup(tags.clear_index_cache)
+        self.tag("Small", ["a"])
+        other = User.objects.create_user("other tagger", password="x")
+        with use_shard(shard_for_user(other.pk)):
+            for number in range(20):
+                self.tag(f"Large {number}", [f"tag{number}", "b"], user=other)
+            large = tags.get_tag_index(other)
+        small = tags.get_tag_index(self.user)
+        self.assertLess(small.nbytes, large.nbytes)
+
+        # Room for the large index alone: caching the small one evicts it
+        with mock.patch.object(tags, "INDEX_CACHE_BYTES", large.nbytes):
+            tags.clear_index_cache()
+            with use_shard(shard_for_user(other.pk)):
+                self.assertIs(tags.get_tag_index(other), tags.get_tag_index(other))
+            tags.get_tag_index(self.user)
+            self.assertEqual(list(tags._index_cache), [self.user.pk])
+            self.assertEqual(tags._index_cache_bytes, small.nbytes)
+
+        # An index over the budget is served but not kept
+        with mock.patch.object(tags, "INDEX_CACHE_BYTES", small.nbytes - 1):
+            tags.clear_index_cache()
+            self.assertIsNot(
+                tags.get_tag_index(self.user), tags.get_tag_index(self.user)
+            )
+            self.assertEqual(tags._index_cache_bytes, 0)
+
+
+@RENDER_PAGES
+class DirectoryListTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("filer", password="x")
+        self.alias = self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+
+    def directory_notes(self):
+        response = self.client.get(reverse("notes:directory_list"))
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            body = b"".join(response.streaming_content).decode()
+        blocks = re.findall(
+            r'content__directory-title">(.*?)</span>(.*?)</ul>', body, flags=re.DOTALL
+        )
+        notes = [
+            (title, re.findall(r"data-note-id=\"\d+\">\s*(.*?)\s*<", items))
+            for title, items in blocks
+        ]
+        return notes, len(queries)
+
+    def test_notes_are_grouped_by_directory_in_one_query(self):
+        # Siblings are ordered by index, then title
+        work = Directory.objects.create(user=self.user, title="Work", index=0)
+        home = Directory.objects.create(user=self.user, title="Home", index=1)
+        Directory.objects.create(user=self.user, title="Empty", parent=work)
+        Directory.objects.create(user=self.user, title="Archive", parent=work)
+        for title, directory in (
+            ("b", work),
+            ("a", work),
+            ("loose", None),
+            ("chores", home),
+        ):
+            Note.objects.create(user=self.user, title=title, directory=directory)
+
+        notes, query_count = self.directory_notes()
+        self.assertEqual(
+            notes,
+            [
+                ("Not specified", ["loose"]),
+                ("Work", ["a", "b"]),
+                ("Work / Archive", []),
+                ("Work / Empty", []),
+                ("Home", ["chores"]),
+            ],
+        )
+        self.assertEqual(query_count, 1)
+
+    def test_unassigned_notes_are_shown_despite_a_stale_counter(self):
+        Note.objects.create(user=self.user, title="loose")
+        UnassignedNotes.objects.filter(user=self.user).update(note_count=0)
+        notes, _ = self.directory_notes()
+        self.assertEqual(notes, [("Not specified", ["loose"])])
+
+    def test_no_unassigned_block_without_unassigned_notes(self):
+        home = Directory.objects.create(user=self.user, title="Home")
+        Note.objects.create(user=self.user, title="chores", directory=home)
+        notes, _ = self.directory_notes()
+        self.assertEqual(notes, [("Home", ["chores"])])
+
+
+class DirectoryClosureTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("nester", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        # Counter rows exist before anything is measured
+        Note.objects.create(user=self.user, title="Loose")
+
+    def chain(self, depth, prefix="Level"):
+        directories, parent = [], None
+        for level in range(depth):
+            parent = Directory.objects.create(
+                user=self.user, title=f"{prefix} {level}", parent=parent
+            )
+            directories.append(parent)
+        return directories
+
+    def links(self):
+        return {
+            (link.ancestor.title, link.descendant.title, link.depth)
+            for link in DirectoryClosure.objects.select_related(
+                "ancestor", "descendant"
+            )
+        }
+
+    def count_queries(self, operation):
+        with contextlib.ExitStack() as stack:
+            queries = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in {"default", *note_databases()}
+            ]
+            operation()
+        return sum(len(captured) for captured in queries)
+
+    def test_insert_links_every_ancestor(self):
+        self.chain(3, "A")
+        self.assertEqual(
+            self.links(),
+            {
+                ("A 0", "A 0", 0),
+                ("A 1", "A 1", 0),
+                ("A 2", "A 2", 0),
+                ("A 0", "A 1", 1),
+                ("A 1", "A 2", 1),
+                ("A 0", "A 2", 2),
+            },
+        )
+
+    def test_move_relinks_the_subtree(self):
+        a0, a1, a2 = self.chain(3, "A")
+        (b0,) = self.chain(1, "B")
+        a1.move_to(b0)
+        self.assertEqual(
+            self.links(),
+            {
+                ("A 0", "A 0", 0),
+                ("A 1", "A 1", 0),
+                ("A 2", "A 2", 0),
+                ("B 0", "B 0", 0),
+                ("B 0", "A 1", 1),
+                ("A 1", "A 2", 1),
+                ("B 0", "A 2", 2),
+            },
+        )
+        self.assertEqual(
+            [directory.title for directory in a2.get_ancestors()], ["B 0", "A 1"]
+        )
+        a1.move_to(None)
+        self.assertEqual(list(b0.get_descendants()), [])
+
+    def test_move_into_own_subtree_is_refused(self):
+        a0, a1, a2 = self.chain(3, "A")
+        links = self.links()
+        for target in (a0, a2):
+            with self.subTest(target=target.title):
+                with self.assertRaises(ValueError):
+                    a0.move_to(target)
+                a0.refresh_from_db()
+        self.assertIsNone(a0.parent_id)
+        self.assertEqual(self.links(), links)
+
+    def test_delete_removes_the_subtree(self):
+        a0, a1, a2 = self.chain(3, "A")
+        (b0,) = self.chain(1, "B")
+        Note.objects.create(user=self.user, title="Deep", directory=a2)
+        a1.delete()
+        self.assertEqual(
+            set(Directory.objects.values_list("title", flat=True)), {"A 0", "B 0"}
+        )
+        self.assertEqual(self.links(), {("A 0", "A 0", 0), ("B 0", "B 0", 0)})
+        self.assertIsNone(Note.objects.get(title="Deep").directory_id)
+
+    def test_query_counts_do_not_depend_on_depth(self):
+        counts = {}
+        for depth in (2, 8):
+            directories = self.chain(depth, f"Depth {depth}")
+            for directory in directories:
+                Note.objects.create(
+                    user=self.user, title=directory.title, directory=directory
+                )
+            (other,) = self.chain(1, f"Other {depth}")
+            counts[depth] = (
+                self.count_queries(
+                    lambda: Directory.objects.create(
+                        user=self.user, title=f"Leaf {depth}", parent=directories[-1]
+                    )
+                ),
+                self.count_queries(lambda: directories[0].move_to(other)),
+                self.count_queries(lambda: other.delete()),
+            )
+        self.assertEqual(counts[2], counts[8])
+
+
+class NoteCountersTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("counter", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.work = Directory.objects.create(user=self.user, title="Work")
+        self.home = Directory.objects.create(user=self.user, title="Home")
+
+    def counters(self):
+        counters = {
+            directory.pk: (directory.note_count, directory.note_bytes)
+            for directory in Directory.objects.filter(user=self.user)
+        }
+        unassigned = UnassignedNotes.objects.filter(user=self.user).first()
+        counters[None] = (
+            (unassigned.note_count, unassigned.note_bytes) if unassigned else (0, 0)
+        )
+        return counters
+
+    def assertCounters(self, work, home, unassigned):
+        self.assertEqual(
+            self.counters(),
+            {self.work.pk: work, self.home.pk: home, None: unassigned},
+        )
+
+    def test_create_resize_and_delete(self):
+        note = Note.objects.create(user=self.user, title="a", directory=self.work)
+        Note.objects.create(user=self.user, title="b", content="xyz")
+        self.assertCounters(work=(1, 0), home=(0, 0), unassigned=(1, 3))
+        note.content = "é" * 5
+        note.save(update_fields=["content", "modified"])
+        self.assertCounters(work=(1, 10), home=(0, 0), unassigned=(1, 3))
+        note.delete()
+        self.assertCounters(work=(0, 0), home=(0, 0), unassigned=(1, 3))
+
+    def test_move(self):
+        note = Note.objects.create(
+            user=self.user, title="a", content="abcd", directory=self.work
+        )
+        note.directory = self.home
+        note.save()
+        self.assertCounters(work=(0, 0), home=(1, 4), unassigned=(0, 0))
+        note.directory = None
+        note.save()
+        self.assertCounters(work=(0, 0), home=(0, 0), unassigned=(1, 4))
+
+    def test_stale_instances(self):
+        Note.objects.create(
+            user=self.user, title="a", content="abcd", directory=self.work
+        )
+        first, second = Note.objects.get(title="a"), Note.objects.get(title="a")
+        first.directory = self.home
+        first.save()
+        second.directory = None
+        second.content = "ab"
+        second.save()
+        self.assertCounters(work=(0, 0), home=(0, 0), unassigned=(1, 2))
+        first.delete()
+        second.delete()
+        self.assertCounters(work=(0, 0), home=(0, 0), unassigned=(0, 0))
+
+    def test_directory_delete_unassigns_its_subtree(self):
+        child = Directory.objects.create(
+            user=self.user, title="Child", parent=self.work
+        )
+        Note.objects.create(
+            user=self.user, title="a", content="ab", directory=self.work
+        )
+        Note.objects.create(user=self.user, title="b", content="c", directory=child)
+        Note.objects.create(user=self.user, title="c", content="d", directory=self.home)
+        self.work.delete()
+        self.assertEqual(self.counters(), {self.home.pk: (1, 1), None: (2, 3)})
+        self.assertEqual(Note.objects.filter(user=self.user, directory=None).count(), 2)
+
+    def test_autosave_locks_only_when_counters_change(self):
+        Note.objects.create(user=self.user, title="a", content="abcd")
+        note = Note.objects.defer("content").get(title="a")
+        with mock.patch("notes.signals.read_locked", wraps=read_locked) as locked:
+            note.content = "dcba"
+            note.save(update_fields=["content", "modified"])
+            self.assertEqual(locked.call_count, 0)
+            note.content = "abcdef"
+            note.save(update_fields=["content", "modified"])
+            self.assertEqual(locked.call_count, 1)
+        self.assertCounters(work=(0, 0), home=(0, 0), unassigned=(1, 6))
+
+    def test_admin_bulk_delete_unassigns_the_subtrees(self):
+        child = Directory.objects.create(
+            user=self.user, title="Child", parent=self.work
+        )
+        Note.objects.create(user=self.user, title="a", content="ab", directory=child)
+        Note.objects.create(user=self.user, title="b", content="c", directory=self.home)
+        DirectoryAdmin(Directory, admin.site).delete_queryset(
+            None, Directory.objects.filter(pk__in=[self.work.pk, self.home.pk])
+        )
+        self.assertEqual(self.counters(), {None: (2, 3)})
+
+
+class AdmissionTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("admitted", password="x")
+        self.client.force_login(self.user)
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.note = Note.objects.create(user=self.user, title="Note", content="x")
+        admission._cache().clear()
+        self.addCleanup(admission._cache().clear)
+        # Buckets refill from this clock only
+        self.now = 1_000_000.0
+        self.enterContext(
+            mock.patch.object(admission, "time", mock.Mock(time=lambda: self.now))
+        )
+
+    def test_bucket_refills_at_its_rate_up_to_the_burst(self):
+        for _ in range(3):
+            self.assertEqual(admission.take_token("bucket", rate=2, burst=3), 0)
+        self.assertEqual(admission.take_token("bucket", rate=2, burst=3), 0.5)
+        self.now += 0.25
+        self.assertEqual(admission.take_token("bucket", rate=2, burst=3), 0.25)
+        self.now += 0.25
+        self.assertEqual(admission.take_token("bucket", rate=2, burst=3), 0)
+
+        # A long pause refills no more than the burst
+        self.now += 100
+        for _ in range(3):
+            self.assertEqual(admission.take_token("bucket", rate=2, burst=3), 0)
+        self.assertGreater(admission.take_token("bucket", rate=2, burst=3), 0)
+
+    def get_note(self):
+        return self.client.get(reverse("notes_api:note_detail", args=[self.note.pk]))
+
+    def save_note(self):
+        return self.client.post(
+            reverse("notes_api:note_detail", args=[self.note.pk]),
+            json.dumps({"content": "saved"}),
+            content_type="application/json",
+        )
+
+    def test_user_over_the_rate_gets_429_with_retry_after(self):
+        self.enterContext(mock.patch.object(admission, "USER_BURST", 2))
+        self.enterContext(mock.patch.object(admission, "USER_RATE", 0.25))
+        self.assertEqual(self.get_note().status_code, 200)
+        self.assertEqual(self.save_note().status_code, 200)
+
+        response = self.get_note()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "4")
+        self.assertEqual(response.json()["status"], "error")
+
+        # Rounded up, never 0
+        self.now += 3.5
+        self.assertEqual(self.get_note()["Retry-After"], "1")
+        self.now += 0.5
+        self.assertEqual(self.get_note().status_code, 200)
+
+    def test_note_write_rate(self):
+        self.enterContext(mock.patch.object(admission, "NOTE_WRITE_BURST", 1))
+        self.enterContext(mock.patch.object(admission, "NOTE_WRITE_RATE", 0.5))
+        self.assertEqual(self.save_note().status_code, 200)
+        response = self.save_note()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "2")
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.content, "saved")
+
+        # Reads of the note are not limited by its write bucket
+        self.assertEqual(self.get_note().status_code, 200)
+        self.now += 2
+        self.assertEqual(self.save_note().status_code, 200)
+
+    def test_writes_in_flight(self):
+        self.enterContext(mock.patch.object(admission, "MAX_WRITES_IN_FLIGHT", 1))
+        slot = admission.WriteSlot(self.user.pk)
+        self.assertTrue(slot.acquire())
+        response = self.save_note()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+        slot.release()
+        self.assertEqual(self.save_note().status_code, 200)
+
+
+@RENDER_PAGES
+class NoteLinkTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("linker", password="x")
+        self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.client.force_login(self.user)
+
+    def links(self, note):
+        response = self.client.get(reverse("notes_api:note_links", args=[note.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()["result"]
+
+    def test_parse_links(self):
+        titles, ids = parse_links(
+            "[[ My  TITLE ]], [[Other|a label]], [[]], [[broken\nlink]], "
+            "/notes/5/edit, /notes/?directory=1&note=7, /directories/8/"
+        )
+        self.assertEqual(titles, {"my title", "other"})
+        self.assertEqual(ids, {5, 7})
+
+    def test_title_links_resolve_once_the_note_exists(self):
+        target = Note.objects.create(user=self.user, title="Target", content="")
+        source = Note.objects.create(
+            user=self.user,
+            title="Source",
+            # Notes that do not exist are not link targets
+            content=f"[[Later]] [[target]] /notes/{target.pk}/ /notes/999999/",
+        )
+        self.assertCountEqual(
+            [
+                (link["target_id"], link["target_title"])
+                for link in self.links(source)["outgoing"]
+            ],
+            [(None, "later"), (target.pk, "Target"), (target.pk, "Target")],
+        )
+
+        later = Note.objects.create(user=self.user, title="Later", content="")
+        self.assertIn(
+            (later.pk, "Later"),
+            [
+                (link["target_id"], link["target_title"])
+                for link in self.links(source)["outgoing"]
+            ],
+        )
+        self.assertEqual(
+            self.links(later)["backlinks"],
+            [{"note_id": source.pk, "note_title": "Source"}],
+        )
+        # Two links from one note are one backlink
+        self.assertEqual(
+            self.links(target)["backlinks"],
+            [{"note_id": source.pk, "note_title": "Source"}],
+        )
+
+    def test_editing_content_updates_the_links(self):
+        first = Note.objects.create(user=self.user, title="First", content="")
+        second = Note.objects.create(user=self.user, title="Second", content="")
+        note = Note.objects.create(user=self.user, title="Note", content="[[First]]")
+        note.content = f"[[Second]] [[Note]] /notes/{note.pk}/"
+        note.save()
+        self.assertEqual(self.links(first)["backlinks"], [])
+        self.assertEqual(
+            self.links(second)["backlinks"],
+            [{"note_id": note.pk, "note_title": "Note"}],
+        )
+        # A note's links to itself are title links only, never URL ones
+        self.assertEqual(
+            list(
+                note.outgoing_links.order_by("target_title").values_list(
+                    "target_title", "target_id"
+                )
+            ),
+            [("note", note.pk), ("second", second.pk)],
+        )
+
+    def rename(self, note, title, rewrite_links):
+        data = {"action": "rename_note", "note_id": note.pk, "new_title": title}
+        if rewrite_links:
+            data["rewrite_links"] = "on"
+        self.assertEqual(
+            self.client.post(reverse("notes:note_list"), data).status_code, 200
+        )
+
+    def test_rename_leaves_title_links_dangling(self):
+        target = Note.objects.create(user=self.user, title="Old", content="")
+        source = Note.objects.create(user=self.user, title="Source", content="[[old]]")
+        self.rename(target, "New", rewrite_links=False)
+
+        source.refresh_from_db()
+        self.assertEqual(source.content, "[[old]]")
+        self.assertEqual(
+            self.links(source)["outgoing"], [{"target_id": None, "target_title": "old"}]
+        )
+        self.assertEqual(self.links(target)["backlinks"], [])
+
+        # A note taking the old title picks the links up
+        newcomer = Note.objects.create(user=self.user, title="OLD", content="")
+        self.assertEqual(
+            self.links(newcomer)["backlinks"],
+            [{"note_id": source.pk, "note_title": "Source"}],
+        )
+
+    def test_rename_rewrites_title_links(self):
+        target = Note.objects.create(user=self.user, title="Old", content="")
+        source = Note.objects.create(
+            user=self.user,
+            title="Source",
+            content="See [[ old ]] and [[Old|the label]], not [[Older]].",
+        )
+        self.rename(target, "New name", rewrite_links=True)
+
+        source.refresh_from_db()
+        self.assertEqual(
+            source.content,
+            "See [[New name]] and [[New name|the label]], not [[Older]].",
+        )
+        self.assertEqual(
+            self.links(target)["backlinks"],
+            [{"note_id": source.pk, "note_title": "Source"}],
+        )
+        self.assertFalse(
+            NoteLink.objects.filter(source=source, target_title="old").exists()
+        )
+
+    def test_links_of_other_users_notes_are_not_found(self):
+        note = Note.objects.create(user=self.user, title="Mine", content="")
+        self.client.force_login(User.objects.create_user("other", password="x"))
+        response = self.client.get(reverse("notes_api:note_links", args=[note.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@RENDER_PAGES
+class ShardedAdminTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", password="x")
+        self.client.force_login(self.admin)
+        self.changelists = [
+            reverse(f"admin:{name}_changelist")
+            for name in (
+                "notes_note",
+                "notes_directory",
+                "attachments_blob",
+                "attachments_noteattachment",
+            )
+        ]
+
+    def test_sharded_models_are_hidden_while_sharding_is_on(self):
+        with mock.patch("notes.sharding.sharding_enabled", return_value=True):
+            for url in self.changelists:
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 403)
+            index = self.client.get(reverse("admin:index"))
+        for url in self.changelists:
+            self.assertNotContains(index, url)
+        self.assertContains(index, reverse("admin:backgroundjobs_job_changelist"))
+
+    def test_sharded_models_are_shown_without_sharding(self):
+        with mock.patch("notes.sharding.sharding_enabled", return_value=False):
+            index = self.client.get(reverse("admin:index"))
+            for url in self.changelists:
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                    self.assertContains(index, url)
+
+
+class NormalizedTitleBackfillTests(SimpleTestCase):
+    migration = importlib.import_module("notes.migrations.0009_note_normalized_title")
+
+    def test_duplicates_get_a_suffix_within_the_length_limit(self):
+        taken = set()
+        long_title = "x" * Note._meta.get_field("title").max_length
+        self.assertEqual(
+            self.migration.unique_title("My  Note", 1, taken), ("My  Note", "my note")
+        )
+        self.assertEqual(
+            self.migration.unique_title("my note", 1, taken), ("my note-2", "my note-2")
+        )
+        self.assertEqual(
+            self.migration.unique_title("MY NOTE", 1, taken)[0], "MY NOTE-3"
+        )
+        # Another user's titles do not clash
+        self.assertEqual(self.migration.unique_title("my note", 2, taken)[0], "my note")
+
+        self.assertEqual(
+            self.migration.unique_title(long_title, 1, taken)[0], long_title
+        )
+        for suffix in range(2, 12):
+            title, _ = self.migration.unique_title(long_title, 1, taken)
+            self.assertEqual(len(title), len(long_title))
+            self.assertTrue(title.endswith(f"x-{suffix}"))
+
+
+class NoteContentStatsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("counter", password="x")
+        self.alias = self.enterContext(use_shard(shard_for_user(self.user.pk)))
+        self.note = Note.objects.create(
+            user=self.user, title="Stats", content="three short words"
+        )
+
+    def assertStats(self, size, word_count, snippet):
+        stored = Note.objects.get(pk=self.note.pk)
+        self.assertEqual(
+            (stored.size, stored.word_count, stored.snippet),
+            (size, word_count, snippet),
+        )
+
+    def test_saving_content_updates_the_stats(self):
+        self.assertStats(17, 3, "three short words")
+        note = Note.objects.defer("content").get(pk=self.note.pk)
+        note.content = "  é  two "
+        note.save(update_fields=["content", "modified"])
+        self.assertStats(10, 2, "é two")
+
+    def saved_queries(self, note, **kwargs):
+        with CaptureQueriesContext(connections[self.alias]) as queries:
+            note.save(**kwargs)
+        return [query["sql"] for query in queries]
+
+    def test_deferred_content_is_not_loaded(self):
+        note = Note.objects.defer("content").get(pk=self.note.pk)
+        note.title = "Renamed"
+        for kwargs in ({"update_fields": ["title", "modified"]}, {}):
+            with self.subTest(**kwargs):
+                queries = self.saved_queries(note, **kwargs)
+                self.assertFalse(
+                    [sql for sql in queries if '"content"' in sql], queries
+                )
+                self.assertNotIn("content", note.__dict__)
+        self.assertEqual(Note.objects.get(pk=self.note.pk).title, "Renamed")
+        self.assertStats(17, 3, "three short words")
+
+    def test_loaded_content_left_out_of_update_fields_keeps_the_stats(self):
+        note = Note.objects.get(pk=self.note.pk)
+        note.content = "unsaved"
+        note.title = "Renamed"
+        queries = self.saved_queries(note, update_fields=["title"])
+        self.assertFalse([sql for sql in queries if '"size"' in sql], queries)
+        self.assertStats(17, 3, "three short words")
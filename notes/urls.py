@@ -7,6 +7,7 @@ app_name = "notes"
 urlpatterns = [
     path("", views.note_list, name="note_list"),
     path("add_note/", views.add_note, name="add_note"),
+    path("page/", views.note_list_page, name="note_list_page"),
     path("<str:id>/rename_note/", views.rename_note, name="rename_note"),
     path("directories/", views.directory_list, name="directory_list"),
     path(
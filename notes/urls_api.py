@@ -5,6 +5,46 @@ from . import views
 app_name = "notes_api"
 
 urlpatterns = [
+    path(
+        "",
+        views.notes_list_ajax,
+        name="note_list",
+    ),
+    path(
+        "calendar/",
+        views.notes_calendar_ajax,
+        name="note_calendar",
+    ),
+    path(
+        "titles/",
+        views.notes_titles_ajax,
+        name="note_titles",
+    ),
+    path(
+        "bulk/",
+        views.notes_bulk_ajax,
+        name="note_bulk",
+    ),
+    path(
+        "tags/",
+        views.notes_tags_search_ajax,
+        name="note_tags_search",
+    ),
+    path(
+        "<str:id>/tags/",
+        views.notes_tags_ajax,
+        name="note_tags",
+    ),
+    path(
+        "<str:id>/links/",
+        views.notes_links_ajax,
+        name="note_links",
+    ),
+    path(
+        "<str:id>/content/",
+        views.notes_content_ajax,
+        name="note_content",
+    ),
     path(
         "<str:id>/",
         views.notes_detail_ajax,
@@ -1,18 +1,48 @@
 # notes/views.py
+import hashlib
+import itertools
 import json
 from urllib.parse import urlencode
 
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
-from django.http import QueryDict
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.http import Http404, QueryDict
 from django.views.decorators.http import require_POST
 from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, router, transaction
+from common.api_json_response import ApiJsonResponse
 from common.form_error_template_response import FormErrorTemplateResponse
-from notes.forms import NoteForm, RenameNoteForm
-from .models import Note, Directory
+from notes.forms import NoteForm, RenameNoteForm, clean_note_title
+from .admission import admission_controlled
+from .calendar import calendar_summary, parse_window
+from .directory_tree import build_directory_tree
+from .large_notes import (
+    MAX_NOTE_SIZE,
+    STREAMING_THRESHOLD,
+    NoteTooLarge,
+    declared_size_exceeds_limit,
+    ranged_content_response,
+    read_body,
+    read_text_body,
+    streaming_note_json_response,
+)
+from .links import rewrite_title_links
+from .models import Note, Directory, UnassignedNotes, normalize_title
+from .pagination import paginate_notes
+from .selection import get_selected_note_id, remember_selected_note
+from .tags import search_by_tags, set_note_tags
 
 LOCAL_NOTE_NAME = "local~note"
+SIDEBAR_TARGET = "#notes-sidebar"
+TITLE_AUTOCOMPLETE_MAX = 50
+# Notes per bulk fetch, and the content bytes inlined in one response
+BULK_FETCH_MAX_IDS = 20
+BULK_FETCH_MAX_BYTES = 1024 * 1024
+# Notes read and rendered at a time while streaming the directories page
+DIRECTORY_PAGE_CHUNK_SIZE = 500
 
 
 @login_required
@@ -20,16 +50,19 @@ def rename_note(request, id):
     note = get_object_or_404(Note, pk=id, user=request.user)
 
     if request.method == "POST":
+        old_normalized_title = note.normalized_title
         form = RenameNoteForm(request.POST, instance=note)
 
         if form.is_valid():
             note = form.save(commit=False)
             note.save()
+            if form.cleaned_data["rewrite_links"]:
+                rewrite_title_links(note, old_normalized_title)
 
             query_dictionary = {}
             if note.directory:
                 query_dictionary["directory"] = note.directory.id
-            selected_note_id = request.session["selected_note_id"]
+            selected_note_id = get_selected_note_id(request)
             if selected_note_id:
                 query_dictionary["note"] = selected_note_id
 
@@ -58,7 +91,7 @@ def add_note(request):
         directory = get_object_or_404(Directory, id=directory_id, user=user)
 
     if request.method == "POST":
-        form = NoteForm(request.POST)
+        form = NoteForm(request.POST, user=user)
         if form.is_valid():
             note = form.save(commit=False)
             note.user = user
@@ -69,7 +102,6 @@ def add_note(request):
                 query_dictionary["directory"] = note.directory.id
             query_dictionary["note"] = note.id
             query_string = urlencode(query_dictionary)
-            request.session["selected_note_id"] = note.id
 
             messages.success(request, "Note has been created successfully.")
             return redirect(f"{reverse('notes:note_list')}?{query_string}")
@@ -77,7 +109,7 @@ def add_note(request):
         return FormErrorTemplateResponse(request, "notes/add_note.html", {"form": form})
 
     else:
-        form = NoteForm(initial={"directory": directory})
+        form = NoteForm(initial={"directory": directory}, user=user)
 
     return render(request, "notes/add_note.html", {"form": form})
 
@@ -93,12 +125,24 @@ def note_list(request):
             note_title = request.POST.get("note_title", "").strip()
             note_type = request.POST.get("note_type", "").strip()
             note_directory_id = request.POST.get("note_directory_id", "").strip()
-            if note_title:
-                Note.objects.create(
-                    title=note_title,
-                    user=user,
-                    directory_id=note_directory_id,
-                    note_type=note_type,
+            directory = None
+            if note_directory_id:
+                if not note_directory_id.isdigit():
+                    raise Http404("No Directory matches the given query.")
+                directory = get_object_or_404(
+                    Directory, pk=note_directory_id, user=user
+                )  # Ensure user owns directory
+            if note_type and note_type not in Note.NOTE_TYPE_CHOICES:
+                messages.error(request, "Select a valid note type.")
+            elif note_title:
+                _save_note_title(
+                    request,
+                    Note(
+                        user=user,
+                        directory=directory,
+                        type=note_type or "PLAINTEXT",
+                    ),
+                    note_title,
                 )
 
             query_dictionary = QueryDict("", mutable=True)
@@ -115,8 +159,11 @@ def note_list(request):
             new_title = request.POST.get("new_title", "").strip()
             if note_id and new_title:
                 note = get_object_or_404(Note, pk=note_id, user=user)
-                note.title = new_title
-                note.save()
+                old_normalized_title = note.normalized_title
+                if _save_note_title(request, note, new_title) and request.POST.get(
+                    "rewrite_links"
+                ):
+                    rewrite_title_links(note, old_normalized_title)
 
         elif action == "delete_note":
             note_id = request.POST.get("note_id")
@@ -125,46 +172,61 @@ def note_list(request):
                 note.delete()
             return redirect("notes:note_list")
 
-    directory_id = request.GET.get("directory")
-
-    note_filter_options = None
-    if directory_id == "all":
-        note_filter_options = "all"
-    elif directory_id == "":
-        note_filter_options = "not-assigned"
-
-    directory_id = (
-        int(directory_id) if directory_id and directory_id.isdigit() else None
+    # Unpoly polls ask for the sidebar alone; unless the user's notes changed
+    # since the polled copy was rendered, answer before any notes query
+    etag = _note_list_etag(request)
+    sidebar_only = request.headers.get("X-Up-Target") == SIDEBAR_TARGET
+    if sidebar_only:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
+    notes, directory_id, note_filter_options = _filter_notes_by_directory(
+        user, request.GET.get("directory")
     )
 
-    directories = Directory.objects.filter(user=user).order_by("index", "title")
+    directories = build_directory_tree(
+        Directory.objects.filter(user=user).order_by("index", "title")
+    )
 
-    selected_note_id = request.GET.get("note")
-    if selected_note_id:
-        request.session["selected_note_id"] = selected_note_id
-    else:
-        selected_note_id = request.session.get("selected_note_id")
-        if selected_note_id and selected_note_id != LOCAL_NOTE_NAME:
-            if not Note.objects.filter(pk=selected_note_id).exists():
-                request.session.pop("selected_note_id", None)
-    if note_filter_options == "all":
-        notes = Note.objects.filter(user=user).order_by("directory", "index", "title")
-        directory_id = "all"
-    else:
-        notes = Note.objects.filter(user=user, directory_id=directory_id).order_by(
-            "directory", "index", "title"
-        )
+    requested_note_id = request.GET.get("note")
+    selected_note_id = requested_note_id or get_selected_note_id(request)
+    notes, next_cursor = paginate_notes(notes)
 
     selected_note = None
-    if selected_note_id and (selected_note_id != LOCAL_NOTE_NAME):
-        selected_note = get_object_or_404(Note, pk=selected_note_id, user=user)
-    elif selected_note_id == LOCAL_NOTE_NAME:
+    if selected_note_id == LOCAL_NOTE_NAME:
         selected_note = {"title": LOCAL_NOTE_NAME, "content": ""}
+    elif selected_note_id and not sidebar_only:
+        # The sidebar only needs the selected id, not the note
+        selected_note = (
+            Note.objects.filter(pk=selected_note_id, user=user)
+            .only("id", "title")
+            .first()
+            if selected_note_id.isdigit()
+            else None
+        )
+        if selected_note is None:
+            if requested_note_id:
+                raise Http404("No Note matches the given query.")
+            # The remembered note is gone
+            selected_note_id = None
+    # Counts come from the counter columns, not from aggregating notes
+    unassigned_count = (
+        UnassignedNotes.objects.filter(user=user)
+        .values_list("note_count", flat=True)
+        .first()
+        or 0
+    )
+    total_count = unassigned_count + sum(d.note_count for d in directories)
     prepared_directories_list = [
-        ("-- Not Assigned --", ""),
-        ("-- All Notes --", "all"),
+        (f"-- Not Assigned -- ({unassigned_count})", ""),
+        (f"-- All Notes -- ({total_count})", "all"),
     ]
-    prepared_directories_list.extend(list(directories.values_list("title", "id")))
+    prepared_directories_list.extend(
+        (f"{directory.path_title} ({directory.note_count})", directory.id)
+        for directory in directories
+    )
     directories_json = json.dumps(prepared_directories_list)
 
     context = {
@@ -173,38 +235,304 @@ def note_list(request):
         "note_filter_options": note_filter_options,
         "selected_directory": directory_id,
         "notes": notes,
+        "next_cursor": next_cursor,
+        "next_page_number": 2,
         "selected_note": selected_note,
         "selected_note_compatible_id": selected_note_id,
     }
-    return render(request, "notes/note_list.html", context)
+    if sidebar_only:
+        response = render(request, "notes/note_list_sidebar.html", context)
+    else:
+        response = render(request, "notes/note_list.html", context)
+    response["ETag"] = etag
+    patch_vary_headers(response, ["X-Up-Target"])
+    if not sidebar_only:
+        remember_selected_note(request, response, selected_note_id)
+    return response
+
+
+def _save_note_title(request, note, title):
+    """
+    Save `note` under `title` after the same checks as the note forms; a
+    rejected title becomes an error message. Returns whether it was saved.
+    """
+    try:
+        clean_note_title(title, request.user, note)
+        note.title = title
+        with transaction.atomic(using=router.db_for_write(Note, instance=note)):
+            note.save()
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+        return False
+    except IntegrityError:
+        # Another request may have taken the title since it was checked;
+        # any other constraint failure is a bug, not a user error
+        title_taken = (
+            Note.objects.filter(
+                user=request.user, normalized_title=normalize_title(title)
+            )
+            .exclude(pk=note.pk)
+            .exists()
+        )
+        if not title_taken:
+            raise
+        messages.error(request, "Note title must be unique.")
+        return False
+    return True
+
+
+def _note_list_etag(request):
+    """
+    Identify the notes list as rendered for this URL and selected note: it
+    changes with the user's notes_modified stamp, which is on the already
+    loaded user row.
+    """
+    state = f"{request.GET.urlencode()}|{get_selected_note_id(request)}"
+    query = hashlib.md5(state.encode()).hexdigest()[:12]
+    return f'"{request.user.notes_modified.timestamp()}-{query}"'
+
+
+def note_list_page(request):
+    """
+    Render one keyset page of sidebar note titles; used by the sidebar's
+    infinite scroll.
+    """
+    notes, directory_id, _ = _filter_notes_by_directory(
+        request.user, request.GET.get("directory")
+    )
+    try:
+        notes, next_cursor = paginate_notes(notes, after=request.GET.get("after"))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    page_number = request.GET.get("page", "")
+    page_number = int(page_number) if page_number.isdigit() else 2
+    context = {
+        "notes": notes,
+        "next_cursor": next_cursor,
+        "page_number": page_number,
+        "next_page_number": page_number + 1,
+        "selected_directory": directory_id,
+        "selected_note_compatible_id": request.GET.get("note"),
+    }
+    return render(request, "notes/note_titles_page.html", context)
+
+
+def notes_list_ajax(request):
+    """
+    AJAX endpoint listing the user's notes (without content), one keyset page
+    at a time.
+    """
+    notes, _, _ = _filter_notes_by_directory(request.user, request.GET.get("directory"))
+    try:
+        notes, next_cursor = paginate_notes(notes, after=request.GET.get("after"))
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    return ApiJsonResponse(
+        request,
+        {
+            "status": "ok",
+            "result": {
+                "notes": [
+                    {
+                        "note_id": note.id,
+                        "note_title": note.title,
+                        "note_type": note.type,
+                        "directory_id": note.directory_id,
+                        "snippet": note.snippet,
+                        "size": note.size,
+                        "word_count": note.word_count,
+                    }
+                    for note in notes
+                ],
+                "next_cursor": next_cursor,
+            },
+        },
+    )
+
+
+def notes_calendar_ajax(request):
+    """
+    AJAX endpoint returning per-day counts (and, for short windows, stubs) of
+    the user's dated notes, for a month/year or explicit start/end window.
+    """
+    try:
+        start, end = parse_window(request.GET)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    return ApiJsonResponse(
+        request, {"status": "ok", "result": calendar_summary(request.user, start, end)}
+    )
+
+
+def notes_tags_search_ajax(request):
+    """
+    AJAX endpoint for boolean tag queries (`q=work AND urgent NOT archived`),
+    returning matching notes and facet counts for the other tags.
+    """
+    try:
+        notes, total, facets = search_by_tags(request.user, request.GET.get("q", ""))
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    return ApiJsonResponse(
+        request,
+        {
+            "status": "ok",
+            "result": {
+                "notes": [
+                    {
+                        "note_id": note.id,
+                        "note_title": note.title,
+                        "note_type": note.type,
+                        "directory_id": note.directory_id,
+                    }
+                    for note in notes
+                ],
+                "total": total,
+                "facets": facets,
+            },
+        },
+    )
+
+
+@admission_controlled
+def notes_tags_ajax(request, id):
+    """
+    AJAX endpoint to read (GET) or replace (POST, `{"tags": [...]}`) a note's
+    tags.
+    """
+    note = get_object_or_404(
+        Note.objects.only("id", "user_id"), pk=id, user=request.user
+    )
+
+    if request.method == "POST":
+        try:
+            tags = json.loads(request.body)["tags"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return JsonResponse(
+                {"status": "error", "message": "Invalid JSON payload."}, status=400
+            )
+        try:
+            set_note_tags(note, tags)
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    elif request.method != "GET":
+        return JsonResponse(
+            {"status": "error", "message": "Only POST and GET allowed"}, status=400
+        )
+
+    return ApiJsonResponse(
+        request,
+        {
+            "status": "ok",
+            "result": {
+                "note_id": note.id,
+                "tags": sorted(note.tags.values_list("name", flat=True)),
+            },
+        },
+    )
+
+
+def notes_titles_ajax(request):
+    """
+    AJAX endpoint for title autocomplete: notes whose normalized title starts
+    with `q`, served as a range scan of the (user, normalized_title) index.
+    """
+    prefix = normalize_title(request.GET.get("q", ""))
+    limit = request.GET.get("limit", "")
+    limit = min(int(limit), TITLE_AUTOCOMPLETE_MAX) if limit.isdigit() else 10
+
+    titles = (
+        Note.objects.filter(
+            user=request.user,
+            normalized_title__gte=prefix,
+            # Upper bound of the prefix range; sorts after any continuation
+            normalized_title__lt=prefix + "\U0010ffff",
+        )
+        .order_by("normalized_title")
+        .values_list("title", "id")[:limit]
+    )
+    return ApiJsonResponse(
+        request, {"status": "ok", "result": {"titles": list(titles)}}
+    )
+
+
+def _filter_notes_by_directory(user, directory_id):
+    """
+    Resolve the `directory` query parameter ("all", a directory id, or
+    empty/missing for unassigned notes) into an unordered Note queryset.
+    """
+    note_filter_options = None
+    if directory_id == "all":
+        note_filter_options = "all"
+    elif directory_id == "":
+        note_filter_options = "not-assigned"
+
+    directory_id = (
+        int(directory_id) if directory_id and directory_id.isdigit() else None
+    )
+
+    if note_filter_options == "all":
+        notes = Note.objects.filter(user=user)
+        directory_id = "all"
+    else:
+        notes = Note.objects.filter(user=user, directory_id=directory_id)
+    return notes, directory_id, note_filter_options
 
 
 # TODO: check csrf safety
+@admission_controlled
 def notes_detail_ajax(request, id):
     """
     AJAX endpoint to update a note's content.
     """
     if request.method == "POST":
-        json_data = json.loads(request.body)
+        # Reject oversize uploads before reading the body
+        if declared_size_exceeds_limit(request):
+            return _note_too_large_response()
+        try:
+            json_data = json.loads(read_body(request))
+        except NoteTooLarge:
+            return _note_too_large_response()
 
         new_content = json_data["content"]
 
-        note = get_object_or_404(Note, pk=id, user=request.user)
+        note = get_object_or_404(
+            Note.objects.defer("content"), pk=id, user=request.user
+        )
         note.content = new_content
-        note.save()
+        note.save(update_fields=["content", "modified"])
         return JsonResponse({"status": "ok", "result": {"note_id": id}})
 
     elif request.method == "GET":
-        note = get_object_or_404(Note, pk=id, user=request.user)
-        return JsonResponse(
+        # Only small notes carry their content in this query; large ones are
+        # streamed from the database in slices
+        note = get_object_or_404(
+            Note.objects.defer("content").annotate(
+                small_content=Case(
+                    When(size__lte=STREAMING_THRESHOLD, then="content"),
+                    default=None,
+                )
+            ),
+            pk=id,
+            user=request.user,
+        )
+        if note.small_content is None:
+            return streaming_note_json_response(request, note)
+        return ApiJsonResponse(
+            request,
             {
                 "status": "ok",
                 "result": {
-                    "note_content": note.content,
+                    "note_content": note.small_content,
                     "note_title": note.title,
                     "note_type": note.type,
                 },
-            }
+            },
         )
 
     return JsonResponse(
@@ -212,6 +540,145 @@ def notes_detail_ajax(request, id):
     )
 
 
+@admission_controlled
+def notes_content_ajax(request, id):
+    """
+    Raw text/plain endpoint for a note's content: GET supports byte ranges,
+    PUT/POST replace the content with the request body.
+    """
+    if request.method in ("PUT", "POST"):
+        if declared_size_exceeds_limit(request):
+            return _note_too_large_response()
+        note = get_object_or_404(
+            Note.objects.defer("content"), pk=id, user=request.user
+        )
+        try:
+            note.content = read_text_body(request)
+        except NoteTooLarge:
+            return _note_too_large_response()
+        except UnicodeDecodeError:
+            return JsonResponse(
+                {"status": "error", "message": "Body is not valid text."}, status=400
+            )
+        note.save(update_fields=["content", "modified"])
+        return JsonResponse({"status": "ok", "result": {"note_id": id}})
+
+    elif request.method in ("GET", "HEAD"):
+        note = get_object_or_404(
+            Note.objects.defer("content"), pk=id, user=request.user
+        )
+        return ranged_content_response(request, note)
+
+    return JsonResponse(
+        {"status": "error", "message": "Only GET, PUT and POST allowed"}, status=405
+    )
+
+
+@admission_controlled
+def notes_bulk_ajax(request):
+    """
+    AJAX endpoint returning several of the user's notes with their content
+    in one query (`?ids=1,2,3`), for warming the client's note cache. Notes
+    past the size budget come without content; ids that are not the user's
+    notes are listed as missing.
+    """
+    try:
+        ids = list(dict.fromkeys(int(part) for part in request.GET["ids"].split(",")))
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {"status": "error", "message": "Pass note ids as ids=1,2,3."}, status=400
+        )
+    if len(ids) > BULK_FETCH_MAX_IDS:
+        return JsonResponse(
+            {
+                "status": "error",
+                "message": f"At most {BULK_FETCH_MAX_IDS} notes per request.",
+            },
+            status=400,
+        )
+
+    notes = {
+        note.id: note
+        for note in Note.objects.filter(pk__in=ids, user=request.user)
+        .only("id", "title", "type", "size", "modified")
+        .annotate(
+            small_content=Case(
+                When(size__lte=STREAMING_THRESHOLD, then="content"),
+                default=None,
+            )
+        )
+    }
+
+    result, budget = [], BULK_FETCH_MAX_BYTES
+    for note_id in ids:
+        note = notes.get(note_id)
+        if note is None:
+            continue
+        content = note.small_content
+        if content is not None and note.size <= budget:
+            budget -= note.size
+        else:
+            content = None
+        result.append(
+            {
+                "note_id": note.id,
+                "note_title": note.title,
+                "note_type": note.type,
+                "note_content": content,
+                "modified": note.modified.isoformat(),
+            }
+        )
+    return ApiJsonResponse(
+        request,
+        {
+            "status": "ok",
+            "result": {
+                "notes": result,
+                "missing": [note_id for note_id in ids if note_id not in notes],
+            },
+        },
+    )
+
+
+def notes_links_ajax(request, id):
+    """
+    AJAX endpoint listing a note's outgoing links and its backlinks.
+    """
+    note = get_object_or_404(
+        Note.objects.only("id", "user_id"), pk=id, user=request.user
+    )
+    outgoing = [
+        {
+            "target_id": link.target_id,
+            "target_title": link.target.title if link.target else link.target_title,
+        }
+        for link in note.outgoing_links.select_related("target").only(
+            "target_title", "target__title"
+        )
+    ]
+    backlinks = [
+        {"note_id": source_id, "note_title": title}
+        for source_id, title in Note.objects.filter(outgoing_links__target=note)
+        .order_by("normalized_title")
+        .values_list("id", "title")
+        .distinct()
+    ]
+    return ApiJsonResponse(
+        request,
+        {"status": "ok", "result": {"outgoing": outgoing, "backlinks": backlinks}},
+    )
+
+
+def _note_too_large_response():
+    return JsonResponse(
+        {
+            "status": "error",
+            "message": f"Note content exceeds the limit of {MAX_NOTE_SIZE} bytes.",
+        },
+        status=413,
+    )
+
+
 @require_POST
 def ajax_update_note_order(request):
     """
@@ -280,7 +747,14 @@ from django.http import (
     JsonResponse,
     QueryDict,
 )
+from django.db.models import Case, IntegerField, Value, When
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import get_template
+
+from common.streaming_template_response import (
+    StreamingTemplateResponse,
+    render_split,
+)
 
 from .models import Directory, Note
 
@@ -297,8 +771,16 @@ def directory_list(request):
         # CREATE directory
         if action == "create":
             dir_title = request.POST.get("directory_title", "").strip()
+            parent_id = request.POST.get("parent_id")
+            parent = None
+            if parent_id:
+                parent = get_object_or_404(
+                    Directory, pk=parent_id, user=user
+                )  # Ensure user owns parent directory
             if dir_title:
-                Directory.objects.create(title=dir_title, user=user)  # Assign to user
+                Directory.objects.create(
+                    title=dir_title, parent=parent, user=user
+                )  # Assign to user
             return redirect("notes:directory_list")
 
         # RENAME directory
@@ -313,7 +795,26 @@ def directory_list(request):
                 directory.save()
             return redirect("notes:directory_list")
 
-        # DELETE directory
+        # MOVE directory (with its subtree)
+        elif action == "move":
+            directory_id = request.POST.get("directory_id")
+            parent_id = request.POST.get("parent_id")
+            if directory_id:
+                directory = get_object_or_404(
+                    Directory, pk=directory_id, user=user
+                )  # Ensure user owns directory
+                parent = None
+                if parent_id:
+                    parent = get_object_or_404(
+                        Directory, pk=parent_id, user=user
+                    )  # Ensure user owns parent directory
+                try:
+                    directory.move_to(parent)
+                except ValueError as e:
+                    return HttpResponseBadRequest(str(e))
+            return redirect("notes:directory_list")
+
+        # DELETE directory (with its subtree)
         elif action == "delete":
             directory_id = request.POST.get("directory_id")
             if directory_id:
@@ -325,32 +826,86 @@ def directory_list(request):
 
         return HttpResponseBadRequest("Invalid action.")
 
-    # Retrieve only the user's directories
-    directories = list(Directory.objects.filter(user=user).order_by("index", "title"))
-
-    # Check if there are any unassigned notes (belonging to the user)
-    notes_without_dir = Note.objects.filter(user=user, directory__isnull=True).order_by(
-        "index", "title"
+    # Retrieve only the user's directories, ordered as a tree
+    directories = build_directory_tree(
+        Directory.objects.filter(user=user).order_by("index", "title")
     )
-    has_unassigned = notes_without_dir.exists()
-
-    # Create "Not specified" directory for unassigned notes
-    if has_unassigned:
-        not_specified_dir = Directory(id=0, title="Not specified")
-        directories.insert(0, not_specified_dir)
 
-    # Build directory list with notes
-    dir_with_notes = []
+    # Sum the directories' note counters up the tree; children come after
+    # their parent in the depth-first order
+    by_id = {d.id: d for d in directories}
     for d in directories:
-        if d.id == 0:
-            dir_with_notes.append((d, notes_without_dir))
-        else:
-            dir_with_notes.append(
-                (d, d.notes.filter(user=user).order_by("index", "title"))
-            )
+        d.subtree_note_count = d.note_count
+    for d in reversed(directories):
+        if d.parent_id in by_id:
+            by_id[d.parent_id].subtree_note_count += d.subtree_note_count
+
+    # The notes are read while the response is sent, after the shard
+    # middleware has returned, so bind them to the database now
+    notes = Note.objects.filter(user=user)
+    notes = notes.using(notes.db)
+
+    # "Not specified" directory for unassigned notes: listed in the sidebar
+    # by the counter row, like the note list's; its block in the content
+    # is rendered whenever the notes query finds unassigned notes
+    not_specified_dir = Directory(id=0, title="Not specified")
+    not_specified_dir.depth = 0
+    not_specified_dir.path_title = not_specified_dir.title
+    not_specified_dir.subtree_note_count = (
+        UnassignedNotes.objects.filter(user=user)
+        .values_list("note_count", flat=True)
+        .first()
+        or 0
+    )
+    sidebar_directories = directories
+    if not_specified_dir.subtree_note_count:
+        sidebar_directories = [not_specified_dir, *directories]
 
     context = {
-        "directories": directories,
-        "directories_with_notes": dir_with_notes,
+        "directories": sidebar_directories,
     }
-    return render(request, "notes/directory_list.html", context)
+    return StreamingTemplateResponse(
+        request,
+        "notes/directory_list.html",
+        context,
+        _directory_contents(not_specified_dir, directories, notes),
+    )
+
+
+def _directory_contents(not_specified_dir, directories, notes):
+    """
+    Yield the markup of each directory and its notes, in tree order after
+    `not_specified_dir` when there are unassigned notes. All notes come from
+    a single query, sorted by their directory's position on the page, and
+    are grouped as they arrive in chunks of DIRECTORY_PAGE_CHUNK_SIZE.
+    """
+    directory_template = get_template("notes/directory_list_directory.html")
+    notes_template = get_template("notes/directory_list_notes.html")
+    # Unassigned notes take position 0, the directories 1 and up
+    positions = [When(directory__isnull=True, then=Value(0))] + [
+        When(directory_id=directory.id, then=Value(position))
+        for position, directory in enumerate(directories, start=1)
+    ]
+    rows = (
+        notes.annotate(
+            position=Case(*positions, default=None, output_field=IntegerField())
+        )
+        .exclude(position=None)
+        .order_by("position", "index", "title", "id")
+        .values("position", "id", "title")
+        .iterator(chunk_size=DIRECTORY_PAGE_CHUNK_SIZE)
+    )
+    groups = itertools.groupby(rows, key=lambda row: row["position"])
+    group = next(groups, None)
+    if group is None or group[0] != 0:
+        not_specified_dir = None
+    for position, directory in enumerate([not_specified_dir, *directories]):
+        if directory is None:
+            continue
+        head, tail = render_split(directory_template, {"directory": directory})
+        yield head
+        if group is not None and group[0] == position:
+            while chunk := list(itertools.islice(group[1], DIRECTORY_PAGE_CHUNK_SIZE)):
+                yield notes_template.render({"notes": chunk})
+            group = next(groups, None)
+        yield tail